@@ -1,21 +1,54 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import json
+import queue
+import atexit
+import threading
 from pathlib import Path
 from database import (
     crear_nueva_conversacion,
     listar_conversaciones_por_usuario,
     obtener_mensajes_por_conversacion,
-    eliminar_conversacion
+    eliminar_conversacion,
+    conversacion_pertenece_a_usuario,
+    obtener_estadisticas_pool,
+    obtener_estadisticas_cache_recomendaciones,
+    cerrar_pool
 )
-from logic import registrar_usuario, verificar_credenciales, procesar_mensaje
+from logic import (
+    registrar_usuario,
+    verificar_credenciales,
+    procesar_mensaje,
+    diagnostico_diferencial,
+    obtener_estadisticas_contexto
+)
+from password_hashing import HashingSaturado, cerrar_pool_hashing
+from auth_tokens import emitir_token, revocar_token, requiere_sesion, iniciar_secreto_sesion
+from migrations import aplicar_migraciones
+from message_journal import detener_diario
+from knowledge_base import iniciar_base_conocimiento
+from gemini_service import obtener_estadisticas_llm
+from config import DB_MIGRAR_AL_INICIAR, CONVERSACIONES_PAGINA_MAX, MENSAJES_PAGINA_MAX, KB_REFRESCO_SEGUNDOS
 
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor"])
+
+# Un secreto aleatorio por proceso solo vale con el servidor de desarrollo (un proceso)
+iniciar_secreto_sesion(permitir_aleatorio=__name__ == "__main__" or app.debug)
+
+atexit.register(cerrar_pool)
+atexit.register(detener_diario)
+atexit.register(cerrar_pool_hashing)
+
+if DB_MIGRAR_AL_INICIAR:
+    aplicar_migraciones()
+
+iniciar_base_conocimiento(KB_REFRESCO_SEGUNDOS)
 
 @app.route("/register", methods=["POST"])
 def register():
@@ -30,19 +63,23 @@ def register():
     if not all([nombre, correo, password]):
         return jsonify({"error": "Missing required fields"}), 400
 
-    success, message = registrar_usuario(nombre, correo, password)
-
-    if success:
-        user_id = verificar_credenciales(correo, password)
-        if user_id:
-            return jsonify({
-                "mensaje": message,
-                "user_id": user_id,
-                "nombre": nombre
-            }), 201
-        return jsonify({"mensaje": message}), 201
-    else:
+    try:
+        estado, message, usuario = registrar_usuario(nombre, correo, password)
+    except HashingSaturado:
+        return jsonify({"error": "Server busy, try again later"}), 503
+
+    if estado == "creado":
+        token, expira_en = emitir_token(usuario["id_usuario"])
+        return jsonify({
+            "mensaje": message,
+            "user_id": usuario["id_usuario"],
+            "nombre": usuario["nombre"],
+            "token": token,
+            "expira_en": expira_en
+        }), 201
+    if estado == "duplicado":
         return jsonify({"error": message}), 409
+    return jsonify({"error": message}), 500
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -56,54 +93,52 @@ def login():
     if not correo or not password:
         return jsonify({"error": "Missing email or password"}), 400
 
-    user_id = verificar_credenciales(correo, password)
-
-    if user_id:
-        from database import get_connection
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT NOMBRE FROM ADMIN.USUARIOS WHERE ID_USUARIO = :1", [user_id])
-                row = cursor.fetchone()
-                nombre = row[0] if row else "Usuario"
-            except:
-                nombre = "Usuario"
-            finally:
-                conn.close()
-        else:
-            nombre = "Usuario"
+    try:
+        credenciales = verificar_credenciales(correo, password)
+    except HashingSaturado:
+        return jsonify({"error": "Server busy, try again later"}), 503
 
+    if credenciales:
+        user_id, nombre = credenciales
+        token, expira_en = emitir_token(user_id)
         return jsonify({
             "mensaje": "Login exitoso",
             "user_id": user_id,
-            "nombre": nombre
+            "nombre": nombre,
+            "token": token,
+            "expira_en": expira_en
         }), 200
     else:
         return jsonify({"error": "Invalid credentials"}), 401
 
+@app.route("/logout", methods=["POST"])
+@requiere_sesion
+def logout():
+    if not revocar_token(g.sesion_token):
+        print("⚠️ Logout sin guardar en la BD: el token solo queda revocado en este worker")
+    return jsonify({"mensaje": "Sesión cerrada"}), 200
+
 @app.route("/conversaciones", methods=["GET"])
+@requiere_sesion
 def get_conversaciones():
-    user_id = request.args.get("user_id")
-    if not user_id:
-        return jsonify({"error": "Missing user_id"}), 400
-
-    conversaciones = listar_conversaciones_por_usuario(user_id)
-    return jsonify(conversaciones), 200
+    try:
+        limite = int(request.args.get("limit", CONVERSACIONES_PAGINA_MAX))
+        conversaciones, siguiente = listar_conversaciones_por_usuario(
+            g.user_id, limite=limite, cursor_pagina=request.args.get("cursor")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # El cuerpo sigue siendo la lista; el cursor de la siguiente página va en una cabecera
+    respuesta = jsonify(conversaciones)
+    if siguiente:
+        respuesta.headers["X-Next-Cursor"] = siguiente
+    return respuesta, 200
 
 @app.route("/nueva-conversacion", methods=["POST"])
+@requiere_sesion
 def nueva_conversacion():
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "No data provided"}), 400
-
-    user_id = data.get("user_id")
-    print(f"DEBUG nueva-conversacion: user_id recibido = {user_id}, data completa = {data}")
-
-    if not user_id or user_id == "undefined":
-        return jsonify({"error": "Missing or invalid user_id", "received": str(user_id)}), 400
-
-    conv_id = crear_nueva_conversacion(user_id, "")
+    conv_id = crear_nueva_conversacion(g.user_id, "")
     if conv_id:
         return jsonify({
             "id_conversacion": conv_id,
@@ -113,37 +148,145 @@ def nueva_conversacion():
     else:
         return jsonify({"error": "Failed to create conversation"}), 500
 
-@app.route("/conversacion/<conversation_id>", methods=["GET", "DELETE"])
+@app.route("/conversacion/<int:conversation_id>", methods=["GET", "DELETE"])
+@requiere_sesion
 def get_conversacion(conversation_id):
+    # Una conversación ajena responde igual que una inexistente
+    if not conversacion_pertenece_a_usuario(conversation_id, g.user_id):
+        return jsonify({"error": "Conversation not found"}), 404
+
     if request.method == "DELETE":
-        success = eliminar_conversacion(int(conversation_id))
+        success = eliminar_conversacion(conversation_id)
         if success:
             return jsonify({"mensaje": "Conversación eliminada correctamente"}), 200
         else:
             return jsonify({"error": "Error al eliminar conversación"}), 500
 
-    mensajes = obtener_mensajes_por_conversacion(conversation_id)
+    try:
+        antes_de_id = int(request.args["before_id"]) if "before_id" in request.args else None
+        limite = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        return jsonify({"error": "before_id y limit deben ser enteros"}), 400
+    if antes_de_id is not None and limite is None:
+        limite = MENSAJES_PAGINA_MAX
+    if limite is not None:
+        limite = max(1, min(limite, MENSAJES_PAGINA_MAX))
+
+    mensajes = obtener_mensajes_por_conversacion(conversation_id, antes_de_id=antes_de_id, limite=limite)
     return jsonify(mensajes), 200
 
-@app.route("/mensaje", methods=["POST"])
-def enviar_mensaje():
+def _leer_mensaje_de_peticion():
+    """
+    Valida el cuerpo de /mensaje y /mensaje/stream.
+    Retorna (conversacion_id, contenido, None) o (None, None, respuesta de error).
+    """
     data = request.get_json()
     if not data:
-        return jsonify({"error": "No data provided"}), 400
+        return None, None, (jsonify({"error": "No data provided"}), 400)
 
-    user_id = data.get("user_id")
     conversacion_id = data.get("conversacion_id")
     contenido = data.get("contenido")
 
-    if not all([user_id, conversacion_id, contenido]):
-        return jsonify({"error": "Missing required fields"}), 400
+    if not all([conversacion_id, contenido]):
+        return None, None, (jsonify({"error": "Missing required fields"}), 400)
+    try:
+        conversacion_id = int(conversacion_id)
+    except (TypeError, ValueError):
+        return None, None, (jsonify({"error": "conversacion_id debe ser un entero"}), 400)
+    if not conversacion_pertenece_a_usuario(conversacion_id, g.user_id):
+        return None, None, (jsonify({"error": "Conversation not found"}), 404)
+    return conversacion_id, contenido, None
+
+@app.route("/mensaje", methods=["POST"])
+@requiere_sesion
+def enviar_mensaje():
+    conversacion_id, contenido, error = _leer_mensaje_de_peticion()
+    if error:
+        return error
 
     try:
-        respuesta = procesar_mensaje(user_id, contenido, conversacion_id)
+        respuesta = procesar_mensaje(g.user_id, contenido, conversacion_id)
         return jsonify({"respuesta": respuesta}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _evento_sse(evento: str, datos: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.route("/mensaje/stream", methods=["POST"])
+@requiere_sesion
+def enviar_mensaje_stream():
+    """
+    Igual que /mensaje, pero responde con Server-Sent Events:
+      event: fragmento  data: {"texto": ...}     (uno por fragmento, en orden)
+      event: fin        data: {"respuesta": ...} (respuesta completa, ya guardada)
+      event: error      data: {"error": ...}
+    Las respuestas que no vienen de Gemini (triaje, BD, aprendizaje) llegan como un
+    único fragmento. El turno se guarda en la BD cuando termina la generación.
+    """
+    conversacion_id, contenido, error = _leer_mensaje_de_peticion()
+    if error:
+        return error
+
+    user_id = g.user_id
+    cola: "queue.Queue" = queue.Queue()
+
+    def turno():
+        try:
+            respuesta = procesar_mensaje(
+                user_id, contenido, conversacion_id,
+                emitir=lambda texto: cola.put(("fragmento", texto))
+            )
+            cola.put(("fin", respuesta))
+        except Exception as e:
+            cola.put(("error", str(e)))
+
+    # El turno corre en su propio hilo para poder enviar cada fragmento al cliente
+    # mientras Gemini sigue generando
+    threading.Thread(target=turno, name=f"turno-stream-{conversacion_id}", daemon=True).start()
+
+    def eventos():
+        # Comentario SSE inicial: el cliente recibe cabeceras y primer byte de inmediato
+        yield ": ok\n\n"
+        hubo_fragmentos = False
+        while True:
+            tipo, valor = cola.get()
+            if tipo == "fragmento":
+                hubo_fragmentos = True
+                yield _evento_sse("fragmento", {"texto": valor})
+            elif tipo == "fin":
+                if not hubo_fragmentos:
+                    yield _evento_sse("fragmento", {"texto": valor})
+                yield _evento_sse("fin", {"respuesta": valor})
+                return
+            else:
+                yield _evento_sse("error", {"error": valor})
+                return
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/diagnostico/diferencial", methods=["POST"])
+def diferencial():
+    """Ranking de enfermedades candidatas para una lista de síntomas."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    sintomas = data.get("sintomas")
+    if not isinstance(sintomas, list) or not all(isinstance(s, str) for s in sintomas):
+        return jsonify({"error": "sintomas debe ser una lista de textos"}), 400
+
+    try:
+        k = max(1, min(int(data.get("k", 5)), 20))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k debe ser un entero"}), 400
+
+    return jsonify(diagnostico_diferencial(sintomas, k)), 200
+
 @app.route("/feedback", methods=["POST"])
 def feedback():
     """Endpoint para recibir retroalimentación del usuario sobre respuestas"""
@@ -172,11 +315,14 @@ def root():
         "endpoints": [
             "POST /register",
             "POST /login",
+            "POST /logout",
             "GET /conversaciones",
             "POST /nueva-conversacion",
             "GET /conversacion/<id>",
             "DELETE /conversacion/<id>",
             "POST /mensaje",
+            "POST /mensaje/stream",
+            "POST /diagnostico/diferencial",
             "POST /feedback",
             "GET /health"
         ]
@@ -184,7 +330,13 @@ def root():
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"}), 200
+    return jsonify({
+        "status": "ok",
+        "db_pool": obtener_estadisticas_pool(),
+        "cache_recomendaciones": obtener_estadisticas_cache_recomendaciones(),
+        "contexto": obtener_estadisticas_contexto(),
+        "llm": obtener_estadisticas_llm()
+    }), 200
 
 if __name__ == '__main__':
     app.run(debug=True, port=3000, host='0.0.0.0')
@@ -0,0 +1,147 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import request, jsonify, g
+
+from config import SESSION_SECRET, SESSION_TTL_SEGUNDOS, SESSION_REVOCACION_SYNC
+from database import revocar_sesion, listar_sesiones_revocadas
+
+# Token de sesión sin estado: base64url(payload JSON) + "." + base64url(HMAC-SHA256(payload)).
+# El payload lleva el ID de usuario (uid), la expiración (exp, epoch) y un identificador
+# aleatorio (jti) que permite revocarlo. Verificarlo no consulta la BD.
+
+_secreto: Optional[bytes] = SESSION_SECRET.encode("utf-8") if SESSION_SECRET else None
+
+# jti -> exp de los tokens revocados (logout). Es una copia local de ADMIN.SESIONES_REVOCADAS
+# que se relee cada SESSION_REVOCACION_SYNC segundos, así que un logout hecho en otro
+# worker se aplica aquí como mucho con ese retraso. Cada entrada se descarta sola cuando
+# el token habría expirado de todos modos.
+_revocados: Dict[str, float] = {}
+_lock_revocados = threading.Lock()
+_lock_sincronizacion = threading.Lock()
+_ultima_sincronizacion = float("-inf")
+
+def iniciar_secreto_sesion(permitir_aleatorio: bool):
+    """
+    Se llama al arrancar la app. Sin SESSION_SECRET, cada proceso firmaría con su propia
+    clave y un token emitido por un worker fallaría en los demás, así que solo se acepta
+    con permitir_aleatorio (servidor de desarrollo); si no, se niega a arrancar.
+    """
+    global _secreto
+    if _secreto is not None:
+        return
+    if not permitir_aleatorio:
+        raise RuntimeError("SESSION_SECRET no configurado: es obligatorio fuera del modo desarrollo")
+    _secreto = secrets.token_bytes(32)
+    print("⚠️ SESSION_SECRET no configurado; se usa un secreto aleatorio de este proceso (solo desarrollo)")
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode("ascii")
+
+def _unb64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+def _firmar(payload: str) -> str:
+    if _secreto is None:
+        raise RuntimeError("Secreto de sesión sin inicializar (ver iniciar_secreto_sesion)")
+    return _b64(hmac.new(_secreto, payload.encode("ascii"), hashlib.sha256).digest())
+
+def emitir_token(user_id: int) -> Tuple[str, int]:
+    """Crea un token firmado para el usuario. Retorna (token, expiración en epoch)."""
+    exp = int(time.time()) + SESSION_TTL_SEGUNDOS
+    payload = _b64(json.dumps({"uid": user_id, "exp": exp, "jti": secrets.token_urlsafe(12)},
+                              separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_firmar(payload)}", exp
+
+def verificar_token(token: str) -> Optional[Dict]:
+    """
+    Devuelve el payload ({"uid", "exp", "jti"}) si el token es auténtico, no ha expirado
+    y no fue revocado; None en cualquier otro caso. La firma se compara en tiempo constante.
+    """
+    if not token or token.count(".") != 1:
+        return None
+    payload, firma = token.split(".")
+    try:
+        if not hmac.compare_digest(firma.encode("ascii"), _firmar(payload).encode("ascii")):
+            return None
+        datos = json.loads(_unb64(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(datos, dict) or not isinstance(datos.get("uid"), int):
+        return None
+    if datos.get("exp", 0) <= time.time():
+        return None
+    _sincronizar_revocados()
+    with _lock_revocados:
+        if datos.get("jti") in _revocados:
+            return None
+    return datos
+
+def _sincronizar_revocados():
+    """
+    Relee la lista compartida si la copia local tiene más de SESSION_REVOCACION_SYNC
+    segundos. Solo un hilo consulta la BD; los demás siguen con la copia que hay. Si la BD
+    no responde, se conserva la copia local.
+    """
+    global _ultima_sincronizacion
+    if time.monotonic() - _ultima_sincronizacion < SESSION_REVOCACION_SYNC:
+        return
+    if not _lock_sincronizacion.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() - _ultima_sincronizacion < SESSION_REVOCACION_SYNC:
+            return
+        _ultima_sincronizacion = time.monotonic()
+        compartidos = listar_sesiones_revocadas()
+        if compartidos is None:
+            return
+        ahora = time.time()
+        with _lock_revocados:
+            # Se conservan las revocaciones locales que no llegaron a guardarse en la BD
+            vigentes = {jti: exp for jti, exp in _revocados.items() if exp > ahora}
+            vigentes.update(compartidos)
+            _revocados.clear()
+            _revocados.update(vigentes)
+    finally:
+        _lock_sincronizacion.release()
+
+def revocar_token(datos: Dict) -> bool:
+    """
+    Invalida un token ya verificado hasta su expiración natural: en este worker al
+    instante y en los demás en cuanto relean la lista. Retorna False si no se pudo
+    guardar en la BD (entonces solo queda revocado en este worker).
+    """
+    ahora = time.time()
+    with _lock_revocados:
+        for jti in [j for j, exp in _revocados.items() if exp <= ahora]:
+            del _revocados[jti]
+        _revocados[datos["jti"]] = datos["exp"]
+    return revocar_sesion(datos["jti"], int(datos["exp"]))
+
+def token_de_la_peticion() -> Optional[str]:
+    cabecera = request.headers.get("Authorization", "")
+    if cabecera.startswith("Bearer "):
+        return cabecera[len("Bearer "):].strip()
+    return None
+
+def requiere_sesion(vista):
+    """
+    Decorador para rutas de Flask: exige 'Authorization: Bearer <token>' válido y deja
+    el usuario en g.user_id y el payload en g.sesion_token. Responde 401 si no lo hay.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        datos = verificar_token(token_de_la_peticion())
+        if datos is None:
+            return jsonify({"error": "Invalid or expired session"}), 401
+        g.user_id = datos["uid"]
+        g.sesion_token = datos
+        return vista(*args, **kwargs)
+    return envoltura
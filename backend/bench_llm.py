@@ -0,0 +1,110 @@
+"""
+Benchmark del camino del LLM (generar_respuesta_con_gemini: prompt, cliente con plazo,
+reintentos, hedging y disyuntor, disclaimer) contra el proveedor local simulado, sin red
+ni base de datos.
+
+Ejemplo:
+    python bench_llm.py --peticiones 500 --concurrencia 16 --latencia 0.8 --fallos 0.05
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MENSAJES = [
+    ("tengo fiebre y dolor de cabeza", ["fiebre", "dolor de cabeza"], "Gripe", 38.5),
+    ("me duele la garganta y tengo tos", ["dolor de garganta", "tos"], "Resfriado común", None),
+    ("tengo diarrea y náuseas desde ayer", ["diarrea", "nauseas"], "Gastroenteritis", 37.8),
+    ("estoy muy cansado y me duele el cuerpo", ["fatiga", "dolor muscular"], None, None),
+    ("tengo tos seca por las noches", ["tos"], None, None),
+]
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p / 100), len(ordenados) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del camino del LLM con el proveedor local")
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="usar la generación en streaming")
+    parser.add_argument("--latencia", type=float, default=0.8, help="mediana de latencia (s)")
+    parser.add_argument("--sigma", type=float, default=0.4, help="sigma de la log-normal")
+    parser.add_argument("--fallos", type=float, default=0.0, help="tasa de fallos inmediatos")
+    parser.add_argument("--colgadas", type=float, default=0.0, help="tasa de llamadas colgadas")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--sin-cache", action="store_true", help="no conservar respuestas en la caché del LLM")
+    args = parser.parse_args()
+
+    # Los avisos por petición (sin historial, reintentos) ensucian la salida
+    logging.basicConfig(level=logging.ERROR)
+
+    # La configuración se lee al importar, así que se fija antes
+    os.environ["LLM_PROVIDER"] = "local"
+    os.environ["LLM_LOCAL_LATENCIA_MEDIANA"] = str(args.latencia)
+    os.environ["LLM_LOCAL_LATENCIA_SIGMA"] = str(args.sigma)
+    os.environ["LLM_LOCAL_TASA_FALLOS"] = str(args.fallos)
+    os.environ["LLM_LOCAL_TASA_COLGADAS"] = str(args.colgadas)
+    os.environ["LLM_LOCAL_SEMILLA"] = str(args.semilla)
+    os.environ.setdefault("LLM_HILOS", str(args.concurrencia * 2))
+    if args.sin_cache:
+        os.environ["LLM_CACHE_MAX_ENTRADAS"] = "0"
+
+    from conversation_context import ContextoConversacion
+    from gemini_service import generar_respuesta_con_gemini, obtener_estadisticas_llm
+
+    latencias = []
+    primer_fragmento = []
+    resultados = {"llm": 0, "fallback": 0}
+    lock = threading.Lock()
+
+    def una(i: int):
+        mensaje, sintomas, diagnostico, temperatura = MENSAJES[i % len(MENSAJES)]
+        contexto = ContextoConversacion()
+        contexto.temperatura = temperatura
+        inicio = time.perf_counter()
+        primero = []
+
+        def emitir(texto):
+            if not primero:
+                primero.append(time.perf_counter() - inicio)
+
+        respuesta, _ = generar_respuesta_con_gemini(
+            mensaje_usuario=f"{mensaje} ({i})",
+            sintomas_detectados=sintomas,
+            contexto=contexto,
+            diagnostico_previo=diagnostico,
+            historial_conversacion=[],
+            emitir=emitir if args.stream else None
+        )
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+            primer_fragmento.extend(primero)
+            resultados["llm" if respuesta else "fallback"] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        list(pool.map(una, range(args.peticiones)))
+    total = time.perf_counter() - inicio
+
+    print(f"📊 {args.peticiones} peticiones, concurrencia {args.concurrencia}, "
+          f"{'streaming' if args.stream else 'sin streaming'}")
+    print(f"⏱️ Tiempo total: {total:.2f}s | Rendimiento: {args.peticiones / total:.1f} peticiones/s")
+    print(f"   Latencia p50 {_percentil(latencias, 50):.3f}s | p95 {_percentil(latencias, 95):.3f}s | "
+          f"p99 {_percentil(latencias, 99):.3f}s")
+    if primer_fragmento:
+        print(f"   Primer fragmento p50 {_percentil(primer_fragmento, 50):.3f}s | "
+              f"p95 {_percentil(primer_fragmento, 95):.3f}s")
+    print(f"✅ Respondidas por el LLM: {resultados['llm']} | ↩️ Fallback: {resultados['fallback']}")
+    print(json.dumps(obtener_estadisticas_llm(), indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class CacheTTL:
+    """
+    Caché en memoria acotada por número de entradas (expulsión LRU) y por antigüedad (TTL).
+    Es segura entre hilos y lleva contadores de aciertos, fallos, expulsiones e invalidaciones.
+    Puede guardar None como valor válido (p. ej. "no hay recomendación").
+    """
+
+    def __init__(self, max_entradas: int, ttl: float, nombre: str = "cache"):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.nombre = nombre
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+        self._en_curso: Dict[Hashable, threading.Event] = {}
+        self.esperas = 0
+
+    def obtener(self, clave: Hashable) -> Tuple[bool, Any]:
+        """Devuelve (encontrado, valor). Una entrada vencida cuenta como fallo y se descarta."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return True, entrada[1]
+
+    def guardar(self, clave: Hashable, valor: Any, ttl: Optional[float] = None):
+        vence = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (vence, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+
+    def obtener_o_calcular(self, clave: Hashable, calcular: Callable[[], Any],
+                           guardar_si: Optional[Callable[[Any], bool]] = None,
+                           espera: Optional[float] = None) -> Any:
+        """
+        Devuelve el valor de 'clave' o, si no está, el de calcular(), guardándolo si
+        guardar_si(valor) lo permite. Si varios hilos piden a la vez la misma clave ausente,
+        solo uno calcula; los demás esperan su resultado (como mucho 'espera' segundos) en
+        lugar de repetir el cálculo. Si el que calculaba falla o su valor no se guarda,
+        cada uno calcula por su cuenta.
+        """
+        encontrado, valor = self.obtener(clave)
+        if encontrado:
+            return valor
+
+        with self._lock:
+            evento = self._en_curso.get(clave)
+            calcula_este = evento is None
+            if calcula_este:
+                evento = self._en_curso[clave] = threading.Event()
+            else:
+                self.esperas += 1
+
+        if not calcula_este:
+            evento.wait(espera)
+            encontrado, valor = self.obtener(clave)
+            return valor if encontrado else calcular()
+
+        try:
+            valor = calcular()
+            if guardar_si is None or guardar_si(valor):
+                self.guardar(clave, valor)
+            return valor
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            evento.set()
+
+    def invalidar(self, clave: Optional[Hashable] = None):
+        """Elimina una clave, o todo el contenido si no se indica ninguna."""
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+            self.invalidaciones += 1
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+                "expulsiones": self.expulsiones,
+                "invalidaciones": self.invalidaciones,
+                "esperas": self.esperas
+            }
@@ -0,0 +1,101 @@
+import re
+from typing import List, Optional, Tuple
+
+TITULO_POR_DEFECTO = "Nueva conversación"
+
+# Patrones de síntomas para el título, en orden de prioridad: si el mensaje menciona
+# varios, gana el que aparece primero en esta lista (no el primero en el texto).
+_PATRONES_TITULO: List[Tuple[str, str]] = [
+    (r"dolor de cabeza|cefalea|migraña", "Dolor de cabeza"),
+    (r"fiebre|temperatura|calentura", "Fiebre"),
+    (r"gripe|gripa|resfriado|catarro", "Gripe"),
+    (r"tos", "Tos"),
+    (r"dolor de garganta|garganta", "Dolor de garganta"),
+    (r"nariz tapada|congestión|congestionado", "Congestión nasal"),
+    (r"dolor de estómago|dolor abdominal|dolor de barriga", "Dolor abdominal"),
+    (r"dolor de cintura|dolor lumbar|lumbago", "Dolor de cintura"),
+    (r"dolor de espalda", "Dolor de espalda"),
+    (r"dolor al orinar|cistitis|infección urinaria", "Problema urinario"),
+    (r"náuseas|nausea|ganas de vomitar", "Náuseas"),
+    (r"mareo|mareado|vértigo", "Mareos"),
+    (r"cansancio|fatiga|agotamiento", "Fatiga"),
+    (r"diarrea", "Diarrea"),
+    (r"vómito|vomitar", "Vómitos"),
+    (r"alergia|alergias|alérgico", "Alergias"),
+    (r"asma|asmatico", "Asma"),
+    (r"rinitis", "Rinitis"),
+]
+
+# Una sola alternancia con un grupo con nombre por patrón (t0, t1, ...). Va dentro de un
+# lookahead para que finditer pruebe todas las posiciones del texto sin consumirlo: así una
+# coincidencia de baja prioridad nunca tapa a otra de mayor prioridad que se solape con ella.
+_REGEX_TITULO = re.compile(
+    "(?=" + "|".join(rf"\b(?P<t{i}>{patron})\b" for i, (patron, _) in enumerate(_PATRONES_TITULO)) + ")"
+)
+_REGEX_PREGUNTA = re.compile(r"(?:que es|qué es|sobre|acerca de)\s+(?:la |el )?([\w\s]{3,20})\??")
+
+def _titulo_por_sintoma(mensaje_lower: str) -> Optional[str]:
+    mejor = len(_PATRONES_TITULO)
+    for m in _REGEX_TITULO.finditer(mensaje_lower):
+        indice = int(m.lastgroup[1:])
+        if indice < mejor:
+            mejor = indice
+            if mejor == 0:
+                break
+    return _PATRONES_TITULO[mejor][1] if mejor < len(_PATRONES_TITULO) else None
+
+def generar_titulo_desde_mensaje(mensaje: str) -> str:
+    """Genera un título descriptivo desde el mensaje del usuario."""
+    if not mensaje or not mensaje.strip():
+        return TITULO_POR_DEFECTO
+
+    mensaje_lower = mensaje.lower().strip()
+
+    titulo = _titulo_por_sintoma(mensaje_lower)
+    if titulo:
+        return titulo
+
+    # Si es una pregunta sobre una enfermedad específica
+    match = _REGEX_PREGUNTA.search(mensaje_lower)
+    if match:
+        return match.group(1).strip().title()
+
+    # Si el mensaje es corto, usarlo como título (máximo 30 caracteres)
+    if len(mensaje) <= 30:
+        return mensaje.capitalize()
+
+    # Tomar las primeras palabras del mensaje
+    palabras = mensaje.split()[:4]
+    return " ".join(palabras).capitalize() + "..."
+
+class TituloTurno:
+    """
+    Decide el título de una conversación una sola vez por turno.
+
+    Durante el turno solo se acumulan propuestas; al final, decidir() devuelve el título
+    elegido y si únicamente debe aplicarse cuando el chat aún tiene el título por defecto:
+    - un síntoma detectado reemplaza siempre el título (gana el último propuesto);
+    - si no hubo síntomas, el título sacado del mensaje solo sustituye al título por defecto.
+    """
+
+    __slots__ = ("_mensaje", "_sintoma", "_decidido")
+
+    def __init__(self, mensaje: str):
+        self._mensaje = mensaje
+        self._sintoma: Optional[str] = None
+        self._decidido = False
+
+    def proponer_sintomas(self, sintomas: List[str]):
+        if sintomas:
+            self._sintoma = sintomas[0].capitalize()
+
+    def decidir(self) -> Optional[Tuple[str, bool]]:
+        """(título, solo_si_por_defecto), o None si ya se decidió o no hay nada que proponer."""
+        if self._decidido:
+            return None
+        self._decidido = True
+        if self._sintoma:
+            return self._sintoma, False
+        if self._mensaje and self._mensaje.strip():
+            return generar_titulo_desde_mensaje(self._mensaje), True
+        return None
@@ -12,6 +12,109 @@ DB_DSN_ALIAS  = os.getenv("DB_DSN_ALIAS", "agentemedico_high")
 DB_WALLET_DIR = os.getenv("DB_WALLET_DIR", "./wallet")
 DB_WALLET_PASS = os.getenv("DB_WALLET_PASS", "Rd30072003!!")  # <-- si tu wallet pide passphrase, rellénala por variable de entorno
 
+# Pool de sesiones Oracle (uno por proceso / worker de gunicorn)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+DB_POOL_INCREMENT = int(os.getenv("DB_POOL_INCREMENT", "1"))
+DB_POOL_TIMEOUT_MS = int(os.getenv("DB_POOL_TIMEOUT_MS", "5000"))    # espera máxima para obtener una sesión
+DB_POOL_PING_INTERVAL = int(os.getenv("DB_POOL_PING_INTERVAL", "60"))  # solo se hace ping a sesiones inactivas más de N segundos
+DB_POOL_IDLE_TIMEOUT = int(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))   # cierra sesiones sobrantes inactivas tras N segundos
+
+# Aplicar migraciones de esquema pendientes al iniciar la aplicación
+DB_MIGRAR_AL_INICIAR = os.getenv("DB_MIGRAR_AL_INICIAR", "1") == "1"
+
+# Persistencia diferida (write-behind) de mensajes
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+DB_JOURNAL_DIR = os.getenv("DB_JOURNAL_DIR", "./journal")
+DB_JOURNAL_BATCH = int(os.getenv("DB_JOURNAL_BATCH", "50"))
+DB_JOURNAL_INTERVAL = float(os.getenv("DB_JOURNAL_INTERVAL", "0.5"))   # segundos máximos antes de vaciar un lote
+DB_JOURNAL_MAX_QUEUE = int(os.getenv("DB_JOURNAL_MAX_QUEUE", "1000"))
+DB_JOURNAL_FSYNC = os.getenv("DB_JOURNAL_FSYNC", "1") == "1"
+
+# Tamaño máximo (y por defecto) de una página de GET /conversaciones
+CONVERSACIONES_PAGINA_MAX = int(os.getenv("CONVERSACIONES_PAGINA_MAX", "100"))
+
+# Historial de mensajes: tamaño máximo de página y filas por viaje a la BD
+MENSAJES_PAGINA_MAX = int(os.getenv("MENSAJES_PAGINA_MAX", "200"))
+MENSAJES_ARRAYSIZE = int(os.getenv("MENSAJES_ARRAYSIZE", "200"))
+
+# Base de conocimiento en memoria: segundos entre recargas de fondo
+KB_REFRESCO_SEGUNDOS = float(os.getenv("KB_REFRESCO_SEGUNDOS", "300"))
+
+# Caché de recomendaciones de medicamentos
+REC_CACHE_MAX_ENTRADAS = int(os.getenv("REC_CACHE_MAX_ENTRADAS", "2048"))
+REC_CACHE_TTL = float(os.getenv("REC_CACHE_TTL", "600"))
+
+# Contraseñas: coste de bcrypt y pool de procesos que lo ejecuta.
+# BCRYPT_WORKERS=0 hace el hash en el propio hilo de la petición.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDIENTES = int(os.getenv("BCRYPT_MAX_PENDIENTES", "32"))   # operaciones en curso antes de responder 503
+BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", "10"))               # segundos
+
+# Tokens de sesión firmados (HMAC). SESSION_SECRET debe ser el mismo en todos los workers;
+# sin él la app solo arranca en modo desarrollo. Los logouts se guardan en la BD y cada
+# worker relee la lista cada SESSION_REVOCACION_SYNC segundos.
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_TTL_SEGUNDOS = int(os.getenv("SESSION_TTL_SEGUNDOS", "43200"))
+SESSION_REVOCACION_SYNC = float(os.getenv("SESSION_REVOCACION_SYNC", "15"))
+
+# Estado de cada conversación entre turnos: "bd" (tabla ESTADO_CONVERSACION con caché local),
+# "memoria" (por proceso) o "sqlite" (compartido entre los workers de la máquina)
+CONTEXTO_BACKEND = os.getenv("CONTEXTO_BACKEND", "bd").lower()
+CONTEXTO_MAX_ENTRADAS = int(os.getenv("CONTEXTO_MAX_ENTRADAS", "10000"))
+CONTEXTO_MAX_BYTES = int(os.getenv("CONTEXTO_MAX_BYTES", str(32 * 1024 * 1024)))
+CONTEXTO_TTL = float(os.getenv("CONTEXTO_TTL", "86400"))     # segundos de inactividad
+CONTEXTO_SQLITE_RUTA = os.getenv("CONTEXTO_SQLITE_RUTA", "./estado/contextos.sqlite3")
+
+# Gemini: modelos candidatos (en orden) y descubrimiento en segundo plano. El resultado se
+# comparte entre workers en GEMINI_DESCUBRIMIENTO_ARCHIVO durante GEMINI_DESCUBRIMIENTO_TTL
+# segundos; si no se encontró modelo, se vuelve a intentar tras GEMINI_DESCUBRIMIENTO_REINTENTO.
+GEMINI_MODELOS = [m.strip() for m in os.getenv(
+    "GEMINI_MODELOS",
+    "models/gemini-2.0-flash,models/gemini-2.5-flash,gemini-2.0-flash,gemini-2.5-flash,"
+    "models/gemini-2.0-flash-exp,models/gemini-flash-latest"
+).split(",") if m.strip()]
+GEMINI_DESCUBRIMIENTO_ARCHIVO = os.getenv("GEMINI_DESCUBRIMIENTO_ARCHIVO", "./estado/gemini_modelo.json")
+GEMINI_DESCUBRIMIENTO_TTL = float(os.getenv("GEMINI_DESCUBRIMIENTO_TTL", "3600"))
+GEMINI_DESCUBRIMIENTO_REINTENTO = float(os.getenv("GEMINI_DESCUBRIMIENTO_REINTENTO", "300"))
+GEMINI_DESCUBRIMIENTO_PRESUPUESTO = float(os.getenv("GEMINI_DESCUBRIMIENTO_PRESUPUESTO", "10"))   # segundos en total
+
+# Cliente LLM: plazo por llamada, reintentos con backoff exponencial y jitter, petición de
+# respaldo (hedging) si la primera tarda más que el percentil LLM_HEDGE_PERCENTIL de las
+# latencias recientes (0 = desactivado) y disyuntor que corta las llamadas durante
+# LLM_DISYUNTOR_ENFRIAMIENTO segundos si la tasa de error en la ventana supera el umbral.
+LLM_PLAZO_SEGUNDOS = float(os.getenv("LLM_PLAZO_SEGUNDOS", "20"))
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "2"))
+LLM_HEDGE_PERCENTIL = float(os.getenv("LLM_HEDGE_PERCENTIL", "95"))
+LLM_HEDGE_MIN_MUESTRAS = int(os.getenv("LLM_HEDGE_MIN_MUESTRAS", "20"))
+LLM_HILOS = int(os.getenv("LLM_HILOS", "8"))
+LLM_DISYUNTOR_VENTANA = float(os.getenv("LLM_DISYUNTOR_VENTANA", "60"))   # segundos
+LLM_DISYUNTOR_MIN_LLAMADAS = int(os.getenv("LLM_DISYUNTOR_MIN_LLAMADAS", "10"))
+LLM_DISYUNTOR_UMBRAL_ERROR = float(os.getenv("LLM_DISYUNTOR_UMBRAL_ERROR", "0.5"))
+LLM_DISYUNTOR_ENFRIAMIENTO = float(os.getenv("LLM_DISYUNTOR_ENFRIAMIENTO", "30"))
+
+# Proveedor del LLM: "gemini" o "local". El local es un simulador sin red para pruebas de
+# carga y benchmarks: responde textos fijos elegidos por hash del prompt, con una latencia
+# log-normal (mediana y sigma en segundos), y con las tasas indicadas falla de inmediato o
+# se queda colgado hasta agotar el timeout.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").strip().lower()
+LLM_LOCAL_LATENCIA_MEDIANA = float(os.getenv("LLM_LOCAL_LATENCIA_MEDIANA", "0.8"))
+LLM_LOCAL_LATENCIA_SIGMA = float(os.getenv("LLM_LOCAL_LATENCIA_SIGMA", "0.4"))
+LLM_LOCAL_TASA_FALLOS = float(os.getenv("LLM_LOCAL_TASA_FALLOS", "0"))
+LLM_LOCAL_TASA_COLGADAS = float(os.getenv("LLM_LOCAL_TASA_COLGADAS", "0"))
+LLM_LOCAL_FRAGMENTOS = int(os.getenv("LLM_LOCAL_FRAGMENTOS", "8"))
+LLM_LOCAL_SEMILLA = int(os.getenv("LLM_LOCAL_SEMILLA")) if os.getenv("LLM_LOCAL_SEMILLA") else None
+
+# Caché de respuestas del LLM para consultas iniciales con el mismo cuadro clínico (síntomas,
+# diagnóstico previo, temperatura en tramos de 0.5 °C y triaje). Solo se usa si el historial
+# tiene como mucho LLM_CACHE_HISTORIAL_MAX mensajes previos (sin contar el mensaje actual).
+LLM_CACHE_MAX_ENTRADAS = int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_HISTORIAL_MAX = int(os.getenv("LLM_CACHE_HISTORIAL_MAX", "0"))
+
 def validate_wallet_dir() -> Path:
     p = Path(DB_WALLET_DIR)
     if not p.exists():
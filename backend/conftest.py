@@ -0,0 +1,2 @@
+# test_gemini.py es un script manual contra la API real (hace llamadas de red al importarse)
+collect_ignore = ["test_gemini.py"]
@@ -0,0 +1,256 @@
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from cache import CacheTTL
+from conversation_context import ContextoConversacion
+from database import SesionBD, leer_estado_conversacion, guardar_estado_conversacion
+from config import (
+    CONTEXTO_BACKEND, CONTEXTO_MAX_ENTRADAS, CONTEXTO_MAX_BYTES,
+    CONTEXTO_TTL, CONTEXTO_SQLITE_RUTA
+)
+
+def _deserializar(datos: bytes) -> Optional[ContextoConversacion]:
+    try:
+        return ContextoConversacion.desde_bytes(datos)
+    except ValueError as e:
+        # Un contexto ilegible (p. ej. de un formato anterior) equivale a no tenerlo
+        print(f"⚠️ Contexto descartado: {e}")
+        return None
+
+class AlmacenContexto(ABC):
+    """
+    Dónde vive el contexto de conversación (triaje, flujo de aprendizaje, etc.) entre turnos.
+    La clave es (user_id, conversation_id). El turno lo carga una vez al empezar y lo guarda
+    una vez al terminar; lo que se devuelve es siempre una copia, así que modificarla no
+    afecta al almacén hasta llamar a guardar(). 'sesion' solo lo usan los almacenes en la BD.
+    """
+
+    @abstractmethod
+    def cargar(self, clave, sesion: Optional[SesionBD] = None) -> Optional[ContextoConversacion]:
+        ...
+
+    @abstractmethod
+    def guardar(self, clave, contexto: ContextoConversacion, sesion: Optional[SesionBD] = None):
+        ...
+
+    @abstractmethod
+    def eliminar(self, clave):
+        ...
+
+    def estadisticas(self) -> Dict:
+        return {}
+
+class AlmacenContextoMemoria(AlmacenContexto):
+    """
+    Almacén en el propio proceso, acotado por número de entradas, por bytes (del contexto
+    serializado con a_bytes) y por inactividad (TTL). Expulsa primero lo menos usado recientemente.
+    """
+
+    def __init__(self, max_entradas: int, max_bytes: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._datos: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones_lru = 0
+        self.expulsiones_ttl = 0
+
+    def _quitar(self, clave):
+        _, datos = self._datos.pop(clave)
+        self._bytes -= len(datos)
+
+    def cargar(self, clave, sesion: Optional[SesionBD] = None) -> Optional[ContextoConversacion]:
+        clave = str(clave)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] <= ahora:
+                self._quitar(clave)
+                self.expulsiones_ttl += 1
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            datos = entrada[1]
+        return _deserializar(datos)
+
+    def guardar(self, clave, contexto: ContextoConversacion, sesion: Optional[SesionBD] = None):
+        clave = str(clave)
+        datos = contexto.a_bytes()
+        vence = time.monotonic() + self.ttl
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (vence, datos)
+            self._bytes += len(datos)
+            while self._datos and (len(self._datos) > self.max_entradas or self._bytes > self.max_bytes):
+                self._quitar(next(iter(self._datos)))
+                self.expulsiones_lru += 1
+
+    def eliminar(self, clave):
+        with self._lock:
+            if str(clave) in self._datos:
+                self._quitar(str(clave))
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memoria",
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_entradas": self.max_entradas,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones_lru": self.expulsiones_lru,
+                "expulsiones_ttl": self.expulsiones_ttl
+            }
+
+class AlmacenContextoSQLite(AlmacenContexto):
+    """
+    Almacén compartido entre los workers de una máquina, en un archivo SQLite (modo WAL).
+    Cada hilo usa su propia conexión. Las entradas vencidas se ignoran al leer y se
+    purgan periódicamente al escribir.
+    """
+
+    _PURGA_CADA = 500
+
+    def __init__(self, ruta: str, ttl: float):
+        self.ruta = ruta
+        self.ttl = ttl
+        self._local = threading.local()
+        self._escrituras = 0
+        self.aciertos = 0
+        self.fallos = 0
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        with self._conexion() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS CONTEXTOS (
+                    CLAVE TEXT PRIMARY KEY,
+                    DATOS BLOB NOT NULL,
+                    VENCE REAL NOT NULL
+                )
+            """)
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def cargar(self, clave, sesion: Optional[SesionBD] = None) -> Optional[ContextoConversacion]:
+        fila = self._conexion().execute(
+            "SELECT DATOS FROM CONTEXTOS WHERE CLAVE = ? AND VENCE > ?", (str(clave), time.time())
+        ).fetchone()
+        if fila is None:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return _deserializar(fila[0])
+
+    def guardar(self, clave, contexto: ContextoConversacion, sesion: Optional[SesionBD] = None):
+        conn = self._conexion()
+        conn.execute(
+            "INSERT OR REPLACE INTO CONTEXTOS (CLAVE, DATOS, VENCE) VALUES (?, ?, ?)",
+            (str(clave), contexto.a_bytes(), time.time() + self.ttl)
+        )
+        self._escrituras += 1
+        if self._escrituras % self._PURGA_CADA == 0:
+            conn.execute("DELETE FROM CONTEXTOS WHERE VENCE <= ?", (time.time(),))
+
+    def eliminar(self, clave):
+        self._conexion().execute("DELETE FROM CONTEXTOS WHERE CLAVE = ?", (str(clave),))
+
+    def estadisticas(self) -> Dict:
+        return {
+            "backend": "sqlite",
+            "ruta": self.ruta,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos
+        }
+
+class AlmacenContextoBD(AlmacenContexto):
+    """
+    Estado guardado en ADMIN.ESTADO_CONVERSACION, una fila pequeña por conversación, así
+    que cualquier worker puede atender el siguiente turno y un reinicio no lo pierde.
+
+    Delante hay una caché de lectura (VERSION, bytes) por proceso. Cada carga pregunta a
+    la BD por la versión vigente y solo trae los datos si la copia en caché quedó vieja
+    (p. ej. porque el turno anterior lo atendió otro worker). El guardado va dentro de la
+    sesión del turno, y la caché se actualiza solo si esa sesión se confirma.
+    """
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self._cache = CacheTTL(max_entradas, ttl, nombre="estado_conversacion")
+        self.lecturas_bd = 0
+        self.escrituras_bd = 0
+
+    def cargar(self, clave, sesion: Optional[SesionBD] = None) -> Optional[ContextoConversacion]:
+        user_id, conversation_id = clave
+        encontrado, cacheado = self._cache.obtener(clave)
+        version_cache, datos_cache = cacheado if encontrado else (0, None)
+
+        leido = leer_estado_conversacion(user_id, conversation_id, version_cache, sesion=sesion)
+        self.lecturas_bd += 1
+        if leido is None:
+            # Sin BD: mejor la copia local (quizá algo vieja) que perder el paso del triaje
+            return _deserializar(datos_cache) if datos_cache is not None else None
+
+        version, datos = leido
+        if version == 0:
+            self._cache.invalidar(clave)
+            return None
+        if datos is None:
+            datos = datos_cache
+        else:
+            self._cache.guardar(clave, (version, datos))
+        return _deserializar(datos)
+
+    def guardar(self, clave, contexto: ContextoConversacion, sesion: Optional[SesionBD] = None):
+        user_id, conversation_id = clave
+        datos = contexto.a_bytes()
+        version = guardar_estado_conversacion(user_id, conversation_id, datos, sesion=sesion)
+        self.escrituras_bd += 1
+        if version is None:
+            self._cache.invalidar(clave)
+        elif sesion is not None:
+            sesion.al_confirmar(lambda: self._cache.guardar(clave, (version, datos)))
+        else:
+            self._cache.guardar(clave, (version, datos))
+
+    def eliminar(self, clave):
+        self._cache.invalidar(clave)
+
+    def estadisticas(self) -> Dict:
+        return {
+            "backend": "bd",
+            "lecturas_bd": self.lecturas_bd,
+            "escrituras_bd": self.escrituras_bd,
+            "cache": self._cache.estadisticas()
+        }
+
+def crear_almacen_contexto() -> AlmacenContexto:
+    """Crea el almacén indicado por CONTEXTO_BACKEND ("bd", "memoria" o "sqlite")."""
+    if CONTEXTO_BACKEND == "bd":
+        return AlmacenContextoBD(CONTEXTO_MAX_ENTRADAS, CONTEXTO_TTL)
+    if CONTEXTO_BACKEND == "sqlite":
+        print(f"✅ Contexto de conversación compartido en SQLite: {CONTEXTO_SQLITE_RUTA}")
+        return AlmacenContextoSQLite(CONTEXTO_SQLITE_RUTA, CONTEXTO_TTL)
+    if CONTEXTO_BACKEND != "memoria":
+        print(f"⚠️ CONTEXTO_BACKEND desconocido '{CONTEXTO_BACKEND}'; se usa memoria")
+    return AlmacenContextoMemoria(CONTEXTO_MAX_ENTRADAS, CONTEXTO_MAX_BYTES, CONTEXTO_TTL)
@@ -0,0 +1,149 @@
+import struct
+from enum import IntEnum
+from typing import List, Optional
+
+class EstadoConversacion(IntEnum):
+    """Flujo en el que está la conversación. Los flujos secundarios son excluyentes."""
+    INICIO = 0
+    TRIAGE = 1
+    ESPERANDO_ENFERMEDAD = 2
+    ESPERANDO_MEDICAMENTO = 3
+
+# Respuestas sí/no del triaje, en el orden en que se listan al modelo.
+# El índice de cada una es su bit en las máscaras de RespuestasTriage.
+MARCAS_TRIAGE = (
+    "fiebre", "tos", "dolor_garganta", "dolor_cabeza", "dolor_abdominal",
+    "dolor_pecho", "nauseas", "vomitos", "diarrea"
+)
+_BIT_MARCA = {nombre: 1 << i for i, nombre in enumerate(MARCAS_TRIAGE)}
+
+class RespuestasTriage:
+    """
+    Respuestas del triaje con disposición fija. Cada marca sí/no ocupa un bit en dos
+    máscaras: 'respondidas' (se preguntó) y 'afirmativas' (la respuesta fue sí).
+    """
+
+    __slots__ = ("respondidas", "afirmativas", "temperatura", "intensidad", "duracion")
+
+    def __init__(self):
+        self.respondidas = 0
+        self.afirmativas = 0
+        self.temperatura: Optional[float] = None
+        self.intensidad: Optional[int] = None
+        self.duracion: Optional[str] = None
+
+    def marcar(self, nombre: str, valor: bool):
+        bit = _BIT_MARCA[nombre]
+        self.respondidas |= bit
+        if valor:
+            self.afirmativas |= bit
+        else:
+            self.afirmativas &= ~bit
+
+    def tiene(self, nombre: str) -> bool:
+        return bool(self.afirmativas & _BIT_MARCA[nombre])
+
+    def marcas_afirmativas(self) -> List[str]:
+        return [nombre for nombre in MARCAS_TRIAGE if self.afirmativas & _BIT_MARCA[nombre]]
+
+    def vacia(self) -> bool:
+        return (not self.respondidas and self.temperatura is None
+                and self.intensidad is None and self.duracion is None)
+
+class ContextoConversacion:
+    """
+    Estado de una conversación entre turnos. Se serializa con a_bytes() a un formato binario
+    compacto para guardarlo en context_store.
+    """
+
+    __slots__ = (
+        "estado", "paso_triage", "triage", "temperatura", "enfermedad",
+        "enfermedad_propuesta", "sintoma_reportado"
+    )
+
+    def __init__(self):
+        self.estado = EstadoConversacion.INICIO
+        self.paso_triage = 0
+        self.triage = RespuestasTriage()
+        self.temperatura: Optional[float] = None
+        self.enfermedad: Optional[str] = None
+        self.enfermedad_propuesta: Optional[str] = None
+        self.sintoma_reportado: Optional[str] = None
+
+    def iniciar_triage(self):
+        self.estado = EstadoConversacion.TRIAGE
+        self.paso_triage = 0
+        self.triage = RespuestasTriage()
+
+    def reset_flujos_secundarios(self):
+        """Sale del triaje o del flujo de aprendizaje, si había alguno en curso."""
+        self.estado = EstadoConversacion.INICIO
+
+    # Formato v2 (little-endian):
+    #   cabecera  B versión, B estado, B paso_triage, B presencia,
+    #             d temperatura, H respondidas, H afirmativas, d temp. triaje, b intensidad
+    #   textos    enfermedad, enfermedad_propuesta, sintoma_reportado, duración del triaje,
+    #             cada uno como H largo + UTF-8 (0xFFFF = None)
+    # 'presencia' indica qué números opcionales tienen valor (bit 1 temperatura,
+    # bit 2 temperatura del triaje). La v1 llevaba además el conversation_id, que ahora
+    # es parte de la clave con la que se guarda.
+    _VERSION = 2
+    _CABECERA = struct.Struct("<BBBBdHHdb")
+    _LARGO = struct.Struct("<H")
+    _NINGUNO = 0xFFFF
+
+    def a_bytes(self) -> bytes:
+        t = self.triage
+        presencia = (self.temperatura is not None) << 1 | (t.temperatura is not None) << 2
+        partes = [self._CABECERA.pack(
+            self._VERSION, int(self.estado), self.paso_triage, presencia,
+            self.temperatura or 0.0,
+            t.respondidas, t.afirmativas, t.temperatura or 0.0,
+            -1 if t.intensidad is None else t.intensidad
+        )]
+        for texto in (self.enfermedad, self.enfermedad_propuesta, self.sintoma_reportado, t.duracion):
+            if texto is None:
+                partes.append(self._LARGO.pack(self._NINGUNO))
+            else:
+                datos = texto.encode("utf-8")
+                if len(datos) >= self._NINGUNO:
+                    # Recortar sin partir un carácter multibyte
+                    datos = datos[:self._NINGUNO - 1].decode("utf-8", "ignore").encode("utf-8")
+                partes.append(self._LARGO.pack(len(datos)))
+                partes.append(datos)
+        return b"".join(partes)
+
+    @classmethod
+    def desde_bytes(cls, datos: bytes) -> "ContextoConversacion":
+        """Reconstruye un contexto. Lanza ValueError si los datos no son de este formato."""
+        try:
+            (version, estado, paso, presencia, temperatura,
+             respondidas, afirmativas, temp_triage, intensidad) = cls._CABECERA.unpack_from(datos, 0)
+            if version != cls._VERSION:
+                raise ValueError(f"Versión de contexto desconocida: {version}")
+
+            pos = cls._CABECERA.size
+            textos = []
+            for _ in range(4):
+                largo, = cls._LARGO.unpack_from(datos, pos)
+                pos += cls._LARGO.size
+                if largo == cls._NINGUNO:
+                    textos.append(None)
+                else:
+                    textos.append(bytes(datos[pos:pos + largo]).decode("utf-8"))
+                    pos += largo
+
+            ctx = cls()
+            ctx.estado = EstadoConversacion(estado)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Contexto corrupto: {e}") from e
+
+        ctx.paso_triage = paso
+        ctx.temperatura = temperatura if presencia & 2 else None
+        ctx.enfermedad, ctx.enfermedad_propuesta, ctx.sintoma_reportado, duracion = textos
+        t = ctx.triage
+        t.respondidas, t.afirmativas = respondidas, afirmativas
+        t.temperatura = temp_triage if presencia & 4 else None
+        t.intensidad = None if intensidad < 0 else intensidad
+        t.duracion = duracion
+        return ctx
@@ -1,38 +1,213 @@
 import os
+import time
+import base64
+import binascii
+import threading
+from datetime import datetime
 import oracledb
-from config import DB_USER, DB_PASS, DB_DSN_ALIAS, DB_WALLET_DIR, DB_WALLET_PASS
-from typing import Optional, Tuple, List, Dict
-import re
+from config import (
+    DB_USER, DB_PASS, DB_DSN_ALIAS, DB_WALLET_DIR, DB_WALLET_PASS,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_INCREMENT, DB_POOL_TIMEOUT_MS,
+    DB_POOL_PING_INTERVAL, DB_POOL_IDLE_TIMEOUT,
+    DB_WRITE_BEHIND, DB_JOURNAL_DIR, DB_JOURNAL_BATCH, DB_JOURNAL_INTERVAL,
+    DB_JOURNAL_MAX_QUEUE, DB_JOURNAL_FSYNC, CONVERSACIONES_PAGINA_MAX,
+    MENSAJES_ARRAYSIZE,
+    REC_CACHE_MAX_ENTRADAS, REC_CACHE_TTL
+)
+from message_journal import obtener_diario, unir_pendientes, DiarioMensajes
+from cache import CacheTTL
+from text_utils import normalizar
+from chat_titles import generar_titulo_desde_mensaje, TITULO_POR_DEFECTO
+from typing import Optional, Tuple, List, Dict, Iterator
+
+_pool: Optional[oracledb.ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> oracledb.ConnectionPool:
+    """
+    Crea (una sola vez por proceso) el pool de sesiones Oracle.
+    Se crea de forma perezosa para que cada worker de gunicorn tenga su propio pool
+    después del fork.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            os.environ["TNS_ADMIN"] = DB_WALLET_DIR
+            _pool = oracledb.create_pool(
+                user=DB_USER,
+                password=DB_PASS,
+                dsn=DB_DSN_ALIAS,
+                config_dir=DB_WALLET_DIR,
+                wallet_location=DB_WALLET_DIR,
+                wallet_password=(DB_WALLET_PASS or None),
+                ssl_server_dn_match=True,
+                min=DB_POOL_MIN,
+                max=DB_POOL_MAX,
+                increment=DB_POOL_INCREMENT,
+                getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                wait_timeout=DB_POOL_TIMEOUT_MS,
+                ping_interval=DB_POOL_PING_INTERVAL,
+                timeout=DB_POOL_IDLE_TIMEOUT
+            )
+            _pool_pid = pid
+            print(f"✅ Pool Oracle creado (min={DB_POOL_MIN}, max={DB_POOL_MAX}, pid={pid})")
+    return _pool
 
 def get_connection():
     """
-    Establece y retorna una conexión a la base de datos Oracle utilizando un wallet.
+    Obtiene una conexión del pool de sesiones Oracle.
+    Llamar a close() sobre la conexión la devuelve al pool en lugar de cerrarla.
+    El pool solo hace ping a las sesiones que llevan inactivas más de DB_POOL_PING_INTERVAL.
     """
     try:
-        os.environ["TNS_ADMIN"] = DB_WALLET_DIR
-
-        conn = oracledb.connect(
-            user=DB_USER,
-            password=DB_PASS,
-            dsn=DB_DSN_ALIAS,
-            config_dir=DB_WALLET_DIR,
-            wallet_location=DB_WALLET_DIR,
-            wallet_password=(DB_WALLET_PASS or None),
-            ssl_server_dn_match=True
-        )
-
-        with conn.cursor() as c:
-            c.execute("select 1 from dual")
-            c.fetchone()
-        return conn
-
+        return _get_pool().acquire()
     except oracledb.Error as e:
         print("❌ Error al conectar con Oracle:", str(e))
         return None
 
+def obtener_estadisticas_pool() -> Dict:
+    """Devuelve estadísticas del pool de sesiones del proceso actual."""
+    if _pool is None or _pool_pid != os.getpid():
+        return {"activo": False}
+    return {
+        "activo": True,
+        "abiertas": _pool.opened,
+        "ocupadas": _pool.busy,
+        "min": _pool.min,
+        "max": _pool.max,
+        "incremento": _pool.increment,
+        "espera_max_ms": _pool.wait_timeout,
+        "ping_interval": _pool.ping_interval
+    }
+
+def cerrar_pool():
+    """Cierra el pool de sesiones del proceso actual (p. ej. al apagar el worker)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            try:
+                _pool.close(force=True)
+            except oracledb.Error as e:
+                print(f"⚠️ Error al cerrar el pool: {e}")
+        _pool = None
+        _pool_pid = None
+
+def _insertar_retornando_id(cursor, sql: str, **params) -> int:
+    """
+    Ejecuta un INSERT que termina en 'RETURNING <ID> INTO :nuevo_id' y devuelve el ID generado.
+    El valor de la secuencia se toma dentro del mismo INSERT, así que es un único viaje a la BD.
+    """
+    nuevo_id = cursor.var(oracledb.NUMBER)
+    cursor.execute(sql, nuevo_id=nuevo_id, **params)
+    return int(nuevo_id.getvalue()[0])
+
+class SesionBD:
+    """
+    Unidad de trabajo: una sola conexión del pool compartida por todas las lecturas y
+    escrituras de un turno, confirmada con un único commit al final.
+    Las funciones de este módulo aceptan 'sesion' opcional; si se pasa, usan su conexión
+    y no hacen commit, rollback ni close por su cuenta: si fallan marcan la sesión como
+    fallida y al salir se revierte el turno entero.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._al_confirmar = []
+        self.fallida = False
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def marcar_fallida(self):
+        """Hace que la sesión se revierta al salir en lugar de confirmarse."""
+        self.fallida = True
+
+    def al_confirmar(self, accion):
+        """Registra una acción a ejecutar solo después de que el commit tenga éxito."""
+        self._al_confirmar.append(accion)
+
+    def confirmar(self):
+        self.conn.commit()
+        acciones, self._al_confirmar = self._al_confirmar, []
+        for accion in acciones:
+            accion()
+
+    def revertir(self):
+        self.conn.rollback()
+        self._al_confirmar = []
+
+    def cerrar(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and not self.fallida:
+                self.confirmar()
+            else:
+                if exc_type is None:
+                    print("⚠️ Una escritura de la sesión falló; se revierte la unidad de trabajo completa")
+                self.revertir()
+        finally:
+            self.cerrar()
+
+def abrir_sesion() -> Optional[SesionBD]:
+    """Toma una conexión del pool y la envuelve en una unidad de trabajo."""
+    conn = get_connection()
+    return SesionBD(conn) if conn else None
+
+def _conexion(sesion: Optional[SesionBD]):
+    return sesion.conn if sesion else get_connection()
+
+def _confirmar(conn, sesion: Optional[SesionBD]):
+    if sesion is None:
+        conn.commit()
+
+def _revertir(conn, sesion: Optional[SesionBD]):
+    # Dentro de una sesión no se deshace nada aún: se marca y el turno entero se revierte al salir
+    if sesion is not None:
+        sesion.marcar_fallida()
+    elif conn:
+        conn.rollback()
+
+def _liberar(conn, sesion: Optional[SesionBD]):
+    if sesion is None and conn:
+        conn.close()
+
+TABLAS_CON_NOMBRE_CLAVE = (
+    ("SINTOMAS", "ID_SINTOMA"),
+    ("ENFERMEDADES", "ID_ENFERMEDAD"),
+    ("MEDICAMENTOS", "ID_MEDICAMENTO"),
+)
+
+def rellenar_nombres_clave(cursor) -> int:
+    """
+    Calcula NOMBRE_CLAVE en Python para las filas que aún no la tienen (las creadas por la
+    migración o cargadas después con SQL directo) y devuelve cuántas actualizó. Se hace
+    aquí y no en SQL para que la clave siga exactamente las reglas de clave_nombre.
+    No hace commit.
+    """
+    total = 0
+    for tabla, columna_id in TABLAS_CON_NOMBRE_CLAVE:
+        cursor.execute(f"SELECT {columna_id}, NOMBRE FROM ADMIN.{tabla} WHERE NOMBRE_CLAVE IS NULL")
+        filas = [(clave_nombre(nombre or ""), id_fila) for id_fila, nombre in cursor.fetchall()]
+        if filas:
+            cursor.executemany(f"UPDATE ADMIN.{tabla} SET NOMBRE_CLAVE = :1 WHERE {columna_id} = :2", filas)
+            total += len(filas)
+    return total
+
 def cargar_sintomas_y_reglas_desde_bd() -> Optional[Dict[str, List]]:
     """
     Consulta todos los datos necesarios para el motor de inferencia y los devuelve.
+    Antes completa NOMBRE_CLAVE de las filas insertadas sin ella, para que las búsquedas
+    por nombre las encuentren desde la primera carga o recarga de la base.
     """
     conn = get_connection()
     if conn is None:
@@ -41,12 +216,25 @@ def cargar_sintomas_y_reglas_desde_bd() -> Optional[Dict[str, List]]:
     try:
         cursor = conn.cursor()
 
+        try:
+            rellenadas = rellenar_nombres_clave(cursor)
+            if rellenadas:
+                conn.commit()
+                # Pueden haberse cacheado como "sin recomendación"
+                invalidar_cache_recomendaciones()
+                print(f"✅ NOMBRE_CLAVE completada en {rellenadas} filas")
+        except oracledb.Error as e:
+            # P. ej. la migración de NOMBRE_CLAVE aún no se aplicó; la carga sigue igual
+            print(f"⚠️ No se pudo completar NOMBRE_CLAVE: {e}")
+            conn.rollback()
+
         datos = {}
 
         cursor.execute("SELECT ID_SINTOMA, NOMBRE FROM ADMIN.SINTOMAS")
         datos['sintomas'] = cursor.fetchall()
 
-        cursor.execute("SELECT ID_ENFERMEDAD, NOMBRE FROM ADMIN.ENFERMEDADES")
+        cursor.outputtypehandler = _clob_como_texto
+        cursor.execute("SELECT ID_ENFERMEDAD, NOMBRE, DESCRIPCION FROM ADMIN.ENFERMEDADES")
         datos['enfermedades'] = cursor.fetchall()
 
         cursor.execute("SELECT ID_SINTOMA, ID_ENFERMEDAD, PESO FROM ADMIN.REGLAS_INFERENCIA")
@@ -68,10 +256,14 @@ def cargar_sintomas_y_reglas_desde_bd() -> Optional[Dict[str, List]]:
         if conn:
             conn.close()
 
-def crear_usuario(nombre: str, correo: str, password_hash: bytes) -> Optional[int]:
+class CorreoDuplicado(Exception):
+    """Ya existe un usuario con ese correo (restricción única, ORA-00001)."""
+
+def crear_usuario(nombre: str, correo: str, password_hash: bytes) -> Optional[Dict]:
     """
     Inserta un nuevo usuario en la base de datos.
-    Devuelve el ID del nuevo usuario si se crea correctamente.
+    Devuelve el registro creado ({"id_usuario", "nombre", "correo"}), tomando el ID del
+    propio INSERT, o None si hubo un error. Lanza CorreoDuplicado si el correo ya existe.
     """
     conn = get_connection()
     if not conn:
@@ -80,18 +272,21 @@ def crear_usuario(nombre: str, correo: str, password_hash: bytes) -> Optional[in
     try:
         cursor = conn.cursor()
 
-        new_user_id_var = cursor.var(oracledb.NUMBER)
-
-        cursor.execute("""
+        new_user_id = _insertar_retornando_id(cursor, """
             INSERT INTO ADMIN.USUARIOS (NOMBRE, CORREO, PASSWORD)
-            VALUES (:1, :2, :3)
-            RETURNING ID_USUARIO INTO :4
-        """, [nombre, correo, password_hash.decode('utf-8'), new_user_id_var])
-
-        new_user_id = new_user_id_var.getvalue()[0]
+            VALUES (:nombre, :correo, :password)
+            RETURNING ID_USUARIO INTO :nuevo_id
+        """, nombre=nombre, correo=correo, password=password_hash.decode('utf-8'))
 
         conn.commit()
-        return new_user_id
+        return {"id_usuario": new_user_id, "nombre": nombre, "correo": correo}
+    except oracledb.IntegrityError as e:
+        conn.rollback()
+        error, = e.args
+        if getattr(error, "code", None) == 1:
+            raise CorreoDuplicado(correo) from e
+        print(f"Error al crear usuario: {e}")
+        return None
     except oracledb.DatabaseError as e:
         print(f"Error al crear usuario: {e}")
         conn.rollback()
@@ -105,15 +300,13 @@ def _get_or_create_chat_id(cursor, user_id: str, conn):
     Crea una nueva sesión de chat en la tabla ADMIN.CHATS.
     """
     try:
-        cursor.execute("SELECT ADMIN.CHATS_SEQ.NEXTVAL FROM DUAL")
-        new_chat_id = cursor.fetchone()[0]
-
-        cursor.execute(
+        new_chat_id = _insertar_retornando_id(
+            cursor,
             """
             INSERT INTO ADMIN.CHATS (ID_CHAT, NOMBRE)
-            VALUES (:id, 'Chat Agente Médico')
-            """,
-            id=new_chat_id
+            VALUES (ADMIN.CHATS_SEQ.NEXTVAL, 'Chat Agente Médico')
+            RETURNING ID_CHAT INTO :nuevo_id
+            """
         )
 
         return new_chat_id
@@ -127,15 +320,11 @@ def _guardar_mensaje(cursor, id_chat, emisor, contenido, conn):
     Guarda un mensaje en la tabla ADMIN.MENSAJES.
     """
     try:
-        cursor.execute("SELECT ADMIN.MENSAJES_SEQ.NEXTVAL FROM DUAL")
-        new_message_id = cursor.fetchone()[0]
-
         cursor.execute(
             """
             INSERT INTO ADMIN.MENSAJES (ID_MENSAJE, ID_CHAT, EMISOR, CONTENIDO)
-            VALUES (:id_mensaje, :id_chat, :emisor, :contenido)
+            VALUES (ADMIN.MENSAJES_SEQ.NEXTVAL, :id_chat, :emisor, :contenido)
             """,
-            id_mensaje=new_message_id,
             id_chat=id_chat,
             emisor=emisor,
             contenido=contenido
@@ -146,6 +335,23 @@ def _guardar_mensaje(cursor, id_chat, emisor, contenido, conn):
         print(f"❌ Error al guardar mensaje: {str(e)}")
         return False
 
+# Recomendaciones (medicamento, dosis, duración) por ID de enfermedad y por nombre normalizado.
+# Solo cambian cuando el flujo de aprendizaje escribe, así que se invalidan en esas escrituras;
+# el TTL acota lo que puede tardar en verse una escritura hecha desde otro worker.
+_cache_recomendaciones = CacheTTL(REC_CACHE_MAX_ENTRADAS, REC_CACHE_TTL, nombre="recomendaciones")
+
+def invalidar_cache_recomendaciones():
+    _cache_recomendaciones.invalidar()
+
+def _invalidar_recomendaciones_tras_commit(sesion: Optional[SesionBD]):
+    if sesion is not None:
+        sesion.al_confirmar(invalidar_cache_recomendaciones)
+    else:
+        invalidar_cache_recomendaciones()
+
+def obtener_estadisticas_cache_recomendaciones() -> Dict:
+    return _cache_recomendaciones.estadisticas()
+
 def _guardar_o_actualizar_enfermedad_min(id_chat, nombre_enfermedad, min_value):
     """
     Función placeholder. Si necesitas persistir el estado de diagnóstico,
@@ -154,13 +360,41 @@ def _guardar_o_actualizar_enfermedad_min(id_chat, nombre_enfermedad, min_value):
     print(f"✅ Log: Chat {id_chat} - {nombre_enfermedad} tiene MIN_PESO={min_value}")
     return True
 
-def guardar_enfermedad(nombre: str, descripcion: str) -> Tuple[bool, Optional[int]]:
+def clave_nombre(nombre: str) -> str:
+    """
+    Clave canónica de un nombre (minúsculas, sin acentos) que se guarda en la columna
+    NOMBRE_CLAVE de SINTOMAS, ENFERMEDADES y MEDICAMENTOS. Las búsquedas por nombre
+    comparan contra esa columna indexada, así que "Neumonía" y "neumonia" son la misma fila.
+    """
+    return normalizar(nombre)
+
+def obtener_id_enfermedad_por_nombre(nombre: str, sesion: Optional[SesionBD] = None) -> Optional[int]:
+    """Devuelve el ID_ENFERMEDAD cuyo nombre coincide (sin distinguir mayúsculas ni acentos), o None."""
+    conn = _conexion(sesion)
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE NOMBRE_CLAVE = :clave",
+                clave=clave_nombre(nombre)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+    except oracledb.Error as e:
+        print(f"❌ Error al buscar enfermedad: {str(e)}")
+        return None
+    finally:
+        _liberar(conn, sesion)
+
+def guardar_enfermedad(nombre: str, descripcion: str, sesion: Optional[SesionBD] = None) -> Tuple[bool, Optional[int]]:
     """
     Guarda una nueva enfermedad en la tabla ADMIN.ENFERMEDADES.
     Si ya existe, actualiza su descripción y retorna su ID.
     Retorna (True, id) o (False, None).
     """
-    conn = get_connection()
+    conn = _conexion(sesion)
     if conn is None:
         return False, None
 
@@ -168,8 +402,8 @@ def guardar_enfermedad(nombre: str, descripcion: str) -> Tuple[bool, Optional[in
         with conn.cursor() as cursor:
             # Primero intentar obtener la enfermedad existente
             cursor.execute(
-                "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE UPPER(NOMBRE) = UPPER(:nombre)",
-                nombre=nombre
+                "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE NOMBRE_CLAVE = :clave",
+                clave=clave_nombre(nombre)
             )
             existing = cursor.fetchone()
 
@@ -186,33 +420,36 @@ def guardar_enfermedad(nombre: str, descripcion: str) -> Tuple[bool, Optional[in
                         descripcion=descripcion,
                         id=disease_id
                     )
-                    conn.commit()
+                    _confirmar(conn, sesion)
+                    _invalidar_recomendaciones_tras_commit(sesion)
                 return True, disease_id
 
             # Si no existe, intentar crear nueva con manejo de duplicados
             try:
-                cursor.execute("SELECT ADMIN.ENFERMEDADES_SEQ.NEXTVAL FROM DUAL")
-                new_disease_id = cursor.fetchone()[0]
-
-                cursor.execute(
+                new_disease_id = _insertar_retornando_id(
+                    cursor,
                     """
-                    INSERT INTO ADMIN.ENFERMEDADES (ID_ENFERMEDAD, NOMBRE, DESCRIPCION)
-                    VALUES (:id, :nombre, :descripcion)
+                    INSERT INTO ADMIN.ENFERMEDADES (ID_ENFERMEDAD, NOMBRE, NOMBRE_CLAVE, DESCRIPCION)
+                    VALUES (ADMIN.ENFERMEDADES_SEQ.NEXTVAL, :nombre, :clave, :descripcion)
+                    RETURNING ID_ENFERMEDAD INTO :nuevo_id
                     """,
-                    id=new_disease_id,
                     nombre=nombre,
+                    clave=clave_nombre(nombre),
                     descripcion=descripcion
                 )
 
-                conn.commit()
+                _confirmar(conn, sesion)
+                _invalidar_recomendaciones_tras_commit(sesion)
                 return True, new_disease_id
 
             except oracledb.IntegrityError as ie:
-                # Si falla por duplicado (constraint violation), intentar obtener el ID existente
-                conn.rollback()
+                # Si falla por duplicado (constraint violation), intentar obtener el ID existente.
+                # Oracle solo deshace el INSERT fallido, así que dentro de una sesión el turno sigue siendo válido
+                if sesion is None:
+                    conn.rollback()
                 cursor.execute(
-                    "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE UPPER(NOMBRE) = UPPER(:nombre)",
-                    nombre=nombre
+                    "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE NOMBRE_CLAVE = :clave",
+                    clave=clave_nombre(nombre)
                 )
                 existing_after = cursor.fetchone()
                 if existing_after:
@@ -220,47 +457,46 @@ def guardar_enfermedad(nombre: str, descripcion: str) -> Tuple[bool, Optional[in
                     return True, existing_after[0]
                 else:
                     print(f"❌ Error de integridad al guardar enfermedad: {str(ie)}")
+                    _revertir(conn, sesion)
                     return False, None
 
     except oracledb.Error as e:
         print(f"❌ Error al guardar enfermedad: {str(e)}")
         if conn:
-            conn.rollback()
+            _revertir(conn, sesion)
         return False, None
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
 
-def _guardar_medicamento_y_regla(nombre_medicamento: str, descripcion_medicamento: str, id_enfermedad: int, dosis: str, duracion: str) -> bool:
+def _guardar_medicamento_y_regla(nombre_medicamento: str, descripcion_medicamento: str, id_enfermedad: int, dosis: str, duracion: str, sesion: Optional[SesionBD] = None) -> bool:
     """
     Guarda un nuevo medicamento (si no existe) y crea una nueva regla
     de recomendación en la tabla ADMIN.RECOMENDACIONES.
     """
-    conn = get_connection()
+    conn = _conexion(sesion)
     if conn is None:
         return False
 
     try:
         with conn.cursor() as cursor:
             cursor.execute(
-                "SELECT ID_MEDICAMENTO FROM ADMIN.MEDICAMENTOS WHERE UPPER(NOMBRE) = UPPER(:nombre)",
-                nombre=nombre_medicamento
+                "SELECT ID_MEDICAMENTO FROM ADMIN.MEDICAMENTOS WHERE NOMBRE_CLAVE = :clave",
+                clave=clave_nombre(nombre_medicamento)
             )
             result = cursor.fetchone()
 
             if result:
                 id_medicamento = result[0]
             else:
-                cursor.execute("SELECT ADMIN.MEDICAMENTOS_SEQ.NEXTVAL FROM DUAL")
-                id_medicamento = cursor.fetchone()[0]
-
-                cursor.execute(
+                id_medicamento = _insertar_retornando_id(
+                    cursor,
                     """
-                    INSERT INTO ADMIN.MEDICAMENTOS (ID_MEDICAMENTO, NOMBRE, DESCRIPCION)
-                    VALUES (:id, :nombre, :descripcion)
+                    INSERT INTO ADMIN.MEDICAMENTOS (ID_MEDICAMENTO, NOMBRE, NOMBRE_CLAVE, DESCRIPCION)
+                    VALUES (ADMIN.MEDICAMENTOS_SEQ.NEXTVAL, :nombre, :clave, :descripcion)
+                    RETURNING ID_MEDICAMENTO INTO :nuevo_id
                     """,
-                    id=id_medicamento,
                     nombre=nombre_medicamento,
+                    clave=clave_nombre(nombre_medicamento),
                     descripcion=descripcion_medicamento
                 )
 
@@ -275,23 +511,28 @@ def _guardar_medicamento_y_regla(nombre_medicamento: str, descripcion_medicament
                 duracion=duracion
             )
 
-            conn.commit()
+            _confirmar(conn, sesion)
+            _invalidar_recomendaciones_tras_commit(sesion)
             return True
 
     except oracledb.Error as e:
         print(f"❌ Error al guardar medicamento y regla: {str(e)}")
-        conn.rollback()
+        _revertir(conn, sesion)
         return False
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
 
-def obtener_recomendacion_medicamento(nombre_enfermedad: str) -> Optional[Tuple[str, str, str]]:
+def obtener_recomendacion_medicamento(nombre_enfermedad: str, sesion: Optional[SesionBD] = None) -> Optional[Tuple[str, str, str]]:
     """
     Busca el medicamento recomendado (nombre), dosis y duración para una enfermedad
-    específica usando el NOMBRE de la enfermedad.
+    específica usando el NOMBRE de la enfermedad. Los aciertos de caché no tocan la BD.
     """
-    conn = get_connection()
+    clave = ("nombre", clave_nombre(nombre_enfermedad))
+    encontrado, recomendacion = _cache_recomendaciones.obtener(clave)
+    if encontrado:
+        return recomendacion
+
+    conn = _conexion(sesion)
     if conn is None:
         return None
 
@@ -303,24 +544,31 @@ def obtener_recomendacion_medicamento(nombre_enfermedad: str) -> Optional[Tuple[
                 FROM ADMIN.RECOMENDACIONES r
                 JOIN ADMIN.MEDICAMENTOS m ON r.ID_MEDICAMENTO = m.ID_MEDICAMENTO
                 JOIN ADMIN.ENFERMEDADES e ON r.ID_ENFERMEDAD = e.ID_ENFERMEDAD
-                WHERE UPPER(e.NOMBRE) = UPPER(:nombre)
+                WHERE e.NOMBRE_CLAVE = :clave
                 FETCH FIRST 1 ROWS ONLY
                 """,
-                nombre=nombre_enfermedad
+                clave=clave[1]
             )
-            return cursor.fetchone()
+            recomendacion = cursor.fetchone()
+            _cache_recomendaciones.guardar(clave, recomendacion)
+            return recomendacion
     except oracledb.Error as e:
         print(f"❌ Error al buscar recomendaciones: {str(e)}")
         return None
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
 
-def _obtener_medicamento_por_id(id_enfermedad: int) -> Optional[Tuple[str, str, str]]:
+def _obtener_medicamento_por_id(id_enfermedad: int, sesion: Optional[SesionBD] = None) -> Optional[Tuple[str, str, str]]:
     """
     Busca el medicamento recomendado (nombre, dosis, duración) para una enfermedad por su ID.
+    Los aciertos de caché no tocan la BD.
     """
-    conn = get_connection()
+    clave = ("id", id_enfermedad)
+    encontrado, recomendacion = _cache_recomendaciones.obtener(clave)
+    if encontrado:
+        return recomendacion
+
+    conn = _conexion(sesion)
     if conn is None:
         return None
 
@@ -336,18 +584,19 @@ def _obtener_medicamento_por_id(id_enfermedad: int) -> Optional[Tuple[str, str,
                 """,
                 id=id_enfermedad
             )
-            return cursor.fetchone()
+            recomendacion = cursor.fetchone()
+            _cache_recomendaciones.guardar(clave, recomendacion)
+            return recomendacion
     except oracledb.Error as e:
         print(f"❌ Error al obtener medicamento por ID de enfermedad: {str(e)}")
         return None
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
 
-def verificar_credenciales(correo: str, password_hash: str) -> Optional[Tuple[int, str]]:
+def obtener_usuario_para_login(correo: str) -> Optional[Tuple[int, str, str]]:
     """
-    Verifica las credenciales del usuario (correo y hash de contraseña).
-    Retorna una tupla (ID_USUARIO, NOMBRE) si las credenciales son válidas.
+    Devuelve (ID_USUARIO, PASSWORD, NOMBRE) del usuario con ese correo en una sola consulta,
+    o None si no existe. La comprobación del hash la hace password_hashing.
     """
     conn = get_connection()
     if conn is None:
@@ -356,198 +605,134 @@ def verificar_credenciales(correo: str, password_hash: str) -> Optional[Tuple[in
     try:
         with conn.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT ID_USUARIO, NOMBRE
-                FROM ADMIN.USUARIOS
-                WHERE CORREO = :correo AND PASSWORD = :password_hash
-                """,
-                correo=correo,
-                password_hash=password_hash
+                "SELECT ID_USUARIO, PASSWORD, NOMBRE FROM ADMIN.USUARIOS WHERE CORREO = :correo",
+                correo=correo
             )
             return cursor.fetchone()
 
     except oracledb.Error as e:
-        print(f"❌ Error al verificar credenciales: {str(e)}")
+        print(f"❌ Error al buscar usuario para login: {str(e)}")
         return None
     finally:
         if conn:
             conn.close()
 
-def crear_nueva_conversacion(user_id: int, primer_mensaje: str) -> Optional[int]:
+def crear_nueva_conversacion(user_id: int, primer_mensaje: str, sesion: Optional[SesionBD] = None) -> Optional[int]:
     """Crea un registro para una nueva conversación y devuelve su ID."""
-    conn = get_connection()
+    conn = _conexion(sesion)
     if not conn:
         return None
     try:
         cursor = conn.cursor()
 
-        # Verificar si la columna ID_USUARIO existe, si no, agregarla
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM USER_TAB_COLUMNS
-                WHERE TABLE_NAME = 'CHATS' AND COLUMN_NAME = 'ID_USUARIO'
-            """)
-            column_exists = cursor.fetchone()[0] > 0
-
-            if not column_exists:
-                cursor.execute("""
-                    ALTER TABLE ADMIN.CHATS ADD (ID_USUARIO NUMBER)
-                """)
-                conn.commit()
-                print("✅ Columna ID_USUARIO agregada a CHATS")
-        except Exception as e:
-            print(f"Advertencia al verificar/agregar columna: {e}")
-
-        cursor.execute("SELECT ADMIN.CHATS_SEQ.NEXTVAL FROM DUAL")
-        new_chat_id = cursor.fetchone()[0]
-
         # Generar un título más descriptivo basado en el primer mensaje
-        titulo_inicial = _generar_titulo_desde_mensaje(primer_mensaje) or "Nueva consulta"
+        titulo_inicial = generar_titulo_desde_mensaje(primer_mensaje)
 
         # Insertar en CHATS (tabla principal)
-        cursor.execute("""
+        new_chat_id = _insertar_retornando_id(cursor, """
             INSERT INTO ADMIN.CHATS (ID_CHAT, NOMBRE, ID_USUARIO)
-            VALUES (:1, :2, :3)
-        """, [new_chat_id, titulo_inicial, user_id])
+            VALUES (ADMIN.CHATS_SEQ.NEXTVAL, :titulo, :user_id)
+            RETURNING ID_CHAT INTO :nuevo_id
+        """, titulo=titulo_inicial, user_id=user_id)
 
-        conn.commit()
+        _confirmar(conn, sesion)
         return new_chat_id
     except oracledb.DatabaseError as e:
         print(f"Error específico dentro de crear_nueva_conversacion: {e}")
-        conn.rollback()
+        _revertir(conn, sesion)
         return None
     finally:
-        if conn:
-            conn.close()
-
-def _generar_titulo_desde_mensaje(mensaje: str) -> str:
-    """Genera un título descriptivo desde el mensaje del usuario."""
-    if not mensaje or not mensaje.strip():
-        return "Nueva conversación"
-
-    mensaje_lower = mensaje.lower().strip()
-
-    # Patrones comunes de síntomas para el título
-    patrones = {
-        r"\b(dolor de cabeza|cefalea|migraña)\b": "Dolor de cabeza",
-        r"\b(fiebre|temperatura|calentura)\b": "Fiebre",
-        r"\b(gripe|gripa|resfriado|catarro)\b": "Gripe",
-        r"\b(tos)\b": "Tos",
-        r"\b(dolor de garganta|garganta)\b": "Dolor de garganta",
-        r"\b(nariz tapada|congestión|congestionado)\b": "Congestión nasal",
-        r"\b(dolor de estómago|dolor abdominal|dolor de barriga)\b": "Dolor abdominal",
-        r"\b(dolor de cintura|dolor lumbar|lumbago)\b": "Dolor de cintura",
-        r"\b(dolor de espalda)\b": "Dolor de espalda",
-        r"\b(dolor al orinar|cistitis|infección urinaria)\b": "Problema urinario",
-        r"\b(náuseas|nausea|ganas de vomitar)\b": "Náuseas",
-        r"\b(mareo|mareado|vértigo)\b": "Mareos",
-        r"\b(cansancio|fatiga|agotamiento)\b": "Fatiga",
-        r"\b(diarrea)\b": "Diarrea",
-        r"\b(vómito|vomitar)\b": "Vómitos",
-        r"\b(alergia|alergias|alérgico)\b": "Alergias",
-        r"\b(asma|asmatico)\b": "Asma",
-        r"\b(rinitis)\b": "Rinitis",
-    }
-
-    for patron, titulo in patrones.items():
-        if re.search(patron, mensaje_lower):
-            return titulo
-
-    # Si es una pregunta sobre una enfermedad específica
-    match = re.search(r"(?:que es|qué es|sobre|acerca de)\s+(?:la |el )?([\w\s]{3,20})\??", mensaje_lower)
-    if match:
-        enfermedad = match.group(1).strip().title()
-        return enfermedad
-
-    # Si el mensaje es corto, usarlo como título (máximo 30 caracteres)
-    if len(mensaje) <= 30:
-        return mensaje.capitalize()
-
-    # Tomar las primeras palabras del mensaje
-    palabras = mensaje.split()[:4]
-    return " ".join(palabras).capitalize() + "..."
+        _liberar(conn, sesion)
 
-def actualizar_titulo_con_mensaje(conversation_id: int, mensaje: str):
-    """Actualiza el título del chat basándose en el mensaje del usuario."""
-    if not conversation_id or not mensaje:
-        return
+def actualizar_titulo_conversacion(conversation_id: int, titulo: str, solo_si_por_defecto: bool,
+                                   sesion: Optional[SesionBD] = None) -> bool:
+    """
+    Cambia el título del chat con un único UPDATE condicional, que no escribe nada si el
+    título ya es ese. Con solo_si_por_defecto=True únicamente reemplaza el título por defecto,
+    para no pisar uno personalizado. Retorna True si la fila cambió.
+    """
+    if not conversation_id or not titulo:
+        return False
 
-    conn = get_connection()
+    conn = _conexion(sesion)
     if not conn:
-        return
-
-    try:
-        cursor = conn.cursor()
-
-        # Verificar si el chat ya tiene un título personalizado (diferente de "Nueva conversación")
-        cursor.execute("""
-            SELECT NOMBRE FROM ADMIN.CHATS WHERE ID_CHAT = :1
-        """, [conversation_id])
-
-        row = cursor.fetchone()
-        if row and row[0] and row[0] != "Nueva conversación":
-            # Ya tiene un título personalizado, no sobreescribir
-            return
-
-        # Generar nuevo título desde el mensaje
-        nuevo_titulo = _generar_titulo_desde_mensaje(mensaje)
-
-        cursor.execute("""
-            UPDATE ADMIN.CHATS
-            SET NOMBRE = :1
-            WHERE ID_CHAT = :2
-        """, [nuevo_titulo, conversation_id])
+        return False
 
-        conn.commit()
-        print(f"✅ Título actualizado a: '{nuevo_titulo}'")
+    condicion = "(NOMBRE IS NULL OR NOMBRE = :por_defecto)" if solo_si_por_defecto else "(NOMBRE IS NULL OR NOMBRE <> :titulo)"
+    params = {"titulo": titulo, "id": conversation_id}
+    if solo_si_por_defecto:
+        params["por_defecto"] = TITULO_POR_DEFECTO
 
-    except Exception as e:
-        print(f"Error al actualizar título con mensaje: {e}")
-        if conn:
-            conn.rollback()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE ADMIN.CHATS
+                SET NOMBRE = :titulo
+                WHERE ID_CHAT = :id AND {condicion}
+            """, params)
+            cambiado = cursor.rowcount > 0
+        _confirmar(conn, sesion)
+        if cambiado:
+            print(f"✅ Título actualizado a: '{titulo}'")
+        return cambiado
+    except oracledb.Error as e:
+        print(f"❌ Error al actualizar título: {e}")
+        _revertir(conn, sesion)
+        return False
     finally:
-        if conn:
-            conn.close()
-
-def actualizar_titulo_chat(conversation_id: int, sintomas: list):
-    """Actualiza el título del chat con el síntoma principal detectado."""
-    print(f"🔄 Intentando actualizar título - ID: {conversation_id}, Síntomas: {sintomas}")
-
-    if not sintomas:
-        print("⚠️ No hay síntomas para actualizar título")
-        return
+        _liberar(conn, sesion)
 
+def _insertar_mensajes_lote(filas: List[Tuple[int, str, str]]) -> bool:
+    """
+    Inserta un lote de mensajes (id_chat, emisor, contenido) con un solo executemany.
+    Las filas rechazadas (p. ej. de un chat ya eliminado) se descartan sin bloquear el lote.
+    """
     conn = get_connection()
     if not conn:
-        print("❌ No se pudo conectar a la base de datos")
-        return
-
+        return False
     try:
-        # Usar el primer síntoma como título
-        titulo_sintoma = sintomas[0].capitalize()
-        print(f"📝 Nuevo título será: {titulo_sintoma}")
-
         cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE ADMIN.CHATS
-            SET NOMBRE = :1
-            WHERE ID_CHAT = :2
-        """, [titulo_sintoma, conversation_id])
-
-        rows_affected = cursor.rowcount
+        cursor.setinputsizes(None, None, oracledb.DB_TYPE_CLOB)
+        cursor.executemany("""
+            INSERT INTO ADMIN.MENSAJES (ID_CHAT, EMISOR, CONTENIDO)
+            VALUES (:1, :2, :3)
+        """, filas, batcherrors=True)
+        for error in cursor.getbatcherrors():
+            print(f"⚠️ Mensaje descartado en lote (fila {error.offset}): {error.message}")
         conn.commit()
-        print(f"✅ Título actualizado a: '{titulo_sintoma}' (Filas afectadas: {rows_affected})")
-    except Exception as e:
-        print(f"❌ Error al actualizar título: {e}")
-        import traceback
-        traceback.print_exc()
+        return True
+    except oracledb.DatabaseError as e:
+        print(f"Error al escribir lote de mensajes: {e}")
+        conn.rollback()
+        return False
     finally:
         if conn:
             conn.close()
 
-def guardar_mensaje_en_db(conversation_id: int, emisor: str, contenido: str):
-    """Guarda un mensaje en la tabla MENSAJES."""
-    conn = get_connection()
+def _diario_mensajes() -> Optional[DiarioMensajes]:
+    """Devuelve el diario de mensajes del proceso si el modo write-behind está activo."""
+    if not DB_WRITE_BEHIND:
+        return None
+    return obtener_diario(
+        DB_JOURNAL_DIR,
+        _insertar_mensajes_lote,
+        tam_lote=DB_JOURNAL_BATCH,
+        intervalo=DB_JOURNAL_INTERVAL,
+        max_cola=DB_JOURNAL_MAX_QUEUE,
+        fsync=DB_JOURNAL_FSYNC
+    )
+
+def guardar_mensaje_en_db(conversation_id: int, emisor: str, contenido: str, sesion: Optional[SesionBD] = None):
+    """
+    Guarda un mensaje en la tabla MENSAJES.
+    En modo write-behind el mensaje se anota en el diario local y se escribe por lotes
+    en segundo plano; si la cola está llena se escribe de forma síncrona.
+    """
+    diario = _diario_mensajes()
+    if diario and diario.encolar(conversation_id, emisor, contenido):
+        return
+
+    conn = _conexion(sesion)
     if not conn:
         return
     try:
@@ -556,95 +741,314 @@ def guardar_mensaje_en_db(conversation_id: int, emisor: str, contenido: str):
             INSERT INTO ADMIN.MENSAJES (ID_CHAT, EMISOR, CONTENIDO)
             VALUES (:1, :2, :3)
         """, [conversation_id, emisor, contenido])
-        conn.commit()
+        _confirmar(conn, sesion)
     except oracledb.DatabaseError as e:
         print(f"Error específico dentro de guardar_mensaje_en_db: {e}")
-        conn.rollback()
+        _revertir(conn, sesion)
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
+
+def _codificar_cursor_conversaciones(fecha_creacion, id_chat: int) -> str:
+    fecha = fecha_creacion.isoformat() if fecha_creacion else ""
+    return base64.urlsafe_b64encode(f"{fecha}|{id_chat}".encode("utf-8")).decode("ascii")
+
+def _decodificar_cursor_conversaciones(cursor_pagina: str) -> Tuple[Optional[datetime], int]:
+    """Devuelve (FECHA_CREACION, ID_CHAT) del cursor. Lanza ValueError si no es válido."""
+    try:
+        fecha, id_chat = base64.urlsafe_b64decode(cursor_pagina.encode("ascii")).decode("utf-8").split("|")
+        return (datetime.fromisoformat(fecha) if fecha else None), int(id_chat)
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError(f"Cursor de página inválido: {e}")
+
+def listar_conversaciones_por_usuario(user_id: int, limite: int = CONVERSACIONES_PAGINA_MAX,
+                                      cursor_pagina: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Obtiene una página de conversaciones de un usuario, de la más reciente a la más antigua.
+    La paginación es por clave (FECHA_CREACION, ID_CHAT): 'cursor_pagina' es el cursor
+    devuelto por la página anterior. Retorna (conversaciones, cursor_siguiente_o_None).
+    Lanza ValueError si el cursor no es válido.
+    """
+    limite = max(1, min(int(limite), CONVERSACIONES_PAGINA_MAX))
+    params = {"user_id": user_id, "limite": limite + 1}
+    filtro_cursor = ""
+    if cursor_pagina:
+        fecha, id_chat = _decodificar_cursor_conversaciones(cursor_pagina)
+        params["id_chat"] = id_chat
+        if fecha is None:
+            filtro_cursor = "AND c.FECHA_CREACION IS NULL AND c.ID_CHAT < :id_chat"
+        else:
+            params["fecha"] = fecha
+            filtro_cursor = """AND (c.FECHA_CREACION < :fecha
+                 OR (c.FECHA_CREACION = :fecha AND c.ID_CHAT < :id_chat)
+                 OR c.FECHA_CREACION IS NULL)"""
 
-def listar_conversaciones_por_usuario(user_id: int) -> List[Dict]:
-    """Obtiene una lista de todas las conversaciones de un usuario."""
     conn = get_connection()
     if not conn:
-        return []
+        return [], None
     try:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                c.ID_CHAT,
-                c.NOMBRE,
-                c.FECHA_CREACION,
-                (
-                    SELECT CONTENIDO
-                    FROM ADMIN.MENSAJES m
-                    WHERE m.ID_CHAT = c.ID_CHAT
-                    AND LOWER(m.EMISOR) = 'usuario'
-                    ORDER BY m.ID_MENSAJE ASC
-                    FETCH FIRST 1 ROWS ONLY
-                ) as PRIMER_MENSAJE
+        cursor.execute(f"""
+            SELECT c.ID_CHAT, c.NOMBRE, c.FECHA_CREACION
             FROM ADMIN.CHATS c
-            WHERE c.ID_USUARIO = :1
+            WHERE c.ID_USUARIO = :user_id
             AND EXISTS (
                 SELECT 1 FROM ADMIN.MENSAJES m
                 WHERE m.ID_CHAT = c.ID_CHAT
             )
-            ORDER BY c.FECHA_CREACION DESC
-        """, [user_id])
-
-        conversaciones = []
-        for row in cursor.fetchall():
-            id_chat = row[0]
-            titulo_actual = row[1]
-            fecha_creacion = row[2]
-            primer_mensaje = row[3]
+            {filtro_cursor}
+            ORDER BY c.FECHA_CREACION DESC NULLS LAST, c.ID_CHAT DESC
+            FETCH FIRST :limite ROWS ONLY
+        """, params)
+        filas = cursor.fetchall()
 
-            # No modificar títulos automáticamente aquí
-            titulo = titulo_actual
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = _codificar_cursor_conversaciones(filas[-1][2], filas[-1][0])
 
+        conversaciones = []
+        for id_chat, titulo, fecha_creacion in filas:
             conversaciones.append({
                 "id_conversacion": id_chat,
                 "titulo": titulo,
                 "fecha_inicio": fecha_creacion.strftime("%Y-%m-%d %H:%M:%S") if fecha_creacion else ""
             })
 
-        return conversaciones
+        return conversaciones, siguiente
     except oracledb.DatabaseError as e:
         print(f"Error al listar conversaciones: {e}")
-        return []
+        return [], None
     finally:
         if conn:
             conn.close()
 
-def obtener_mensajes_por_conversacion(conversation_id: int) -> List[Dict]:
-    """Obtiene todos los mensajes de una conversación específica."""
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
+def _clob_como_texto(cursor, metadata):
+    """Output type handler: trae los CLOB como str en el mismo fetch, sin un viaje extra por fila."""
+    if metadata.type_code is oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+def _mensaje_a_dict(emisor: str, contenido: Optional[str], id_mensaje: Optional[int]) -> Dict:
+    return {
+        "id_mensaje": id_mensaje,
+        "role": "user" if emisor.lower() == "usuario" else "assistant",
+        "content": contenido or ""
+    }
+
+def iterar_mensajes_por_conversacion(conversation_id: int, sesion: Optional[SesionBD] = None,
+                                     antes_de_id: Optional[int] = None,
+                                     limite: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Recorre los mensajes de una conversación en orden cronológico sin materializar la lista.
+    Con 'antes_de_id' y/o 'limite' devuelve solo los 'limite' mensajes más recientes
+    anteriores a ese ID. La conexión se libera al agotar o cerrar el generador.
+    """
+    filtro = "AND ID_MENSAJE < :antes_de_id" if antes_de_id is not None else ""
+    params = {"id_chat": conversation_id}
+    if antes_de_id is not None:
+        params["antes_de_id"] = antes_de_id
+
+    if limite is not None:
+        params["limite"] = limite
+        sql = f"""
+            SELECT EMISOR, CONTENIDO, ID_MENSAJE FROM (
+                SELECT EMISOR, CONTENIDO, ID_MENSAJE
+                FROM ADMIN.MENSAJES
+                WHERE ID_CHAT = :id_chat {filtro}
+                ORDER BY ID_MENSAJE DESC
+                FETCH FIRST :limite ROWS ONLY
+            )
+            ORDER BY ID_MENSAJE ASC
+        """
+    else:
+        sql = f"""
             SELECT EMISOR, CONTENIDO, ID_MENSAJE
             FROM ADMIN.MENSAJES
-            WHERE ID_CHAT = :1
+            WHERE ID_CHAT = :id_chat {filtro}
             ORDER BY ID_MENSAJE ASC
-        """, [conversation_id])
+        """
 
-        mensajes = []
-        for row in cursor.fetchall():
-            contenido = row[1].read() if hasattr(row[1], 'read') else str(row[1])
-            mensajes.append({
-                "role": "user" if row[0].lower() == "usuario" else "assistant",
-                "content": contenido
-            })
-        return mensajes
+    conn = _conexion(sesion)
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.arraysize = MENSAJES_ARRAYSIZE
+        cursor.prefetchrows = MENSAJES_ARRAYSIZE + 1
+        cursor.outputtypehandler = _clob_como_texto
+
+        # En modo write-behind se agregan los mensajes de este worker que aún no llegaron a la BD.
+        # Solo aplica a la página más reciente, que es donde pueden estar.
+        diario = _diario_mensajes() if antes_de_id is None else None
+        if diario:
+            def leer_bd():
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+            filas = unir_pendientes(*diario.leer_consistente(conversation_id, leer_bd), limite)
+        else:
+            cursor.execute(sql, params)
+            filas = cursor
+
+        for emisor, contenido, id_mensaje in filas:
+            yield _mensaje_a_dict(emisor, contenido, id_mensaje)
     except oracledb.DatabaseError as e:
         print(f"Error al obtener mensajes: {e}")
-        return []
     finally:
-        if conn:
-            conn.close()
+        _liberar(conn, sesion)
+
+def obtener_mensajes_por_conversacion(conversation_id: int, sesion: Optional[SesionBD] = None,
+                                      antes_de_id: Optional[int] = None,
+                                      limite: Optional[int] = None) -> List[Dict]:
+    """Obtiene los mensajes de una conversación específica (opcionalmente paginados)."""
+    return list(iterar_mensajes_por_conversacion(conversation_id, sesion, antes_de_id, limite))
+
+def _blob_como_bytes(cursor, metadata):
+    """Output type handler: trae los BLOB como bytes en el mismo fetch."""
+    if metadata.type_code is oracledb.DB_TYPE_BLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+
+def leer_estado_conversacion(user_id: int, conversation_id: int, version_conocida: int = 0,
+                             sesion: Optional[SesionBD] = None) -> Optional[Tuple[int, Optional[bytes]]]:
+    """
+    Lee el estado guardado de una conversación. Retorna (VERSION, DATOS), con DATOS en None
+    si la versión coincide con 'version_conocida' (así una copia en caché vigente no vuelve
+    a viajar); (0, None) si no hay estado guardado; None si falló la consulta.
+    """
+    conn = _conexion(sesion)
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.outputtypehandler = _blob_como_bytes
+            cursor.execute(
+                """
+                SELECT VERSION, CASE WHEN VERSION = :version THEN NULL ELSE DATOS END
+                FROM ADMIN.ESTADO_CONVERSACION
+                WHERE ID_USUARIO = :user_id AND ID_CHAT = :id_chat
+                """,
+                version=version_conocida,
+                user_id=user_id,
+                id_chat=conversation_id
+            )
+            row = cursor.fetchone()
+            return (row[0], row[1]) if row else (0, None)
+    except oracledb.Error as e:
+        print(f"❌ Error al leer el estado de la conversación: {e}")
+        return None
+    finally:
+        _liberar(conn, sesion)
+
+def guardar_estado_conversacion(user_id: int, conversation_id: int, datos: bytes,
+                                sesion: Optional[SesionBD] = None) -> Optional[int]:
+    """Guarda (inserta o reemplaza) el estado de una conversación y retorna su nueva VERSION."""
+    conn = _conexion(sesion)
+    if conn is None:
+        return None
+
+    params = {"user_id": user_id, "id_chat": conversation_id, "datos": datos}
+    try:
+        with conn.cursor() as cursor:
+            cursor.setinputsizes(datos=oracledb.DB_TYPE_BLOB)
+            version = cursor.var(int)
+            cursor.execute(
+                """
+                UPDATE ADMIN.ESTADO_CONVERSACION
+                SET DATOS = :datos, VERSION = VERSION + 1, FECHA_ACTUALIZACION = SYSTIMESTAMP
+                WHERE ID_USUARIO = :user_id AND ID_CHAT = :id_chat
+                RETURNING VERSION INTO :version
+                """,
+                version=version,
+                **params
+            )
+            if cursor.rowcount:
+                nueva_version = version.getvalue()[0]
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO ADMIN.ESTADO_CONVERSACION (ID_USUARIO, ID_CHAT, VERSION, DATOS)
+                    VALUES (:user_id, :id_chat, 1, :datos)
+                    """,
+                    **params
+                )
+                nueva_version = 1
+        _confirmar(conn, sesion)
+        return nueva_version
+    except oracledb.Error as e:
+        # Incluye el caso de dos turnos simultáneos insertando la misma fila: gana el primero
+        print(f"❌ Error al guardar el estado de la conversación: {e}")
+        _revertir(conn, sesion)
+        return None
+    finally:
+        _liberar(conn, sesion)
+
+def conversacion_pertenece_a_usuario(conversation_id: int, user_id: int) -> bool:
+    """True si el chat existe y es del usuario (búsqueda por clave primaria)."""
+    conn = get_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM ADMIN.CHATS WHERE ID_CHAT = :id AND ID_USUARIO = :user_id",
+                id=conversation_id,
+                user_id=user_id
+            )
+            return cursor.fetchone() is not None
+    except oracledb.Error as e:
+        print(f"❌ Error al comprobar el dueño de la conversación: {e}")
+        return False
+    finally:
+        conn.close()
+
+def revocar_sesion(jti: str, expira: int) -> bool:
+    """
+    Registra un token revocado (logout) para que todos los workers lo rechacen hasta su
+    expiración. De paso purga los que ya expiraron.
+    """
+    conn = get_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM ADMIN.SESIONES_REVOCADAS WHERE EXPIRA <= :ahora",
+                ahora=int(time.time())
+            )
+            try:
+                cursor.execute(
+                    "INSERT INTO ADMIN.SESIONES_REVOCADAS (JTI, EXPIRA) VALUES (:jti, :expira)",
+                    jti=jti,
+                    expira=expira
+                )
+            except oracledb.IntegrityError:
+                pass  # Ya estaba revocado
+        conn.commit()
+        return True
+    except oracledb.Error as e:
+        print(f"❌ Error al revocar la sesión: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def listar_sesiones_revocadas() -> Optional[Dict[str, int]]:
+    """{JTI: EXPIRA} de los tokens revocados que aún no expiraron; None si falló la consulta."""
+    conn = get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT JTI, EXPIRA FROM ADMIN.SESIONES_REVOCADAS WHERE EXPIRA > :ahora",
+                ahora=int(time.time())
+            )
+            return {jti: int(expira) for jti, expira in cursor.fetchall()}
+    except oracledb.Error as e:
+        print(f"❌ Error al leer las sesiones revocadas: {e}")
+        return None
+    finally:
+        conn.close()
 
 def eliminar_conversacion(conversation_id: int) -> bool:
     """Elimina una conversación y todos sus mensajes asociados."""
@@ -659,6 +1063,11 @@ def eliminar_conversacion(conversation_id: int) -> bool:
             WHERE ID_CHAT = :1
         """, [conversation_id])
 
+        cursor.execute("""
+            DELETE FROM ADMIN.ESTADO_CONVERSACION
+            WHERE ID_CHAT = :1
+        """, [conversation_id])
+
         cursor.execute("""
             DELETE FROM ADMIN.CHATS
             WHERE ID_CHAT = :1
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos, cada worker puede sondear
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# El resultado del descubrimiento se comparte entre workers (y reinicios) en un archivo
+# JSON {"modelo": <nombre o null>, "descubierto_en": <epoch>}. Un bloqueo sobre
+# "<archivo>.lock" hace que solo un proceso sondee a la vez; los demás esperan y leen
+# lo que ese encontró.
+
+def leer_resultado(ruta: str, ttl: float, ttl_negativo: float) -> Tuple[bool, Optional[str]]:
+    """
+    Devuelve (vigente, modelo). 'vigente' es False si no hay archivo, está corrupto o
+    venció; un resultado sin modelo (null) vence antes, a los 'ttl_negativo' segundos.
+    """
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        modelo = datos.get("modelo")
+        edad = time.time() - float(datos["descubierto_en"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return False, None
+    return edad < (ttl if modelo else ttl_negativo), modelo
+
+def escribir_resultado(ruta: str, modelo: Optional[str]):
+    """Escribe el resultado de forma atómica (archivo temporal + rename)."""
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"modelo": modelo, "descubierto_en": time.time()}, f)
+    os.replace(temporal, ruta)
+
+@contextmanager
+def bloqueo_archivo(ruta: str):
+    """Bloqueo exclusivo entre procesos de la misma máquina (no-op sin fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(f"{ruta}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def sondear_modelos(nombres: Iterable[str], probar: Callable[[str, float], None],
+                    presupuesto: float) -> Optional[str]:
+    """
+    Prueba los modelos en orden hasta que uno responda, sin pasarse de 'presupuesto'
+    segundos en total. probar(nombre, timeout) debe lanzar una excepción si el modelo
+    no sirve. Retorna el primer nombre que funcionó, o None.
+    """
+    limite = time.monotonic() + presupuesto
+    for nombre in nombres:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            logger.warning("⚠️ Se agotó el tiempo para descubrir un modelo de Gemini")
+            break
+        try:
+            probar(nombre, restante)
+            return nombre
+        except Exception as e:
+            logger.debug(f"⚠️ Modelo {nombre} no disponible: {str(e)[:100]}")
+    return None
+
+def descubrir_modelo(ruta: str, ttl: float, ttl_negativo: float, nombres: Iterable[str],
+                     probar: Callable[[str, float], None], presupuesto: float) -> Optional[str]:
+    """
+    Usa el resultado compartido si está vigente; si no, toma el bloqueo, vuelve a mirar
+    (otro worker pudo haberlo renovado mientras se esperaba) y solo entonces sondea.
+    """
+    vigente, modelo = leer_resultado(ruta, ttl, ttl_negativo)
+    if vigente:
+        return modelo
+    with bloqueo_archivo(ruta):
+        vigente, modelo = leer_resultado(ruta, ttl, ttl_negativo)
+        if vigente:
+            return modelo
+        modelo = sondear_modelos(nombres, probar, presupuesto)
+        try:
+            escribir_resultado(ruta, modelo)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el modelo descubierto: {e}")
+        return modelo
@@ -1,57 +1,77 @@
-import os
+import math
 import logging
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
 
+from cache import CacheTTL
+from text_utils import normalizar
+from conversation_context import ContextoConversacion
+from llm_client import ClienteLLM, Disyuntor, CircuitoAbierto
+from llm_providers import ProveedorLLM, crear_proveedor_llm
+from config import (
+    LLM_PLAZO_SEGUNDOS, LLM_REINTENTOS, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_HEDGE_PERCENTIL, LLM_HEDGE_MIN_MUESTRAS, LLM_HILOS, LLM_DISYUNTOR_VENTANA,
+    LLM_DISYUNTOR_MIN_LLAMADAS, LLM_DISYUNTOR_UMBRAL_ERROR, LLM_DISYUNTOR_ENFRIAMIENTO,
+    LLM_CACHE_MAX_ENTRADAS, LLM_CACHE_TTL, LLM_CACHE_HISTORIAL_MAX
+)
+
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 logger = logging.getLogger(__name__)
 
-# Intentar importar Gemini, pero no fallar si no está disponible
-GEMINI_ENABLED = False
-model = None
-
-try:
-    import google.generativeai as genai
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-
-    if GEMINI_API_KEY and GEMINI_API_KEY != 'your_gemini_api_key_here':
-        genai.configure(api_key=GEMINI_API_KEY)
-        # Intentar con los modelos más recientes disponibles (Gemini 2.0/2.5)
-        model_names = [
-            'models/gemini-2.0-flash',
-            'models/gemini-2.5-flash',
-            'gemini-2.0-flash',
-            'gemini-2.5-flash',
-            'models/gemini-2.0-flash-exp',
-            'models/gemini-flash-latest'
-        ]
-        model_loaded = False
-
-        for model_name in model_names:
-            try:
-                model = genai.GenerativeModel(model_name)
-                # Hacer una prueba simple para verificar que funciona
-                test_response = model.generate_content("Hola")
-                GEMINI_ENABLED = True
-                model_loaded = True
-                logger.info(f"✅ Gemini AI activado (modelo: {model_name})")
-                break
-            except Exception as e:
-                logger.debug(f"⚠️ Modelo {model_name} no disponible: {str(e)[:100]}")
-                continue
+# El LLM se usa a través de un proveedor (llm_providers): Gemini en producción o el
+# simulador local si LLM_PROVIDER=local. Mientras no esté disponible se usa el fallback.
+_proveedor = crear_proveedor_llm()
 
-        if not model_loaded:
-            logger.warning("⚠️ Ningún modelo de Gemini disponible - usando modo fallback")
-    else:
-        logger.warning("⚠️ Gemini API key no configurada - usando modo fallback")
-except ImportError:
-    logger.warning("⚠️ google-generativeai no instalado - usando modo fallback")
-    logger.info("💡 Para instalar: pip install google-generativeai")
-except Exception as e:
-    logger.error(f"⚠️ Error al inicializar Gemini: {e} - usando modo fallback")
+# Todas las generaciones pasan por este cliente: plazo, reintentos, hedging y disyuntor
+_cliente_llm = ClienteLLM(
+    _proveedor.nombre, LLM_PLAZO_SEGUNDOS, LLM_REINTENTOS, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_HEDGE_PERCENTIL, LLM_HEDGE_MIN_MUESTRAS, LLM_HILOS,
+    Disyuntor(LLM_DISYUNTOR_VENTANA, LLM_DISYUNTOR_MIN_LLAMADAS,
+              LLM_DISYUNTOR_UMBRAL_ERROR, LLM_DISYUNTOR_ENFRIAMIENTO)
+)
+
+# Respuestas ya generadas para consultas iniciales, por huella clínica (ver _huella_clinica).
+# Se guarda el texto del modelo sin el marco del disclaimer, que se recalcula en cada turno.
+_cache_respuestas = CacheTTL(LLM_CACHE_MAX_ENTRADAS, LLM_CACHE_TTL, nombre="respuestas_llm")
+
+def _huella_clinica(sintomas: List[str], diagnostico_previo: Optional[str],
+                    contexto: ContextoConversacion, historial: Optional[List[Dict]]) -> Optional[tuple]:
+    """
+    Clave de la caché de respuestas: síntomas (sin orden ni duplicados), diagnóstico previo,
+    tramo de temperatura de 0.5 °C (los umbrales de urgencia, 38.0 y 39.5, caen en el borde
+    de un tramo) y triaje. El texto literal del mensaje no entra, por eso solo se usa en
+    conversaciones que empiezan. None si esta consulta no debe pasar por la caché.
+    """
+    if historial and len(historial) > LLM_CACHE_HISTORIAL_MAX:
+        return None
+    if not sintomas and not diagnostico_previo:
+        return None
+    temperatura = contexto.temperatura
+    t = contexto.triage
+    return (
+        tuple(sorted({normalizar(s) for s in sintomas})),
+        normalizar(diagnostico_previo) if diagnostico_previo else "",
+        None if temperatura is None else math.floor(temperatura * 2) / 2,
+        t.afirmativas,
+        t.intensidad,
+        normalizar(t.duracion) if t.duracion else ""
+    )
+
+def gemini_disponible() -> bool:
+    """
+    True si el proveedor está listo y el disyuntor no está abierto. Nunca espera: si el
+    descubrimiento del modelo sigue en curso, es False.
+    """
+    return _proveedor.disponible() and not _cliente_llm.disyuntor.esta_abierto()
+
+def obtener_estadisticas_llm() -> Dict:
+    datos = _cliente_llm.estadisticas()
+    datos["proveedor"] = _proveedor.estadisticas()
+    datos["cache_respuestas"] = _cache_respuestas.estadisticas()
+    return datos
 
 SINTOMAS_EMERGENCIA = [
     "dolor de pecho", "dolor en el pecho", "opresion en el pecho",
@@ -138,11 +158,11 @@ Los síntomas que describes podrían indicar una situación GRAVE que requiere a
 
 **NO ESPERES** - Busca ayuda profesional AHORA."""
 
-def agregar_disclaimer_medico(respuesta: str, nivel_urgencia: str = "bajo") -> str:
-    """Agrega disclaimer médico apropiado según el nivel de urgencia."""
+def _marco_disclaimer(nivel_urgencia: str) -> Tuple[str, str]:
+    """(texto antes, texto después) de la respuesta según el nivel de urgencia."""
 
     if nivel_urgencia == "emergencia":
-        return f"{generar_alerta_emergencia()}\n\n{respuesta}"
+        return f"{generar_alerta_emergencia()}\n\n", ""
 
     disclaimer = "\n\n---\n\n⚠️ **RECORDATORIO IMPORTANTE:** "
 
@@ -153,14 +173,47 @@ def agregar_disclaimer_medico(respuesta: str, nivel_urgencia: str = "bajo") -> s
     else:
         disclaimer += "Esta información es orientativa y NO reemplaza una consulta médica profesional."
 
-    return respuesta + disclaimer
+    return "", disclaimer
+
+def agregar_disclaimer_medico(respuesta: str, nivel_urgencia: str = "bajo") -> str:
+    """Agrega disclaimer médico apropiado según el nivel de urgencia."""
+    antes, despues = _marco_disclaimer(nivel_urgencia)
+    return f"{antes}{respuesta}{despues}"
+
+def _generar_en_streaming(proveedor: ProveedorLLM, prompt: str, emitir: Callable[[str], None], antes: str,
+                          timeout: float) -> Tuple[str, bool]:
+    """
+    Genera con stream=True y pasa cada fragmento a 'emitir' en cuanto llega, precedido
+    por 'antes' (la alerta, si la hay). Si el stream se corta después de haber emitido
+    algo, se conserva lo recibido; si no llegó nada, propaga el error (y se puede reintentar).
+    Retorna (texto, completo); completo es False si el stream se cortó.
+    """
+    partes: List[str] = []
+    completo = True
+    try:
+        for texto in proveedor.generar_stream(prompt, timeout):
+            if not texto:
+                continue
+            if not partes and antes:
+                emitir(antes)
+            partes.append(texto)
+            emitir(texto)
+    except Exception as e:
+        if not partes:
+            raise
+        completo = False
+        logger.warning(f"⚠️ Streaming del LLM interrumpido tras {len(partes)} fragmentos: {e}")
+    if not partes:
+        raise ValueError("El LLM no devolvió texto")
+    return "".join(partes), completo
 
 def generar_respuesta_con_gemini(
     mensaje_usuario: str,
     sintomas_detectados: List[str],
-    contexto: Dict,
+    contexto: ContextoConversacion,
     diagnostico_previo: Optional[str] = None,
-    historial_conversacion: Optional[List[Dict]] = None
+    historial_conversacion: Optional[List[Dict]] = None,
+    emitir: Optional[Callable[[str], None]] = None
 ) -> tuple[str, str]:
     """
     Genera respuesta usando Gemini AI con contexto de conversación completo.
@@ -171,6 +224,8 @@ def generar_respuesta_con_gemini(
         contexto: Contexto médico actual
         diagnostico_previo: Diagnóstico previo si existe
         historial_conversacion: Historial completo de mensajes [{"role": "user"/"assistant", "content": "..."}]
+        emitir: Si se indica, la respuesta se genera en streaming y cada fragmento se pasa
+            a esta función en cuanto llega (alerta primero, disclaimer al final)
 
     Returns:
         tuple: (respuesta, nivel_urgencia)
@@ -179,10 +234,14 @@ def generar_respuesta_con_gemini(
 
     # Detectar emergencia primero
     if detectar_emergencia_medica(mensaje_usuario):
-        return generar_alerta_emergencia(), "emergencia"
+        alerta = generar_alerta_emergencia()
+        if emitir:
+            emitir(alerta)
+        return alerta, "emergencia"
 
     # Si Gemini no está habilitado, retornar None para usar fallback
-    if not GEMINI_ENABLED:
+    proveedor = _proveedor
+    if not proveedor.disponible():
         logger.warning("Gemini no disponible - usando lógica tradicional")
         return None, "medio"
 
@@ -216,19 +275,19 @@ def generar_respuesta_con_gemini(
 {conversacion_formateada}
 🩺 CONTEXTO CLÍNICO:
 - Síntomas detectados: {', '.join(sintomas_detectados) if sintomas_detectados else 'Ninguno detectado en este mensaje'}
-- Temperatura: {contexto.get('temperatura', 'No reportada')}°C
+- Temperatura: {contexto.temperatura if contexto.temperatura is not None else 'No reportada'}°C
 """
 
         if diagnostico_previo:
             contexto_medico += f"- Diagnóstico preliminar previo: {diagnostico_previo}\n"
 
-        if contexto.get('triage', {}).get('respuestas'):
-            resp_triage = contexto['triage']['respuestas']
+        if not contexto.triage.vacia():
+            resp_triage = contexto.triage
             contexto_medico += f"""
 INFORMACIÓN ADICIONAL DEL TRIAJE:
-- Intensidad del malestar: {resp_triage.get('intensidad', 'No especificada')}/10
-- Duración: {resp_triage.get('duracion', 'No especificada')}
-- Otros síntomas: {', '.join([k for k, v in resp_triage.items() if v and k not in ['temperatura', 'intensidad', 'duracion']])}
+- Intensidad del malestar: {resp_triage.intensidad if resp_triage.intensidad is not None else 'No especificada'}/10
+- Duración: {resp_triage.duracion if resp_triage.duracion is not None else 'No especificada'}
+- Otros síntomas: {', '.join(resp_triage.marcas_afirmativas())}
 """
 
         prompt_completo = f"{PROMPT_SISTEMA}\n\n{contexto_medico}"
@@ -237,17 +296,44 @@ INFORMACIÓN ADICIONAL DEL TRIAJE:
         logger.debug(f"🔍 Prompt enviado a Gemini (primeros 500 chars):\n{prompt_completo[:500]}...")
         logger.debug(f"📏 Longitud total del prompt: {len(prompt_completo)} caracteres")
 
+        # Determinar nivel de urgencia (depende del mensaje y el contexto, no de la respuesta,
+        # así que se conoce antes de generar y el marco puede emitirse en su sitio)
+        nivel_urgencia = determinar_nivel_urgencia(mensaje_usuario, sintomas_detectados, contexto)
+        antes, despues = _marco_disclaimer(nivel_urgencia)
+
         # Llamar a Gemini
-        response = model.generate_content(prompt_completo)
-        respuesta_generada = response.text
+        generada_aqui = False
+
+        def generar() -> Tuple[str, bool]:
+            nonlocal generada_aqui
+            generada_aqui = True
+            if emitir is None:
+                texto = _cliente_llm.llamar(lambda timeout: proveedor.generar(prompt_completo, timeout))
+                return texto, True
+            return _cliente_llm.llamar_en_linea(
+                lambda timeout: _generar_en_streaming(proveedor, prompt_completo, emitir, antes, timeout)
+            )
+
+        huella = _huella_clinica(sintomas_detectados, diagnostico_previo, contexto, historial_conversacion)
+        if huella is None or nivel_urgencia == "emergencia":
+            respuesta_generada, _ = generar()
+        else:
+            # Con la misma huella en curso en otro hilo, se espera su respuesta en vez de
+            # repetir la llamada; una respuesta cortada a medias no se guarda
+            respuesta_generada, _ = _cache_respuestas.obtener_o_calcular(
+                huella, generar, guardar_si=lambda r: r[1], espera=LLM_PLAZO_SEGUNDOS
+            )
+            if not generada_aqui:
+                logger.info("♻️ Respuesta del LLM servida desde caché")
+                if emitir:
+                    emitir(f"{antes}{respuesta_generada}")
+        if emitir and despues:
+            emitir(despues)
 
         logger.debug(f"💬 Respuesta de Gemini (primeros 200 chars): {respuesta_generada[:200]}...")
 
-        # Determinar nivel de urgencia basado en la respuesta
-        nivel_urgencia = determinar_nivel_urgencia(mensaje_usuario, sintomas_detectados, contexto)
-
         # Agregar disclaimer apropiado
-        respuesta_final = agregar_disclaimer_medico(respuesta_generada, nivel_urgencia)
+        respuesta_final = f"{antes}{respuesta_generada}{despues}"
 
         # Log para debug
         logger.info(f"✅ Respuesta generada con Gemini (urgencia: {nivel_urgencia}) | Historial: {len(historial_conversacion) if historial_conversacion else 0} mensajes")
@@ -256,11 +342,14 @@ INFORMACIÓN ADICIONAL DEL TRIAJE:
             logger.debug(f"Prompt completo length: {len(prompt_completo)} caracteres")
         return respuesta_final, nivel_urgencia
 
+    except CircuitoAbierto:
+        logger.warning("⚡ Disyuntor de Gemini abierto - usando lógica tradicional")
+        return None, "medio"
     except Exception as e:
         logger.error(f"❌ Error al generar respuesta con Gemini: {e}")
         return None, "medio"
 
-def determinar_nivel_urgencia(mensaje: str, sintomas: List[str], contexto: Dict) -> str:
+def determinar_nivel_urgencia(mensaje: str, sintomas: List[str], contexto: ContextoConversacion) -> str:
     """Determina el nivel de urgencia basado en síntomas y contexto."""
 
     # Emergencia ya fue detectada antes
@@ -268,7 +357,7 @@ def determinar_nivel_urgencia(mensaje: str, sintomas: List[str], contexto: Dict)
         return "emergencia"
 
     # Alto: fiebre muy alta, múltiples síntomas severos
-    temp = contexto.get('temperatura')
+    temp = contexto.temperatura
     if temp is not None and temp >= 39.5:
         return "alto"
 
@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+
+from database import cargar_sintomas_y_reglas_desde_bd
+from text_utils import normalizar
+from symptom_matcher import construir_automata
+from scoring import MatrizReglas
+
+class BaseConocimiento:
+    """
+    Instantánea inmutable de la base de conocimiento del motor de inferencia.
+
+    Se construye de una vez a partir de cargar_sintomas_y_reglas_desde_bd() y nunca se
+    modifica: una recarga crea una instancia nueva y la publica con una sola asignación,
+    así que quien ya tiene una referencia la sigue viendo consistente.
+    """
+
+    __slots__ = (
+        "version", "cargada_en",
+        "id_por_sintoma", "nombre_por_sintoma", "enfermedades",
+        "reglas_por_sintoma", "sinonimos", "automata", "matriz"
+    )
+
+    def __init__(self, version: int, datos: Dict[str, List]):
+        sintomas = datos.get("sintomas", [])
+        enfermedades = datos.get("enfermedades", [])
+        reglas = datos.get("reglas", [])
+        sinonimos = datos.get("sinonimos", [])
+
+        reglas_por_sintoma: Dict[int, List[Tuple[int, float]]] = {}
+        for id_sintoma, id_enfermedad, peso in reglas:
+            reglas_por_sintoma.setdefault(id_sintoma, []).append((id_enfermedad, float(peso)))
+
+        _asignar = object.__setattr__
+        _asignar(self, "version", version)
+        _asignar(self, "cargada_en", time.time())
+        # nombre normalizado del síntoma -> ID_SINTOMA
+        _asignar(self, "id_por_sintoma", MappingProxyType({normalizar(nombre): id_s for id_s, nombre in sintomas}))
+        # ID_SINTOMA -> nombre normalizado
+        _asignar(self, "nombre_por_sintoma", MappingProxyType({id_s: normalizar(nombre) for id_s, nombre in sintomas}))
+        # ID_ENFERMEDAD -> (NOMBRE, DESCRIPCION)
+        _asignar(self, "enfermedades", MappingProxyType({id_e: (nombre, desc or "") for id_e, nombre, desc in enfermedades}))
+        # ID_SINTOMA -> ((ID_ENFERMEDAD, PESO), ...)
+        _asignar(self, "reglas_por_sintoma", MappingProxyType({k: tuple(v) for k, v in reglas_por_sintoma.items()}))
+        # ((sinónimo normalizado, nombre normalizado del síntoma), ...)
+        _asignar(self, "sinonimos", tuple((normalizar(sin), normalizar(nombre)) for nombre, sin in sinonimos if sin))
+        # Se recompila con cada versión: un cambio de sinónimos en la BD llega con la siguiente recarga
+        _asignar(self, "automata", construir_automata(self.sinonimos))
+        # Pesos de las reglas como matriz dispersa síntoma × enfermedad
+        _asignar(self, "matriz", MatrizReglas(self.reglas_por_sintoma))
+
+    def __setattr__(self, nombre, valor):
+        raise AttributeError("BaseConocimiento es inmutable")
+
+    @classmethod
+    def vacia(cls) -> "BaseConocimiento":
+        return cls(0, {})
+
+    def esta_cargada(self) -> bool:
+        return self.version > 0
+
+_base: BaseConocimiento = BaseConocimiento.vacia()
+_lock_recarga = threading.Lock()
+_evento_recarga = threading.Event()
+_hilo_pid: Optional[int] = None
+_ultimo_intento = 0.0
+_REINTENTO_MIN_SEGUNDOS = 30
+
+def recargar_base() -> bool:
+    """Lee la BD y publica una nueva versión de la base de conocimiento."""
+    global _base, _ultimo_intento
+    with _lock_recarga:
+        _ultimo_intento = time.time()
+        datos = cargar_sintomas_y_reglas_desde_bd()
+        if datos is None:
+            print("⚠️ No se pudo recargar la base de conocimiento; se mantiene la versión actual")
+            return False
+        nueva = BaseConocimiento(_base.version + 1, datos)
+        _base = nueva
+    print(f"✅ Base de conocimiento v{nueva.version} cargada: {len(nueva.id_por_sintoma)} síntomas, "
+          f"{len(nueva.enfermedades)} enfermedades, {len(nueva.sinonimos)} sinónimos")
+    return True
+
+def obtener_base() -> BaseConocimiento:
+    """
+    Devuelve la versión vigente. Si aún no se pudo cargar nunca, intenta cargarla
+    (como máximo una vez cada _REINTENTO_MIN_SEGUNDOS para no castigar cada petición).
+    """
+    base = _base
+    if not base.esta_cargada() and time.time() - _ultimo_intento >= _REINTENTO_MIN_SEGUNDOS:
+        recargar_base()
+        base = _base
+    return base
+
+def solicitar_recarga_base():
+    """Pide al hilo de fondo una recarga anticipada (p. ej. después de aprender algo nuevo)."""
+    _evento_recarga.set()
+
+def iniciar_base_conocimiento(intervalo: float):
+    """
+    Carga la base al arrancar y lanza el hilo que la recarga cada 'intervalo' segundos
+    o cuando se solicita. Se ejecuta una vez por proceso.
+    """
+    global _hilo_pid
+    if _hilo_pid == os.getpid():
+        return
+    _hilo_pid = os.getpid()
+    recargar_base()
+
+    def _bucle():
+        while True:
+            _evento_recarga.wait(intervalo)
+            _evento_recarga.clear()
+            try:
+                recargar_base()
+            except Exception as e:
+                print(f"❌ Error al recargar la base de conocimiento: {e}")
+
+    threading.Thread(target=_bucle, name="recarga-base-conocimiento", daemon=True).start()
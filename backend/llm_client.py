@@ -0,0 +1,285 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class PlazoAgotado(Exception):
+    """La llamada al LLM no terminó dentro de su plazo."""
+
+class CircuitoAbierto(Exception):
+    """El disyuntor está abierto: no se llama al LLM hasta que pase el enfriamiento."""
+
+class Disyuntor:
+    """
+    Disyuntor por tasa de error. Cuenta los resultados de la última 'ventana' de segundos;
+    con al menos 'min_llamadas' y una proporción de fallos >= 'umbral_error' se abre y
+    rechaza todo durante 'enfriamiento' segundos. Después deja pasar una sola llamada de
+    prueba (semiabierto): si sale bien se cierra, si falla vuelve a abrirse.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, ventana: float, min_llamadas: int, umbral_error: float, enfriamiento: float):
+        self.ventana = ventana
+        self.min_llamadas = max(min_llamadas, 1)
+        self.umbral_error = umbral_error
+        self.enfriamiento = enfriamiento
+        self._resultados = deque()   # (instante, exito)
+        self._fallos = 0
+        self._estado = self.CERRADO
+        self._abierto_desde = 0.0
+        self._sonda_en_curso = False
+        self._lock = threading.Lock()
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def _purgar(self, ahora: float):
+        while self._resultados and self._resultados[0][0] <= ahora - self.ventana:
+            _, exito = self._resultados.popleft()
+            if not exito:
+                self._fallos -= 1
+
+    def _abrir(self, ahora: float):
+        self._estado = self.ABIERTO
+        self._abierto_desde = ahora
+        self._resultados.clear()
+        self._fallos = 0
+        self.aperturas += 1
+        logger.warning(f"⚡ Disyuntor del LLM abierto durante {self.enfriamiento:.0f}s")
+
+    def permitir(self) -> bool:
+        """Decide si una llamada puede salir. Quien recibe True debe llamar a registrar()."""
+        ahora = time.monotonic()
+        with self._lock:
+            if self._estado == self.ABIERTO:
+                if ahora - self._abierto_desde < self.enfriamiento:
+                    self.rechazadas += 1
+                    return False
+                self._estado = self.SEMIABIERTO
+                self._sonda_en_curso = False
+            if self._estado == self.SEMIABIERTO:
+                if self._sonda_en_curso:
+                    self.rechazadas += 1
+                    return False
+                self._sonda_en_curso = True
+            return True
+
+    def registrar(self, exito: bool):
+        ahora = time.monotonic()
+        with self._lock:
+            if self._estado == self.SEMIABIERTO:
+                self._sonda_en_curso = False
+                if exito:
+                    self._estado = self.CERRADO
+                    logger.info("✅ Disyuntor del LLM cerrado de nuevo")
+                else:
+                    self._abrir(ahora)
+                return
+            if self._estado == self.ABIERTO:
+                return
+            self._resultados.append((ahora, exito))
+            if not exito:
+                self._fallos += 1
+            self._purgar(ahora)
+            total = len(self._resultados)
+            if total >= self.min_llamadas and self._fallos / total >= self.umbral_error:
+                self._abrir(ahora)
+
+    def esta_abierto(self) -> bool:
+        """True si ahora mismo se rechazarían las llamadas (no reserva la llamada de prueba)."""
+        with self._lock:
+            return (self._estado == self.ABIERTO
+                    and time.monotonic() - self._abierto_desde < self.enfriamiento)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            self._purgar(time.monotonic())
+            return {
+                "estado": self._estado,
+                "llamadas_ventana": len(self._resultados),
+                "fallos_ventana": self._fallos,
+                "aperturas": self.aperturas,
+                "rechazadas": self.rechazadas
+            }
+
+class ClienteLLM:
+    """
+    Envoltura para las llamadas a un LLM. Cada llamada lógica tiene un plazo total; dentro
+    de él se reintenta ante errores con backoff exponencial y jitter completo, y el
+    disyuntor registra un único resultado por llamada lógica.
+
+    llamar() ejecuta la función en un pool de hilos propio, de modo que quien llama deja de
+    esperar al vencer el plazo aunque el SDK siga bloqueado. Si la primera petición tarda
+    más que el percentil 'hedge_percentil' de las latencias recientes, se lanza una segunda
+    en paralelo y se usa la que termine antes.
+
+    llamar_en_linea() es para el streaming: se ejecuta en el hilo que llama y sin hedging,
+    porque los fragmentos ya emitidos no se pueden retirar; el plazo lo aplica la propia
+    función con el timeout que recibe.
+    """
+
+    def __init__(self, nombre: str, plazo: float, reintentos: int, backoff_base: float,
+                 backoff_max: float, hedge_percentil: float, hedge_min_muestras: int,
+                 hilos: int, disyuntor: Disyuntor):
+        self.nombre = nombre
+        self.plazo = plazo
+        self.reintentos = max(reintentos, 0)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentil = hedge_percentil
+        self.hedge_min_muestras = max(hedge_min_muestras, 1)
+        self.hilos = max(hilos, 1)
+        self.disyuntor = disyuntor
+        self._latencias = deque(maxlen=256)
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self.llamadas = 0
+        self.errores = 0
+        self.plazos_agotados = 0
+        self.reintentos_hechos = 0
+        self.hedges = 0
+        self.hedges_ganadores = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Un pool por proceso, creado de forma perezosa (gunicorn hace fork)
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix=f"llm-{self.nombre}")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _percentil(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencias) < self.hedge_min_muestras:
+                return None
+            ordenadas = sorted(self._latencias)
+        return ordenadas[min(int(len(ordenadas) * p / 100), len(ordenadas) - 1)]
+
+    def _anotar_latencia(self, segundos: float):
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def _contar(self, atributo: str):
+        with self._lock:
+            setattr(self, atributo, getattr(self, atributo) + 1)
+
+    def llamar(self, funcion: Callable[[float], T], plazo: Optional[float] = None) -> T:
+        """
+        Ejecuta funcion(timeout) con plazo, reintentos y hedging. Lanza CircuitoAbierto sin
+        llamar si el disyuntor está abierto, PlazoAgotado si vence el plazo, o el último
+        error de la función si se agotan los reintentos.
+        """
+        return self._ejecutar(self._intento_en_pool, funcion, plazo)
+
+    def llamar_en_linea(self, funcion: Callable[[float], T], plazo: Optional[float] = None) -> T:
+        """Como llamar(), pero en el hilo actual y sin hedging (ver la docstring de la clase)."""
+        return self._ejecutar(self._intento_en_linea, funcion, plazo)
+
+    def _ejecutar(self, intento, funcion, plazo: Optional[float]):
+        if not self.disyuntor.permitir():
+            raise CircuitoAbierto(f"Disyuntor de {self.nombre} abierto")
+        self._contar("llamadas")
+        limite = time.monotonic() + (plazo if plazo is not None else self.plazo)
+        try:
+            resultado = self._con_reintentos(intento, funcion, limite)
+        except Exception as e:
+            self.disyuntor.registrar(False)
+            if isinstance(e, PlazoAgotado):
+                self._contar("plazos_agotados")
+            else:
+                self._contar("errores")
+            raise
+        self.disyuntor.registrar(True)
+        return resultado
+
+    def _con_reintentos(self, intento, funcion, limite: float):
+        for n in range(self.reintentos + 1):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise PlazoAgotado(f"Plazo de {self.nombre} agotado")
+            try:
+                return intento(funcion, restante)
+            except PlazoAgotado:
+                raise
+            except Exception as e:
+                espera = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** n)))
+                if n == self.reintentos or time.monotonic() + espera >= limite:
+                    raise
+                logger.warning(f"⚠️ Error en {self.nombre} (intento {n + 1}), reintentando en {espera:.2f}s: {e}")
+                self._contar("reintentos_hechos")
+                time.sleep(espera)
+
+    def _intento_en_linea(self, funcion, restante: float):
+        inicio = time.monotonic()
+        resultado = funcion(restante)
+        self._anotar_latencia(time.monotonic() - inicio)
+        return resultado
+
+    def _intento_en_pool(self, funcion, restante: float):
+        pool = self._get_pool()
+        inicio = time.monotonic()
+        primero = pool.submit(funcion, restante)
+        lanzados = {primero: inicio}
+        pendientes = {primero}
+        demora_hedge = self._percentil(self.hedge_percentil) if self.hedge_percentil > 0 else None
+        ultimo_error: Optional[BaseException] = None
+
+        while pendientes:
+            transcurrido = time.monotonic() - inicio
+            quedan = restante - transcurrido
+            if quedan <= 0:
+                break
+            cubrir = demora_hedge is not None and len(lanzados) == 1
+            espera = min(quedan, max(demora_hedge - transcurrido, 0.0)) if cubrir else quedan
+            hechos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                error = futuro.exception()
+                if error is None:
+                    self._anotar_latencia(time.monotonic() - lanzados[futuro])
+                    if futuro is not primero:
+                        self._contar("hedges_ganadores")
+                    return futuro.result()
+                ultimo_error = error
+            if cubrir and pendientes and time.monotonic() - inicio >= demora_hedge:
+                # La primera petición va más lenta de lo habitual: se lanza otra en paralelo
+                quedan = restante - (time.monotonic() - inicio)
+                respaldo = pool.submit(funcion, quedan)
+                lanzados[respaldo] = time.monotonic()
+                pendientes.add(respaldo)
+                self._contar("hedges")
+
+        if pendientes:
+            # Los hilos siguen hasta que el SDK respete su propio timeout; quien llama ya no espera
+            for futuro in pendientes:
+                futuro.cancel()
+            raise PlazoAgotado(f"Plazo de {self.nombre} agotado ({restante:.1f}s)")
+        raise ultimo_error
+
+    def estadisticas(self) -> Dict:
+        p50 = self._percentil(50)
+        p95 = self._percentil(95)
+        with self._lock:
+            datos = {
+                "llamadas": self.llamadas,
+                "errores": self.errores,
+                "plazos_agotados": self.plazos_agotados,
+                "reintentos": self.reintentos_hechos,
+                "hedges": self.hedges,
+                "hedges_ganadores": self.hedges_ganadores,
+                "latencia_p50": round(p50, 3) if p50 is not None else None,
+                "latencia_p95": round(p95, 3) if p95 is not None else None,
+                "plazo": self.plazo
+            }
+        datos["disyuntor"] = self.disyuntor.estadisticas()
+        return datos
@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Optional
+
+from gemini_discovery import descubrir_modelo
+from config import (
+    GEMINI_MODELOS, GEMINI_DESCUBRIMIENTO_ARCHIVO, GEMINI_DESCUBRIMIENTO_TTL,
+    GEMINI_DESCUBRIMIENTO_REINTENTO, GEMINI_DESCUBRIMIENTO_PRESUPUESTO,
+    LLM_PROVIDER, LLM_LOCAL_LATENCIA_MEDIANA, LLM_LOCAL_LATENCIA_SIGMA,
+    LLM_LOCAL_TASA_FALLOS, LLM_LOCAL_TASA_COLGADAS, LLM_LOCAL_FRAGMENTOS, LLM_LOCAL_SEMILLA
+)
+
+logger = logging.getLogger(__name__)
+
+class ProveedorLLM(ABC):
+    """
+    Lo mínimo que gemini_service necesita de un LLM. 'timeout' son los segundos que le
+    quedan a la llamada (los pone llm_client.ClienteLLM); el proveedor debe respetarlo.
+    """
+
+    nombre = "llm"
+
+    @abstractmethod
+    def disponible(self) -> bool:
+        """True si puede atender ya. Nunca espera."""
+
+    @abstractmethod
+    def generar(self, prompt: str, timeout: float) -> str:
+        ...
+
+    @abstractmethod
+    def generar_stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        """Devuelve los fragmentos de texto en orden, a medida que se generan."""
+
+    @abstractmethod
+    def contar_tokens(self, texto: str, timeout: float) -> int:
+        ...
+
+    def estadisticas(self) -> Dict:
+        return {"proveedor": self.nombre}
+
+class ProveedorGemini(ProveedorLLM):
+    """
+    Gemini vía google.generativeai. El modelo se descubre en segundo plano (ver
+    gemini_discovery): crear el proveedor no hace llamadas de red y ninguna petición espera
+    a que termine; mientras no haya modelo, disponible() es False.
+    """
+
+    nombre = "gemini"
+
+    def __init__(self, api_key: Optional[str]):
+        self._genai = None
+        self._modelo = None
+        self._nombre_modelo: Optional[str] = None
+        self._lock = threading.Lock()
+        self._descubrimiento_pid: Optional[int] = None
+        self._ultimo_descubrimiento = 0.0
+
+        # Intentar importar Gemini, pero no fallar si no está disponible
+        try:
+            import google.generativeai as genai
+            if api_key and api_key != 'your_gemini_api_key_here':
+                genai.configure(api_key=api_key)
+                self._genai = genai
+            else:
+                logger.warning("⚠️ Gemini API key no configurada - usando modo fallback")
+        except ImportError:
+            logger.warning("⚠️ google-generativeai no instalado - usando modo fallback")
+            logger.info("💡 Para instalar: pip install google-generativeai")
+        except Exception as e:
+            logger.error(f"⚠️ Error al inicializar Gemini: {e} - usando modo fallback")
+
+        self.iniciar_descubrimiento()
+
+    def _probar_modelo(self, nombre: str, timeout: float):
+        # count_tokens no genera texto ni consume cuota de generación
+        self._genai.GenerativeModel(nombre).count_tokens("Hola", request_options={"timeout": timeout})
+
+    def _descubrir(self):
+        try:
+            nombre = descubrir_modelo(
+                GEMINI_DESCUBRIMIENTO_ARCHIVO, GEMINI_DESCUBRIMIENTO_TTL, GEMINI_DESCUBRIMIENTO_REINTENTO,
+                GEMINI_MODELOS, self._probar_modelo, GEMINI_DESCUBRIMIENTO_PRESUPUESTO
+            )
+        except Exception as e:
+            logger.error(f"⚠️ Error al descubrir el modelo de Gemini: {e} - usando modo fallback")
+            return
+        if nombre:
+            self._modelo = self._genai.GenerativeModel(nombre)
+            self._nombre_modelo = nombre
+            logger.info(f"✅ Gemini AI activado (modelo: {nombre})")
+        else:
+            logger.warning("⚠️ Ningún modelo de Gemini disponible - usando modo fallback")
+
+    def iniciar_descubrimiento(self):
+        """
+        Lanza el descubrimiento del modelo en un hilo de fondo: una vez por proceso y, si no se
+        encontró ninguno, otra vez cuando hayan pasado GEMINI_DESCUBRIMIENTO_REINTENTO segundos.
+        """
+        if self._genai is None:
+            return
+        with self._lock:
+            if self._descubrimiento_pid == os.getpid() and (
+                self._modelo is not None
+                or time.time() - self._ultimo_descubrimiento < GEMINI_DESCUBRIMIENTO_REINTENTO
+            ):
+                return
+            self._descubrimiento_pid = os.getpid()
+            self._ultimo_descubrimiento = time.time()
+        threading.Thread(target=self._descubrir, name="descubrimiento-gemini", daemon=True).start()
+
+    def disponible(self) -> bool:
+        if self._modelo is None:
+            self.iniciar_descubrimiento()
+        return self._modelo is not None
+
+    def _modelo_listo(self):
+        modelo = self._modelo
+        if modelo is None:
+            raise RuntimeError("Gemini no disponible")
+        return modelo
+
+    def generar(self, prompt: str, timeout: float) -> str:
+        return self._modelo_listo().generate_content(prompt, request_options={"timeout": timeout}).text
+
+    def generar_stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        respuesta = self._modelo_listo().generate_content(
+            prompt, stream=True, request_options={"timeout": timeout}
+        )
+        for chunk in respuesta:
+            yield chunk.text
+
+    def contar_tokens(self, texto: str, timeout: float) -> int:
+        return self._modelo_listo().count_tokens(texto, request_options={"timeout": timeout}).total_tokens
+
+    def estadisticas(self) -> Dict:
+        return {"proveedor": self.nombre, "modelo": self._nombre_modelo}
+
+class FalloSimulado(Exception):
+    """Error inyectado por ProveedorLocal."""
+
+# Respuestas del proveedor local, con el formato que PROMPT_SISTEMA pide a Gemini
+_RESPUESTAS_LOCALES = (
+    "**Posible diagnóstico:** Resfriado común\n\n**Descripción:** Infección viral leve de las vías "
+    "respiratorias altas.\n\n**Tratamiento:**\n• Medicamento: Paracetamol\n• Dosis: 500mg cada 8h\n"
+    "• Duración: 3-5 días\n\n**Recomendaciones:**\n• Hidrátate bien\n• Descansa lo suficiente",
+    "**Posible diagnóstico:** Gripe (influenza)\n\n**Descripción:** Infección viral con fiebre, "
+    "dolor muscular y cansancio.\n\n**Tratamiento:**\n• Medicamento: Ibuprofeno\n• Dosis: 400mg cada 6-8h\n"
+    "• Duración: 3-5 días\n\n**Recomendaciones:**\n• Reposo en casa\n• Vigila la temperatura",
+    "**Posible diagnóstico:** Gastroenteritis\n\n**Descripción:** Inflamación del estómago y el "
+    "intestino, normalmente por un virus.\n\n**Tratamiento:**\n• Medicamento: Suero de rehidratación oral\n"
+    "• Dosis: a pequeños sorbos tras cada deposición\n• Duración: hasta que cedan los síntomas\n\n"
+    "**Recomendaciones:**\n• Dieta blanda\n• Evita lácteos unos días",
+    "Entiendo. Para orientarte mejor, ¿desde cuándo tienes estos síntomas y has tenido fiebre?",
+)
+
+class ProveedorLocal(ProveedorLLM):
+    """
+    Simulador determinista para medir el camino del LLM sin red. La respuesta depende solo
+    del hash del prompt (el mismo prompt da siempre el mismo texto); la latencia sigue una
+    log-normal con la mediana y sigma dadas. Con probabilidad 'tasa_fallos' lanza
+    FalloSimulado al instante y con 'tasa_colgadas' no responde hasta agotar el timeout.
+    """
+
+    nombre = "local"
+
+    def __init__(self, latencia_mediana: float, latencia_sigma: float, tasa_fallos: float = 0.0,
+                 tasa_colgadas: float = 0.0, fragmentos: int = 8, semilla: Optional[int] = None):
+        self.latencia_mediana = latencia_mediana
+        self.latencia_sigma = latencia_sigma
+        self.tasa_fallos = tasa_fallos
+        self.tasa_colgadas = tasa_colgadas
+        self.fragmentos = max(fragmentos, 1)
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.fallos = 0
+        self.colgadas = 0
+
+    def disponible(self) -> bool:
+        return True
+
+    def respuesta_para(self, prompt: str) -> str:
+        huella = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{_RESPUESTAS_LOCALES[int(huella[:8], 16) % len(_RESPUESTAS_LOCALES)]}\n\n(simulada {huella[:8]})"
+
+    def _sortear(self, timeout: float) -> float:
+        """Decide el destino de la llamada; devuelve la latencia a simular."""
+        with self._lock:
+            self.llamadas += 1
+            dado = self._azar.random()
+            latencia = self.latencia_mediana * math.exp(self._azar.gauss(0, self.latencia_sigma))
+            if dado < self.tasa_fallos:
+                self.fallos += 1
+                raise FalloSimulado("Fallo inyectado por el proveedor local")
+            colgada = dado < self.tasa_fallos + self.tasa_colgadas
+            if colgada:
+                self.colgadas += 1
+        if colgada or latencia >= timeout:
+            time.sleep(max(timeout, 0))
+            raise TimeoutError("El proveedor local no respondió a tiempo")
+        return latencia
+
+    def generar(self, prompt: str, timeout: float) -> str:
+        time.sleep(self._sortear(timeout))
+        return self.respuesta_para(prompt)
+
+    def generar_stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        latencia = self._sortear(timeout)
+        texto = self.respuesta_para(prompt)
+        tamano = math.ceil(len(texto) / self.fragmentos)
+        for i in range(0, len(texto), tamano):
+            time.sleep(latencia / self.fragmentos)
+            yield texto[i:i + tamano]
+
+    def contar_tokens(self, texto: str, timeout: float) -> int:
+        # Aproximación habitual: ~4 caracteres por token
+        return max(1, len(texto) // 4)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "proveedor": self.nombre,
+                "llamadas": self.llamadas,
+                "fallos_inyectados": self.fallos,
+                "colgadas_inyectadas": self.colgadas,
+                "latencia_mediana": self.latencia_mediana
+            }
+
+def crear_proveedor_llm() -> ProveedorLLM:
+    """Crea el proveedor indicado por LLM_PROVIDER ("gemini" o "local")."""
+    if LLM_PROVIDER == "local":
+        logger.info(f"🧪 Proveedor LLM local (simulado), latencia mediana {LLM_LOCAL_LATENCIA_MEDIANA}s")
+        return ProveedorLocal(
+            LLM_LOCAL_LATENCIA_MEDIANA, LLM_LOCAL_LATENCIA_SIGMA, LLM_LOCAL_TASA_FALLOS,
+            LLM_LOCAL_TASA_COLGADAS, LLM_LOCAL_FRAGMENTOS, LLM_LOCAL_SEMILLA
+        )
+    if LLM_PROVIDER != "gemini":
+        logger.warning(f"⚠️ LLM_PROVIDER desconocido '{LLM_PROVIDER}'; se usa gemini")
+    return ProveedorGemini(os.getenv('GEMINI_API_KEY'))
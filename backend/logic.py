@@ -1,37 +1,45 @@
 import re
 import random
-import unicodedata
 import wikipedia
-import bcrypt
 import logging
-from typing import Optional, Tuple, List, Dict
-from collections import defaultdict
+from typing import Callable, Optional, Tuple, List, Dict
 
 from database import (
-    get_connection,
+    abrir_sesion,
+    SesionBD,
     crear_usuario,
+    CorreoDuplicado,
+    obtener_usuario_para_login,
     crear_nueva_conversacion,
     guardar_mensaje_en_db,
-    actualizar_titulo_chat,
-    actualizar_titulo_con_mensaje,
+    actualizar_titulo_conversacion,
     _guardar_o_actualizar_enfermedad_min,
     _guardar_medicamento_y_regla,
     guardar_enfermedad,
+    obtener_id_enfermedad_por_nombre,
     obtener_recomendacion_medicamento,
     _obtener_medicamento_por_id,
     obtener_mensajes_por_conversacion
 )
 
+from text_utils import normalizar as _norm
+from password_hashing import hashear_password, verificar_password
+from chat_titles import TituloTurno
+from context_store import crear_almacen_contexto
+from conversation_context import ContextoConversacion, EstadoConversacion, RespuestasTriage
+from knowledge_base import BaseConocimiento, obtener_base, solicitar_recarga_base
+
 from gemini_service import (
     generar_respuesta_con_gemini,
     generar_respuesta_fallback,
-    GEMINI_ENABLED
+    gemini_disponible
 )
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-contextos: Dict[int, Dict] = {}
+# Estado de cada conversación entre turnos, por (user_id, conversation_id); ver context_store
+_almacen_contexto = crear_almacen_contexto()
 
 PREGUNTAS_TRIAGE = [
     "¿Has medido tu temperatura recientemente? Si es así, ¿cuál fue?",
@@ -50,80 +58,37 @@ consejos_generales = [
     "Evita automedicarte sin la supervisión de un profesional de la salud."
 ]
 
-def _get_contexto_o_crear(user_id: int) -> Dict:
+def obtener_estadisticas_contexto() -> Dict:
+    return _almacen_contexto.estadisticas()
+
+def registrar_usuario(nombre: str, correo: str, password: str) -> Tuple[str, str, Optional[Dict]]:
     """
-    Obtiene o crea el diccionario de contexto para un usuario.
+    Registra un nuevo usuario, hasheando su contraseña.
+    Retorna (estado, mensaje, usuario) con estado "creado", "duplicado" o "error";
+    'usuario' es el registro devuelto por crear_usuario cuando se crea.
     """
-    if user_id not in contextos:
-        contextos[user_id] = {
-            "estado_conversacion": "inicio",
-            "sintomas_detectados": set(),
-            "diagnostico_propuesto": None,
-            "confirmacion_pendiente": False,
-            "temperatura": None,
-            "enfermedad": None,
-            "triage": {"activo": False, "paso": 0, "respuestas": {}},
-            "esperando_enfermedad": False,
-            "esperando_medicamento": False,
-            "enfermedad_propuesta": None,
-            "sintoma_reportado": None,
-            "conversation_id": None
-        }
-    return contextos[user_id]
-
-def _reset_flujos_secundarios(ctx: Dict):
-    """Resetea los estados de flujos como triaje o aprendizaje."""
-    ctx["triage"]["activo"] = False
-    ctx["esperando_enfermedad"] = False
-    ctx["esperando_medicamento"] = False
-
-def registrar_usuario(nombre: str, correo: str, password: str) -> tuple[bool, str]:
-    """Registra un nuevo usuario, hasheando su contraseña."""
-    salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), salt)
-    user_id = crear_usuario(nombre, correo, password_hash)
-    if user_id:
-        return True, "Usuario registrado exitosamente."
-    else:
-        return False, "El correo electrónico ya podría estar en uso o hubo un error."
-
-def verificar_credenciales(correo: str, password: str) -> Optional[int]:
+    password_hash = hashear_password(password)
+    try:
+        usuario = crear_usuario(nombre, correo, password_hash)
+    except CorreoDuplicado:
+        return "duplicado", "El correo electrónico ya está en uso.", None
+    if usuario:
+        return "creado", "Usuario registrado exitosamente.", usuario
+    return "error", "No se pudo registrar el usuario. Intenta de nuevo.", None
+
+def verificar_credenciales(correo: str, password: str) -> Optional[Tuple[int, str]]:
     """
-    Verifica credenciales usando bcrypt y maneja errores.
+    Verifica credenciales con bcrypt (en el pool de password_hashing).
+    Retorna (ID_USUARIO, NOMBRE) si son válidas. Propaga HashingSaturado.
     """
-    conn = get_connection()
-    if not conn:
-        print("Error: No se pudo conectar a la BD en verificar_credenciales.")
+    usuario = obtener_usuario_para_login(correo)
+    if not usuario:
         return None
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT ID_USUARIO, PASSWORD FROM ADMIN.USUARIOS WHERE CORREO = :1", [correo])
-        user_data = cursor.fetchone()
-
-        if not user_data:
-            return None
-
-        user_id, stored_hash_str = user_data
-
-        if not stored_hash_str:
-            return None
 
-        try:
-            password_bytes = password.encode('utf-8')
-            stored_hash_bytes = str(stored_hash_str).encode('utf-8')
-
-            if bcrypt.checkpw(password_bytes, stored_hash_bytes):
-                return user_id
-            else:
-                return None
-        except ValueError:
-            return None
-    except Exception as e:
-        print(f"Error en verificar_credenciales: {e}")
+    user_id, stored_hash, nombre = usuario
+    if not verificar_password(password, stored_hash):
         return None
-    finally:
-        if conn:
-            conn.close()
+    return user_id, nombre or "Usuario"
 
 def _detectar_emocion(texto: str) -> Tuple[Optional[str], int]:
     t = _norm(texto)
@@ -155,22 +120,22 @@ def _prefacio_empatico(emocion: Optional[str], intensidad: int) -> str:
     i = max(1, min(3, intensidad or 1))
     return T[e][i]
 
-def _interpretar_respuesta_triage(paso: int, texto: str, respuestas: dict):
+def _interpretar_respuesta_triage(paso: int, texto: str, respuestas: RespuestasTriage):
     """Interpreta la respuesta del usuario en cada paso del triaje."""
     t = _norm(texto)
 
     if paso == 0:
         m = re.search(r"(\d{1,2}[\.,]\d+|\d{2,3})", t)
         if m:
-             respuestas["temperatura"] = float(m.group(1).replace(',', '.'))
+             respuestas.temperatura = float(m.group(1).replace(',', '.'))
 
-        temp_alta = respuestas.get("temperatura", 0) >= 38
-        respuestas["fiebre"] = ("si" in t or "sí" in t or temp_alta)
+        temp_alta = (respuestas.temperatura or 0) >= 38
+        respuestas.marcar("fiebre", "si" in t or "sí" in t or temp_alta)
 
     elif paso == 1:
         es_si = ("si" in t or "sí" in t)
-        respuestas["tos"] = es_si or "tos" in t
-        respuestas["dolor_garganta"] = es_si or "garganta" in t
+        respuestas.marcar("tos", es_si or "tos" in t)
+        respuestas.marcar("dolor_garganta", es_si or "garganta" in t)
 
     elif paso == 2:
         zonas = ["cabeza","garganta","abdomen","pecho","estomago","estómago"]
@@ -178,46 +143,46 @@ def _interpretar_respuesta_triage(paso: int, texto: str, respuestas: dict):
         for zona in zonas:
             if zona in t:
                 if zona == "cabeza":
-                    respuestas["dolor_cabeza"] = True
+                    respuestas.marcar("dolor_cabeza", True)
                 elif zona == "garganta":
-                    respuestas["dolor_garganta"] = True
+                    respuestas.marcar("dolor_garganta", True)
                 elif zona == "abdomen" or zona == "estomago" or zona == "estómago":
-                    respuestas["dolor_abdominal"] = True
+                    respuestas.marcar("dolor_abdominal", True)
                 elif zona == "pecho":
-                    respuestas["dolor_pecho"] = True
+                    respuestas.marcar("dolor_pecho", True)
 
     elif paso == 3:
         es_si = ("si" in t or "sí" in t)
-        respuestas["nauseas"] = es_si or ("nausea" in t or "nauseas" in t)
-        respuestas["vomitos"] = es_si or ("vomit" in t)
-        respuestas["diarrea"] = es_si or ("diarrea" in t)
+        respuestas.marcar("nauseas", es_si or ("nausea" in t or "nauseas" in t))
+        respuestas.marcar("vomitos", es_si or ("vomit" in t))
+        respuestas.marcar("diarrea", es_si or ("diarrea" in t))
 
     elif paso == 4:
         m = re.search(r"(\d+)\s*(dia|dias|hora|horas)", t)
-        respuestas["duracion"] = f"{m.group(1)} {m.group(2)}" if m else texto.strip()
+        respuestas.duracion = f"{m.group(1)} {m.group(2)}" if m else texto.strip()
 
     elif paso == 5:
         m = re.search(r"\b(10|[1-9])\b", t)
-        respuestas["intensidad"] = int(m.group(1)) if m else None
+        respuestas.intensidad = int(m.group(1)) if m else None
 
-def _respuestas_a_sintomas(r: dict) -> List[str]:
-    """Convierte el diccionario de respuestas del triaje a una lista de síntomas canónicos."""
+def _respuestas_a_sintomas(r: RespuestasTriage) -> List[str]:
+    """Convierte las respuestas del triaje a una lista de síntomas canónicos."""
     sintomas = []
 
-    if r.get("temperatura") and r["temperatura"] >= 39.5: sintomas.append("fiebre alta")
-    elif r.get("fiebre"): sintomas.append("fiebre")
+    if r.temperatura and r.temperatura >= 39.5: sintomas.append("fiebre alta")
+    elif r.tiene("fiebre"): sintomas.append("fiebre")
 
-    if r.get("tos"): sintomas.append("tos")
+    if r.tiene("tos"): sintomas.append("tos")
 
-    if r.get("dolor_cabeza"): sintomas.append("dolor de cabeza")
-    if r.get("dolor_garganta"): sintomas.append("dolor de garganta")
+    if r.tiene("dolor_cabeza"): sintomas.append("dolor de cabeza")
+    if r.tiene("dolor_garganta"): sintomas.append("dolor de garganta")
 
-    if r.get("dolor_abdominal"): sintomas.append("dolor abdominal")
-    if r.get("dolor_pecho"): sintomas.append("dolor en el pecho")
+    if r.tiene("dolor_abdominal"): sintomas.append("dolor abdominal")
+    if r.tiene("dolor_pecho"): sintomas.append("dolor en el pecho")
 
-    if r.get("nauseas"): sintomas.append("náuseas")
-    if r.get("vomitos"): sintomas.append("vómitos")
-    if r.get("diarrea"): sintomas.append("diarrea")
+    if r.tiene("nauseas"): sintomas.append("náuseas")
+    if r.tiene("vomitos"): sintomas.append("vómitos")
+    if r.tiene("diarrea"): sintomas.append("diarrea")
 
     return list(set(sintomas))
 
@@ -241,8 +206,8 @@ def intentar_busqueda_externa(pregunta: str):
     except wikipedia.exceptions.PageError:
         return None
 
-def detectar_sintomas(texto: str, cursor) -> Tuple[List[str], dict]:
-    """Combina patrones locales (incluyendo temperatura) y sinónimos de la BD."""
+def detectar_sintomas(texto: str, base: BaseConocimiento) -> Tuple[List[str], dict]:
+    """Combina temperatura, patrones locales y sinónimos de la base de conocimiento."""
     t = _norm(texto)
     sintomas_detectados = []
     temp_context = {"temperatura": None}
@@ -261,70 +226,70 @@ def detectar_sintomas(texto: str, cursor) -> Tuple[List[str], dict]:
         except ValueError:
             pass
 
-    patrones_locales = {
-        "dolor de cabeza": ["dolor de cabeza", "me duele la cabeza"],
-        "fiebre": ["fiebre", "temperatura alta", "mucha fiebre"],
-        "gripe": ["gripe", "síntomas de la gripe"],
-        "tos": ["tos", "estoy tosiendo"],
-        "dolor de garganta": ["me duele la garganta", "garganta inflamada"],
-        "congestión nasal": ["nariz tapada", "congestión nasal"],
-        "dolor abdominal": ["dolor abdominal", "me duele el estómago", "dolor de barriga"],
-        "náuseas": ["náuseas", "ganas de vomitar"],
-        "mareos": ["mareos", "me siento mareado"],
-        "fatiga": ["cansancio", "fatiga", "cansancio extremo"],
-        "escalofríos": ["escalofríos", "siento escalofríos"],
-        "dolor lumbar": ["dolor en la espalda baja", "dolor lumbar"],
-        "picor en los ojos": ["me pican los ojos", "picazón en los ojos"]
-    }
-
-    for sintoma, frases in patrones_locales.items():
-        if any(frase in t for frase in frases) and sintoma not in sintomas_detectados:
+    # Frases locales y sinónimos de la BD en una sola pasada (ver symptom_matcher)
+    vistos = {_norm(s) for s in sintomas_detectados}
+    for sintoma in base.automata.buscar(t):
+        if _norm(sintoma) not in vistos:
+            vistos.add(_norm(sintoma))
             sintomas_detectados.append(sintoma)
 
-    try:
-        cursor.execute(
-            """
-            SELECT DISTINCT S.NOMBRE
-            FROM ADMIN.SINONIMOS_SINTOMAS SS
-            JOIN ADMIN.SINTOMAS S ON SS.ID_SINTOMA = S.ID_SINTOMA
-            WHERE :texto LIKE '%' || LOWER(SS.SINONIMO) || '%'
-            """,
-            [t]
-        )
-        for row in cursor.fetchall():
-            sintoma_norm = _norm(row[0])
-            if sintoma_norm not in sintomas_detectados:
-                sintomas_detectados.append(sintoma_norm)
-    except Exception as e:
-        print(f"Error al buscar sinónimos en BD: {e}")
-
     return list(dict.fromkeys(sintomas_detectados)), temp_context
 
-def _diagnosticar_por_sintomas(cursor, sintomas_detectados: List[str]):
-    """Busca el mejor diagnóstico sumando pesos, excluyendo el genérico (ID 1) si hay otras opciones."""
-    puntajes = defaultdict(float)
-    sintomas_utilizados = []
-
-    for s in sintomas_detectados:
+def _sintomas_conocidos(base: BaseConocimiento, sintomas: List[str]) -> List[Tuple[str, int]]:
+    """Pares (nombre normalizado, ID_SINTOMA) de los síntomas que existen en la base."""
+    conocidos = []
+    for s in sintomas:
         s_norm = _norm(s)
+        id_sintoma = base.id_por_sintoma.get(s_norm)
+        if id_sintoma is not None:
+            conocidos.append((s_norm, id_sintoma))
+    return conocidos
 
-        cursor.execute("SELECT ID_SINTOMA FROM SINTOMAS WHERE LOWER(NOMBRE) = :1", [s_norm])
-        row = cursor.fetchone()
+def puntuar_lote_sintomas(base: BaseConocimiento, lote: List[List[str]]):
+    """
+    Puntúa muchos conjuntos de síntomas a la vez (p. ej. para reevaluar un corpus de mensajes).
+    Devuelve la matriz (len(lote) × enfermedades) y los ID_ENFERMEDAD de sus columnas.
+    """
+    conjuntos = [[id_s for _, id_s in _sintomas_conocidos(base, sintomas)] for sintomas in lote]
+    return base.matriz.puntuar_lote(conjuntos), base.matriz.ids_enfermedad
 
-        if not row:
-            continue
+ID_ENFERMEDAD_GENERICA = 1
 
-        id_sintoma = row[0]
-        sintomas_utilizados.append((s_norm, id_sintoma))
+def diagnostico_diferencial(sintomas: List[str], k: int = 5) -> Dict:
+    """
+    Devuelve las k enfermedades candidatas para una lista de síntomas, con su confianza
+    normalizada. Solo usa la base de conocimiento en memoria (sin viajes a la BD).
+    La enfermedad genérica se omite si hay otras candidatas.
+    """
+    base = obtener_base()
+    conocidos = _sintomas_conocidos(base, sintomas)
+    ids = [id_s for _, id_s in conocidos]
+
+    ranking = base.matriz.rankear(ids, k, excluir=(ID_ENFERMEDAD_GENERICA,))
+    if not ranking:
+        ranking = base.matriz.rankear(ids, k)
+
+    for candidato in ranking:
+        nombre, _ = base.enfermedades.get(candidato["id_enfermedad"], (None, None))
+        candidato["nombre"] = nombre
+
+    reconocidos = {s_norm for s_norm, _ in conocidos}
+    return {
+        "version_base": base.version,
+        "sintomas_utilizados": [s_norm for s_norm, _ in conocidos],
+        "sintomas_no_reconocidos": [s for s in sintomas if _norm(s) not in reconocidos],
+        "candidatos": ranking
+    }
 
-        cursor.execute("SELECT ID_ENFERMEDAD, PESO FROM REGLAS_INFERENCIA WHERE ID_SINTOMA = :1", [id_sintoma])
-        for id_enf, peso in cursor.fetchall():
-            puntajes[id_enf] = puntajes[id_enf] + peso
+def _diagnosticar_por_sintomas(base: BaseConocimiento, sintomas_detectados: List[str]):
+    """Busca el mejor diagnóstico sumando pesos, excluyendo el genérico (ID 1) si hay otras opciones."""
+    sintomas_utilizados = _sintomas_conocidos(base, sintomas_detectados)
+    puntajes = base.matriz.puntuar(id_sintoma for _, id_sintoma in sintomas_utilizados)
 
     if not puntajes:
         return None, {}, sintomas_utilizados
 
-    ID_GENERICO = 1
+    ID_GENERICO = ID_ENFERMEDAD_GENERICA
 
     candidatos_reales = {k: v for k, v in puntajes.items() if k != ID_GENERICO}
 
@@ -337,42 +302,100 @@ def _diagnosticar_por_sintomas(cursor, sintomas_detectados: List[str]):
 
     return mejor_id, puntajes, sintomas_utilizados
 
-def _norm(s: str) -> str:
-    """Normaliza el texto, lo pasa a minúsculas y quita acentos."""
-    s = s.strip().lower()
-    s = unicodedata.normalize("NFD", s)
-    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+class _EscriturasTurno:
+    """
+    Lo que un turno tiene que escribir. El turno se calcula sin transacción abierta (las
+    lecturas toman y devuelven su conexión del pool al momento), así que la espera al LLM
+    o a Wikipedia no retiene conexiones ni bloqueos; lo escrito se anota aquí y aplicar()
+    lo guarda al final, junto con los mensajes y el título, en una sesión corta. Si
+    cualquiera de esas escrituras falla, la sesión queda marcada y no se guarda nada.
+    """
+
+    def __init__(self, conversation_id: int, texto_usuario: str):
+        self.conversation_id = conversation_id
+        self.texto_usuario = texto_usuario
+        self.titulo = TituloTurno(texto_usuario)
+        self.respuesta: Optional[str] = None
+        self._pasos: List[Callable[[SesionBD], None]] = []
+        self._responder: Optional[Callable[[SesionBD], str]] = None
+
+    def agregar(self, paso: Callable[[SesionBD], None]):
+        """Escritura a aplicar en la sesión final, antes de la respuesta."""
+        self._pasos.append(paso)
+
+    def responder(self, respuesta: str) -> str:
+        self.respuesta = respuesta
+        return respuesta
+
+    def responder_al_escribir(self, responder: Callable[[SesionBD], str]):
+        """Para respuestas que dependen del resultado de escrituras (flujo de aprendizaje)."""
+        self._responder = responder
+
+    def aplicar(self, sesion: SesionBD) -> str:
+        guardar_mensaje_en_db(self.conversation_id, 'usuario', self.texto_usuario, sesion=sesion)
+        for paso in self._pasos:
+            paso(sesion)
+        respuesta = self.respuesta
+        if self._responder is not None:
+            try:
+                respuesta = self._responder(sesion)
+            except Exception as e:
+                logger.error(f"❌ Error al aplicar el turno de la conversación {self.conversation_id}: {e}", exc_info=True)
+                sesion.marcar_fallida()
+            if sesion.fallida:
+                # La respuesta anunciaba lo aprendido, que no se va a confirmar
+                respuesta = "Lo siento mucho, ocurrió un error inesperado al procesar tu mensaje. Por favor, intenta de nuevo."
+        guardar_mensaje_en_db(self.conversation_id, 'agente', respuesta, sesion=sesion)
+        decision = self.titulo.decidir()
+        if decision:
+            actualizar_titulo_conversacion(self.conversation_id, *decision, sesion=sesion)
+        return respuesta
 
-def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = None) -> str:
+def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = None,
+                     emitir: Optional[Callable[[str], None]] = None) -> str:
     """
     Función principal, refactorizada para integrar la lógica de diagnóstico
     con el nuevo sistema de historial de conversaciones en la base de datos.
+    El turno se calcula sin sesión de BD abierta; sus escrituras (mensajes, título,
+    aprendizaje y contexto) se confirman al final con un único commit.
+    Si se pasa 'emitir', las respuestas de Gemini se generan en streaming y cada
+    fragmento se entrega ahí en cuanto llega; el valor de retorno es la respuesta completa.
     """
-    contexto = _get_contexto_o_crear(user_id)
-
     # Si se proporciona un conversacion_id, usar ese; de lo contrario, crear uno nuevo
-    if conversacion_id:
-        contexto["conversation_id"] = conversacion_id
-        conversation_id = conversacion_id
-    elif "conversation_id" not in contexto or contexto["conversation_id"] is None:
-        conv_id = crear_nueva_conversacion(user_id, texto_usuario)
-        if not conv_id:
+    if not conversacion_id:
+        conversacion_id = crear_nueva_conversacion(user_id, texto_usuario)
+        if not conversacion_id:
             return "Lo siento, hubo un error crítico al iniciar una nueva conversación. Por favor, intenta de nuevo más tarde."
-        contexto["conversation_id"] = conv_id
-        conversation_id = conv_id
-    else:
-        conversation_id = contexto["conversation_id"]
 
-    guardar_mensaje_en_db(conversation_id, 'usuario', texto_usuario)
-
-    # Actualizar el título si es una conversación nueva (solo tiene "Nueva conversación")
-    actualizar_titulo_con_mensaje(conversation_id, texto_usuario)
-
-    def guardar_y_retornar(respuesta: str) -> str:
-        guardar_mensaje_en_db(conversation_id, 'agente', respuesta)
-        return respuesta
+    # El estado de la conversación se lee una vez al empezar el turno y se guarda al
+    # terminarlo, en la misma transacción que los mensajes del turno
+    clave = (user_id, conversacion_id)
+    contexto = _almacen_contexto.cargar(clave) or ContextoConversacion()
+    turno = _EscriturasTurno(conversacion_id, texto_usuario)
+    _procesar_turno(user_id, texto_usuario, conversacion_id, contexto, turno, emitir)
+
+    sesion = abrir_sesion()
+    if sesion is None:
+        logger.error(f"❌ Sin conexión a la BD: el turno de la conversación {conversacion_id} no se guardó")
+        return turno.respuesta or "Lo siento, no pude conectarme a la base de datos. Por favor, intenta de nuevo más tarde."
+    with sesion:
+        respuesta = turno.aplicar(sesion)
+        if not sesion.fallida:
+            _almacen_contexto.guardar(clave, contexto, sesion=sesion)
+    if sesion.fallida:
+        logger.error(f"❌ Falló una escritura del turno de la conversación {conversacion_id}; se revirtió completo")
+    return respuesta
+
+def _procesar_turno(user_id: int, texto_usuario: str, conversation_id: int, contexto: ContextoConversacion,
+                    turno: _EscriturasTurno, emitir: Optional[Callable[[str], None]] = None):
+    """
+    Decide la respuesta de un turno sin sesión de BD: las lecturas usan conexiones sueltas
+    y las escrituras se anotan en 'turno'. 'contexto' se modifica en el sitio; quien llama
+    se encarga de guardarlo.
+    """
+    titulo_turno = turno.titulo
+    guardar_y_retornar = turno.responder
 
-    conn = None
     try:
         mensaje = texto_usuario
         tnorm = _norm(mensaje)
@@ -382,40 +405,39 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
         prefacio = _prefacio_empatico(emocion, intensidad)
 
         if any(s in tnorm for s in ["hola","buenos dias","buenas tardes","buenas noches"]):
-            _reset_flujos_secundarios(contexto)
+            contexto.reset_flujos_secundarios()
             return guardar_y_retornar("¡Hola! ¿Cómo te sientes hoy? 😊")
 
         if any(a in tnorm for a in ["gracias","muchas gracias","te lo agradezco"]):
-            _reset_flujos_secundarios(contexto)
+            contexto.reset_flujos_secundarios()
             respuesta = f"{prefacio}\n\n¡De nada! 😊 Si necesitas algo más, aquí estaré."
             return guardar_y_retornar(respuesta)
 
         frases_mejora = ["me siento bien", "ya estoy mejor", "estoy bien", "mejoré", "ya me siento mejor", "me encuentro mejor", "ya me recuperé", "estoy recuperado", "todo bien", "ya pasó", "ya no tengo nada", "ya no me duele", "ya me siento normal", "ya no tengo síntomas", "ya todo está bien", "ya estoy como nuevo", "ya estoy bien gracias", "ya me curé", "ya me alivió", "ya se me pasó", "ya no tengo molestias", "estoy mucho mejor", "ya me sané", "ya no me molesta", "todo tranquilo", "ya pasó todo", "ya estoy al 100", "ya me repuse", "ya estoy al cien", "gracias ya estoy bien", "estoy estable", "todo en orden", "ya estoy ok"]
         if any(f in tnorm for f in frases_mejora):
-            _reset_flujos_secundarios(contexto)
+            contexto.reset_flujos_secundarios()
             respuesta = f"{_prefacio_empatico('alivio', 2)}\n\n¡Qué buena noticia! Me alegra que te sientas mejor 😊"
             return guardar_y_retornar(respuesta)
 
         gatillos_triage = {"mas o menos","ahi vamos","regular","no muy bien","masomenos","me siento mal","mal","peor","no muy bien","no bien","no estoy bien","no me siento bien"}
-        if (tnorm in gatillos_triage or not tnorm) and not contexto["triage"]["activo"]:
-            _reset_flujos_secundarios(contexto)
-            contexto["triage"].update({"activo": True,"paso":0,"respuestas":{}})
+        if (tnorm in gatillos_triage or not tnorm) and contexto.estado != EstadoConversacion.TRIAGE:
+            contexto.iniciar_triage()
             respuesta = f"{_prefacio_empatico('malestar',1)}\n\nPara ayudarte mejor, haré unas preguntas rápidas.\n1/6: {PREGUNTAS_TRIAGE[0]}"
             return guardar_y_retornar(respuesta)
 
-        if contexto["triage"]["activo"]:
-            paso = contexto["triage"]["paso"]
-            _interpretar_respuesta_triage(paso, mensaje, contexto["triage"]["respuestas"])
+        if contexto.estado == EstadoConversacion.TRIAGE:
+            paso = contexto.paso_triage
+            _interpretar_respuesta_triage(paso, mensaje, contexto.triage)
             paso += 1
             if paso < len(PREGUNTAS_TRIAGE):
-                contexto["triage"]["paso"] = paso
+                contexto.paso_triage = paso
                 respuesta = f"{paso+1}/6: {PREGUNTAS_TRIAGE[paso]}"
                 return guardar_y_retornar(respuesta)
 
-            contexto["triage"]["activo"] = False
-            sintomas_del_triage = _respuestas_a_sintomas(contexto["triage"]["respuestas"])
-            if contexto["triage"]["respuestas"].get("temperatura"):
-                contexto["temperatura"] = contexto["triage"]["respuestas"]["temperatura"]
+            contexto.reset_flujos_secundarios()
+            sintomas_del_triage = _respuestas_a_sintomas(contexto.triage)
+            if contexto.triage.temperatura:
+                contexto.temperatura = contexto.triage.temperatura
 
             if not sintomas_del_triage:
                 respuesta = "No logré identificar síntomas específicos. Por favor, descríbeme con más detalle qué sientes."
@@ -423,65 +445,62 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
 
             # Actualizar título del chat con síntomas del triage
             if sintomas_del_triage and conversation_id:
-                actualizar_titulo_chat(conversation_id, sintomas_del_triage)
+                titulo_turno.proponer_sintomas(sintomas_del_triage)
 
             mensaje = "tengo " + ", ".join(sintomas_del_triage)
             tnorm = _norm(mensaje)
             print("📝 Síntomas de Triaje convertidos:", mensaje)
 
-        if contexto["esperando_enfermedad"] or contexto["esperando_medicamento"]:
-            conn_aprendizaje = get_connection()
-            if not conn_aprendizaje: return guardar_y_retornar("Error de conexión al intentar aprender.")
-            try:
-                cursor_aprendizaje = conn_aprendizaje.cursor()
-                if contexto["esperando_enfermedad"]:
-                    enfermedad = mensaje.strip().capitalize()
-                    contexto.update({"enfermedad_propuesta": enfermedad, "esperando_enfermedad": False, "esperando_medicamento": True})
-                    # Guardar o actualizar la enfermedad
-                    ok, _ = guardar_enfermedad(enfermedad, "Enfermedad aprendida por retroalimentación.")
+        if contexto.estado in (EstadoConversacion.ESPERANDO_ENFERMEDAD, EstadoConversacion.ESPERANDO_MEDICAMENTO):
+            if contexto.estado == EstadoConversacion.ESPERANDO_ENFERMEDAD:
+                enfermedad = mensaje.strip().capitalize()
+                contexto.enfermedad_propuesta = enfermedad
+                contexto.estado = EstadoConversacion.ESPERANDO_MEDICAMENTO
+                # Guardar o actualizar la enfermedad
+                def guardar_enfermedad_propuesta(sesion: SesionBD):
+                    ok, _ = guardar_enfermedad(enfermedad, "Enfermedad aprendida por retroalimentación.", sesion=sesion)
+                    sesion.al_confirmar(solicitar_recarga_base)
                     if not ok:
                         logger.warning(f"No se pudo guardar la enfermedad '{enfermedad}', pero continuando...")
-                    respuesta = f"{prefacio}\n\n¡Gracias! ¿Recuerdas qué medicamento usaste y cómo? Formato: nombre, dosis, frecuencia, duración. 🙏"
+                turno.agregar(guardar_enfermedad_propuesta)
+                respuesta = f"{prefacio}\n\n¡Gracias! ¿Recuerdas qué medicamento usaste y cómo? Formato: nombre, dosis, frecuencia, duración. 🙏"
+                return guardar_y_retornar(respuesta)
+
+            if contexto.estado == EstadoConversacion.ESPERANDO_MEDICAMENTO:
+                partes = [p.strip() for p in mensaje.split(",")]
+                if len(partes) < 4:
+                    respuesta = f"{prefacio}\n\nPor favor, indica el medicamento en el formato correcto: nombre, dosis, frecuencia, duración."
                     return guardar_y_retornar(respuesta)
+                nombre, dosis, frecuencia, duracion = partes[0].capitalize(), partes[1], partes[2], partes[3]
+                enfermedad = contexto.enfermedad_propuesta
 
-                if contexto["esperando_medicamento"]:
-                    partes = [p.strip() for p in mensaje.split(",")]
-                    if len(partes) < 4:
-                        respuesta = f"{prefacio}\n\nPor favor, indica el medicamento en el formato correcto: nombre, dosis, frecuencia, duración."
-                        return guardar_y_retornar(respuesta)
-                    nombre, dosis, frecuencia, duracion = partes[0].capitalize(), partes[1], partes[2], partes[3]
-                    enfermedad = contexto["enfermedad_propuesta"]
+                # La respuesta depende de que las escrituras salgan bien: se decide al guardar
+                def aprender_medicamento(sesion: SesionBD) -> str:
                     # 1) Obtener ID_ENFERMEDAD
-                    cursor_aprendizaje.execute(
-                        "SELECT ID_ENFERMEDAD FROM ADMIN.ENFERMEDADES WHERE UPPER(NOMBRE)=UPPER(:n)",
-                        n=enfermedad
-                    )
-                    row = cursor_aprendizaje.fetchone()
-                    if not row:
+                    id_enf = obtener_id_enfermedad_por_nombre(enfermedad, sesion=sesion)
+                    if not id_enf:
                         # Si la enfermedad no existe aún, créala de forma mínima
-                        ok, new_id = guardar_enfermedad(enfermedad, "Enfermedad aprendida por retroalimentación.")
+                        ok, new_id = guardar_enfermedad(enfermedad, "Enfermedad aprendida por retroalimentación.", sesion=sesion)
                         id_enf = new_id if ok else None
-                    else:
-                        id_enf = row[0]
 
                     if not id_enf:
-                        return guardar_y_retornar("No pude registrar la enfermedad para aprender la recomendación. Intenta de nuevo.")
+                        return "No pude registrar la enfermedad para aprender la recomendación. Intenta de nuevo."
 
                     # 2) Unir dosis + frecuencia en el campo DOSIS (porque el esquema no tiene FRECUENCIA)
                     dosis_final = f"{dosis} {frecuencia}".strip()
                     # 3) Guardar medicamento + regla
-                    ok = _guardar_medicamento_y_regla(nombre, f"Aprendido del usuario", id_enf, dosis_final, duracion)
+                    ok = _guardar_medicamento_y_regla(nombre, f"Aprendido del usuario", id_enf, dosis_final, duracion, sesion=sesion)
                     if not ok:
-                        return guardar_y_retornar("Ocurrió un problema al guardar la recomendación. Intenta nuevamente.")
+                        return "Ocurrió un problema al guardar la recomendación. Intenta nuevamente."
 
-                    _reset_flujos_secundarios(contexto)
-                    respuesta = f"{prefacio}\n\n¡Genial! He aprendido que para *{enfermedad}* se puede recomendar **{nombre}** ({dosis_final}, {duracion}). 🧠💊"
-                    return guardar_y_retornar(respuesta)
-            finally:
-                if conn_aprendizaje: conn_aprendizaje.close()
+                    contexto.reset_flujos_secundarios()
+                    return f"{prefacio}\n\n¡Genial! He aprendido que para *{enfermedad}* se puede recomendar **{nombre}** ({dosis_final}, {duracion}). 🧠💊"
+
+                turno.responder_al_escribir(aprender_medicamento)
+                return
 
         if re.search(r"(que puedo tomar|que medicamento|cual es el tratamiento)", tnorm):
-            enf = extraer_nombre_enfermedad(mensaje) or contexto.get("enfermedad")
+            enf = extraer_nombre_enfermedad(mensaje) or contexto.enfermedad
             if not enf:
                 respuesta = f"{prefacio}\n\nPor favor, dime primero qué enfermedad tienes para poder darte una recomendación."
                 return guardar_y_retornar(respuesta)
@@ -502,8 +521,11 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
             if resumen:
                 nombre_enf = extraer_nombre_enfermedad(mensaje)
                 if nombre_enf and nombre_enf not in ["que", "qué", "cuales", "cuáles"]:
-                    guardar_enfermedad(nombre_enf, resumen)
-                    contexto['enfermedad'] = nombre_enf
+                    def guardar_enfermedad_aprendida(sesion: SesionBD):
+                        guardar_enfermedad(nombre_enf, resumen, sesion=sesion)
+                        sesion.al_confirmar(solicitar_recarga_base)
+                    turno.agregar(guardar_enfermedad_aprendida)
+                    contexto.enfermedad = nombre_enf
                     respuesta = f"{prefacio}\n\n🧠 He aprendido sobre '{nombre_enf}' y lo he guardado.\n\n{resumen}"
                     return guardar_y_retornar(respuesta)
                 else:
@@ -511,26 +533,21 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
             else:
                 return guardar_y_retornar(f"{prefacio}\n\nNo encontré información sobre eso.")
 
-        conn = get_connection()
-        if not conn: return guardar_y_retornar("Error de conexión al intentar diagnosticar.")
-
-        cursor = conn.cursor()
-        cursor.execute("ALTER SESSION SET NLS_COMP = LINGUISTIC")
-        cursor.execute("ALTER SESSION SET NLS_SORT = BINARY_CI")
+        base = obtener_base()
 
-        sintomas_detectados, temp_ctx = detectar_sintomas(mensaje, cursor)
+        sintomas_detectados, temp_ctx = detectar_sintomas(mensaje, base)
         if temp_ctx.get("temperatura"):
-            contexto["temperatura"] = temp_ctx["temperatura"]
+            contexto.temperatura = temp_ctx["temperatura"]
 
         print("🔍 Síntomas detectados:", sintomas_detectados)
 
         # Actualizar título del chat con el síntoma principal
         if sintomas_detectados and conversation_id:
-            actualizar_titulo_chat(conversation_id, sintomas_detectados)
+            titulo_turno.proponer_sintomas(sintomas_detectados)
 
         if not sintomas_detectados:
             # NUEVA FUNCIONALIDAD: Si no hay síntomas en BD, intentar Gemini primero
-            if GEMINI_ENABLED:
+            if gemini_disponible():
                 logger.info("🤖 No hay síntomas en BD, intentando Gemini AI...")
                 # Obtener historial de conversación
                 historial = obtener_mensajes_por_conversacion(conversation_id)
@@ -542,44 +559,43 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
                     sintomas_detectados=[],
                     contexto=contexto,
                     diagnostico_previo=None,
-                    historial_conversacion=historial
+                    historial_conversacion=historial,
+                    emitir=emitir
                 )
 
                 if respuesta_gemini:
                     logger.info(f"✅ Gemini proporcionó respuesta (urgencia: {nivel_urgencia})")
-                    _reset_flujos_secundarios(contexto)
+                    contexto.reset_flujos_secundarios()
                     return guardar_y_retornar(respuesta_gemini)
                 else:
                     logger.warning("⚠️ Gemini no pudo responder, activando modo aprendizaje")
 
             # FALLBACK: Si Gemini falla o no está disponible, pedir aprendizaje
-            _reset_flujos_secundarios(contexto)
-            contexto["sintoma_reportado"] = mensaje
-            contexto["esperando_enfermedad"] = True
+            contexto.reset_flujos_secundarios()
+            contexto.sintoma_reportado = mensaje
+            contexto.estado = EstadoConversacion.ESPERANDO_ENFERMEDAD
             respuesta = f"{prefacio}\n\nHmm, no reconozco ese síntoma... ¿Te diagnosticaron alguna enfermedad relacionada? Puedo aprender de ello. 😊"
             return guardar_y_retornar(respuesta)
 
-        mejor_id, _, sintomas_utilizados = _diagnosticar_por_sintomas(cursor, sintomas_detectados)
+        mejor_id, _, sintomas_utilizados = _diagnosticar_por_sintomas(base, sintomas_detectados)
 
         if not mejor_id:
             respuesta = f"{prefacio}\n\nCon los síntomas que mencionas, no pude encontrar una enfermedad coincidente en mi base de conocimientos."
             return guardar_y_retornar(respuesta)
 
-        cursor.execute("SELECT NOMBRE, DESCRIPCION FROM ADMIN.ENFERMEDADES WHERE ID_ENFERMEDAD = :1", [mejor_id])
-        row = cursor.fetchone()
+        row = base.enfermedades.get(mejor_id)
         if not row or not row[0]:
             return guardar_y_retornar(f"{prefacio}\n\nIdentifiqué una posible enfermedad, pero no pude recuperar su información.")
 
-        enfermedad, desc_raw = row[0], row[1]
-        descripcion = desc_raw.read() if hasattr(desc_raw, 'read') else desc_raw
+        enfermedad, descripcion = row
         descripcion = (descripcion or "").replace("Enfermedad aprendida por retroalimentación.", "").strip()
-        contexto["enfermedad"] = enfermedad
+        contexto.enfermedad = enfermedad
         med = _obtener_medicamento_por_id(mejor_id)
 
         sintomas_canonicos = [s for s, _ in sintomas_utilizados]
 
         # NUEVA FUNCIONALIDAD: Intentar usar Gemini AI primero
-        if GEMINI_ENABLED:
+        if gemini_disponible():
             logger.info("🤖 Generando respuesta con Gemini AI...")
             # Obtener historial de conversación
             historial = obtener_mensajes_por_conversacion(conversation_id)
@@ -591,12 +607,13 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
                 sintomas_detectados=sintomas_canonicos,
                 contexto=contexto,
                 diagnostico_previo=enfermedad,
-                historial_conversacion=historial
+                historial_conversacion=historial,
+                emitir=emitir
             )
 
             if respuesta_gemini:
                 logger.info(f"✅ Respuesta Gemini generada (urgencia: {nivel_urgencia})")
-                _reset_flujos_secundarios(contexto)
+                contexto.reset_flujos_secundarios()
                 return guardar_y_retornar(respuesta_gemini)
             else:
                 logger.warning("⚠️ Gemini falló, usando método tradicional")
@@ -610,16 +627,13 @@ def procesar_mensaje(user_id: int, texto_usuario: str, conversacion_id: int = No
             medicamento=med
         )
 
-        _reset_flujos_secundarios(contexto)
+        contexto.reset_flujos_secundarios()
         return guardar_y_retornar(respuesta_diag)
 
     except Exception as e:
         logger.error(f"❌ Error fatal en procesar_mensaje para user_id {user_id}: {e}", exc_info=True)
         respuesta_error = "Lo siento mucho, ocurrió un error inesperado al procesar tu mensaje. Por favor, intenta de nuevo."
         return guardar_y_retornar(respuesta_error)
-    finally:
-        if conn:
-            conn.close()
 
 PESO_APRENDIZAJE_DEFECTO = 0.6
 
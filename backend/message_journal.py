@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Función que escribe un lote de filas (id_chat, emisor, contenido) en la BD.
+# Devuelve True si el lote quedó confirmado.
+EscritorLote = Callable[[List[Tuple[int, str, str]]], bool]
+
+class DiarioMensajes:
+    """
+    Persistencia diferida (write-behind) de mensajes.
+
+    Cada mensaje se anota primero en un diario local de solo-anexar (un archivo por proceso)
+    y se encola en memoria; un hilo de fondo los escribe en la BD por lotes, al llenarse
+    el lote o al pasar el intervalo máximo. Tras confirmar un lote se anota un 'ack'.
+    Si el proceso muere antes de vaciar la cola, el siguiente arranque reenvía las
+    entradas del diario sin 'ack' (entrega al-menos-una-vez).
+    """
+
+    def __init__(self, directorio: str, escribir_lote: EscritorLote, tam_lote: int = 50,
+                 intervalo: float = 0.5, max_cola: int = 1000, fsync: bool = True):
+        self.directorio = Path(directorio)
+        self.escribir_lote = escribir_lote
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.fsync = fsync
+
+        self._cola: "queue.Queue[Dict]" = queue.Queue(maxsize=max_cola)
+        self._pendientes: Dict[int, List[Dict]] = {}
+        self._lock_pendientes = threading.Lock()
+        self._lock_escritura = threading.RLock()
+        self._lock_diario = threading.Lock()
+        self._seq = 0
+        self._sin_ack = 0
+        self._detener = threading.Event()
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._ruta = self.directorio / f"mensajes-{os.getpid()}.jsonl"
+        self._recuperar_diarios_huerfanos()
+        self._archivo = open(self._ruta, "a", encoding="utf-8")
+
+        self._hilo = threading.Thread(target=self._bucle, name="diario-mensajes", daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------------ API
+
+    def encolar(self, id_chat: int, emisor: str, contenido: str, espera: float = 0.1) -> bool:
+        """
+        Anota y encola un mensaje. Devuelve False si la cola sigue llena tras 'espera'
+        segundos; en ese caso el llamador debe escribir el mensaje de forma síncrona.
+        """
+        with self._lock_diario:
+            self._seq += 1
+            entrada = {"seq": self._seq, "chat": int(id_chat), "emisor": emisor, "contenido": contenido}
+            with self._lock_pendientes:
+                self._pendientes.setdefault(entrada["chat"], []).append(entrada)
+            try:
+                self._cola.put(entrada, timeout=espera)
+            except queue.Full:
+                self._quitar_pendientes([entrada])
+                return False
+            self._anotar(entrada)
+            self._sin_ack += 1
+        return True
+
+    def leer_consistente(self, id_chat: int, leer_bd: Callable[[], List]) -> Tuple[List, List[Tuple[str, str]]]:
+        """
+        Lee de la BD y devuelve además los mensajes aún no escritos de ese chat
+        (emisor, contenido), garantizando lectura de las propias escrituras dentro del worker.
+        Solo se bloquea contra el hilo de escritura si el chat tiene mensajes pendientes.
+        """
+        with self._lock_pendientes:
+            hay_pendientes = bool(self._pendientes.get(int(id_chat)))
+        if not hay_pendientes:
+            return leer_bd(), []
+
+        with self._lock_escritura:
+            filas = leer_bd()
+            with self._lock_pendientes:
+                pendientes = [(e["emisor"], e["contenido"]) for e in self._pendientes.get(int(id_chat), [])]
+        return filas, pendientes
+
+    def detener(self, timeout: float = 5.0):
+        """Vacía la cola y detiene el hilo de escritura."""
+        self._detener.set()
+        self._hilo.join(timeout)
+        with self._lock_diario:
+            self._archivo.close()
+
+    # ------------------------------------------------------------ internos
+
+    def _anotar(self, registro: Dict):
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._archivo.flush()
+        if self.fsync:
+            os.fsync(self._archivo.fileno())
+
+    def _quitar_pendientes(self, entradas: List[Dict]):
+        with self._lock_pendientes:
+            for e in entradas:
+                pendientes_chat = self._pendientes.get(e["chat"])
+                if pendientes_chat and e in pendientes_chat:
+                    pendientes_chat.remove(e)
+                    if not pendientes_chat:
+                        del self._pendientes[e["chat"]]
+
+    def _bucle(self):
+        while not (self._detener.is_set() and self._cola.empty()):
+            lote = self._tomar_lote()
+            if not lote:
+                continue
+            while not self._escribir(lote):
+                if self._detener.is_set():
+                    return
+                time.sleep(min(5.0, self.intervalo * 4))
+
+    def _tomar_lote(self) -> List[Dict]:
+        lote = []
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tam_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _escribir(self, lote: List[Dict]) -> bool:
+        with self._lock_escritura:
+            filas = [(e["chat"], e["emisor"], e["contenido"]) for e in lote]
+            if not self.escribir_lote(filas):
+                return False
+
+            self._quitar_pendientes(lote)
+
+        with self._lock_diario:
+            self._anotar({"ack": lote[-1]["seq"]})
+            self._sin_ack -= len(lote)
+            if self._sin_ack == 0:
+                # Todo confirmado: el diario puede empezar de cero
+                self._archivo.truncate(0)
+                self._archivo.seek(0)
+        return True
+
+    def _recuperar_diarios_huerfanos(self):
+        """Reenvía a la BD las entradas sin 'ack' de diarios de procesos que ya no existen."""
+        for ruta in self.directorio.glob("mensajes-*.jsonl"):
+            try:
+                pid = int(ruta.stem.split("-", 1)[1])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _proceso_vivo(pid):
+                continue
+
+            reclamado = ruta.with_name(f"recuperando-{os.getpid()}-{ruta.name}")
+            try:
+                os.rename(ruta, reclamado)
+            except OSError:
+                continue  # otro worker lo reclamó primero
+
+            filas = _entradas_sin_ack(reclamado)
+            if filas and not self.escribir_lote(filas):
+                print(f"⚠️ No se pudo recuperar el diario {ruta.name}; se conserva para el próximo arranque")
+                os.rename(reclamado, ruta)
+                continue
+            if filas:
+                print(f"✅ Recuperados {len(filas)} mensajes del diario {ruta.name}")
+            reclamado.unlink()
+
+def _entradas_sin_ack(ruta: Path) -> List[Tuple[int, str, str]]:
+    entradas, ultimo_ack = [], 0
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue  # línea truncada por una caída a mitad de escritura
+            if "ack" in registro:
+                ultimo_ack = max(ultimo_ack, registro["ack"])
+            else:
+                entradas.append(registro)
+    return [(e["chat"], e["emisor"], e["contenido"]) for e in entradas if e["seq"] > ultimo_ack]
+
+def unir_pendientes(filas: List[Tuple], pendientes: List[Tuple[str, str]],
+                    limite: Optional[int] = None) -> List[Tuple]:
+    """
+    Filas (emisor, contenido, id) leídas de la BD seguidas de los mensajes pendientes del
+    diario, que aún no tienen ID. Con 'limite' conserva solo los 'limite' más recientes.
+    """
+    unidas = list(filas) + [(emisor, contenido, None) for emisor, contenido in pendientes]
+    if limite is not None:
+        unidas = unidas[-limite:] if limite > 0 else []
+    return unidas
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_diario: Optional[DiarioMensajes] = None
+_diario_pid: Optional[int] = None
+_diario_lock = threading.Lock()
+
+def obtener_diario(directorio: str, escribir_lote: EscritorLote, **opciones) -> DiarioMensajes:
+    """Devuelve el diario del proceso actual, creándolo tras el fork si hace falta."""
+    global _diario, _diario_pid
+    pid = os.getpid()
+    if _diario is not None and _diario_pid == pid:
+        return _diario
+    with _diario_lock:
+        if _diario is None or _diario_pid != pid:
+            _diario = DiarioMensajes(directorio, escribir_lote, **opciones)
+            _diario_pid = pid
+    return _diario
+
+def detener_diario():
+    """Vacía y detiene el diario del proceso actual, si existe."""
+    global _diario
+    if _diario is not None and _diario_pid == os.getpid():
+        _diario.detener()
+        _diario = None
@@ -0,0 +1,131 @@
+import oracledb
+from typing import Callable, List, Tuple, Union
+
+from database import get_connection, rellenar_nombres_clave
+
+# Errores de Oracle que indican que el cambio ya estaba aplicado
+#   ORA-00955: el nombre ya está siendo utilizado por otro objeto
+#   ORA-01408: esa lista de columnas ya está indexada
+#   ORA-01430: la columna que se está agregando ya existe en la tabla
+ERRORES_YA_APLICADO = {955, 1408, 1430}
+
+Paso = Union[str, Callable]
+
+# Cada migración es (versión, descripción, pasos). Un paso es una sentencia SQL
+# o una función que recibe el cursor. Las versiones nunca se reutilizan: para cambiar el
+# esquema se agrega una migración nueva al final.
+MIGRACIONES: List[Tuple[int, str, List[Paso]]] = [
+    (1, "Columna ID_USUARIO en CHATS", [
+        "ALTER TABLE ADMIN.CHATS ADD (ID_USUARIO NUMBER)",
+    ]),
+    (2, "Índice de conversaciones por usuario y fecha", [
+        "CREATE INDEX ADMIN.CHATS_USUARIO_FECHA_IDX ON ADMIN.CHATS (ID_USUARIO, FECHA_CREACION, ID_CHAT)",
+    ]),
+    (3, "Índice de mensajes por chat", [
+        "CREATE INDEX ADMIN.MENSAJES_CHAT_IDX ON ADMIN.MENSAJES (ID_CHAT, ID_MENSAJE)",
+    ]),
+    (4, "Columna NOMBRE_CLAVE (nombre sin acentos) indexada", [
+        "ALTER TABLE ADMIN.SINTOMAS ADD (NOMBRE_CLAVE VARCHAR2(400))",
+        "ALTER TABLE ADMIN.ENFERMEDADES ADD (NOMBRE_CLAVE VARCHAR2(400))",
+        "ALTER TABLE ADMIN.MEDICAMENTOS ADD (NOMBRE_CLAVE VARCHAR2(400))",
+        rellenar_nombres_clave,
+        "CREATE INDEX ADMIN.SINTOMAS_NOMBRE_CLAVE_IDX ON ADMIN.SINTOMAS (NOMBRE_CLAVE)",
+        "CREATE INDEX ADMIN.ENFERMEDADES_NOMBRE_CLAVE_IDX ON ADMIN.ENFERMEDADES (NOMBRE_CLAVE)",
+        "CREATE INDEX ADMIN.MEDICAMENTOS_NOMBRE_CLAVE_IDX ON ADMIN.MEDICAMENTOS (NOMBRE_CLAVE)",
+    ]),
+    (5, "Estado de cada conversación (triaje, aprendizaje) entre turnos", [
+        """
+        CREATE TABLE ADMIN.ESTADO_CONVERSACION (
+            ID_USUARIO NUMBER NOT NULL,
+            ID_CHAT NUMBER NOT NULL,
+            VERSION NUMBER NOT NULL,
+            DATOS BLOB NOT NULL,
+            FECHA_ACTUALIZACION TIMESTAMP DEFAULT SYSTIMESTAMP,
+            CONSTRAINT ESTADO_CONVERSACION_PK PRIMARY KEY (ID_USUARIO, ID_CHAT)
+        )
+        """,
+    ]),
+    (6, "Tokens de sesión revocados (logout), compartidos entre workers", [
+        """
+        CREATE TABLE ADMIN.SESIONES_REVOCADAS (
+            JTI VARCHAR2(64) PRIMARY KEY,
+            EXPIRA NUMBER(12) NOT NULL,
+            FECHA_REVOCACION TIMESTAMP DEFAULT SYSTIMESTAMP
+        )
+        """,
+        "CREATE INDEX ADMIN.SESIONES_REVOCADAS_EXPIRA_IDX ON ADMIN.SESIONES_REVOCADAS (EXPIRA)",
+    ]),
+]
+
+def _crear_tabla_control(cursor):
+    """Crea, si aún no existe, la tabla que registra las versiones de esquema aplicadas."""
+    cursor.execute(
+        "SELECT 1 FROM ALL_TABLES WHERE OWNER = 'ADMIN' AND TABLE_NAME = 'SCHEMA_MIGRACIONES'"
+    )
+    if cursor.fetchone():
+        return
+    # Otro worker puede crearla entre la consulta y el CREATE: ORA-00955 se ignora
+    _ejecutar_paso(cursor, """
+        CREATE TABLE ADMIN.SCHEMA_MIGRACIONES (
+            VERSION NUMBER PRIMARY KEY,
+            DESCRIPCION VARCHAR2(200),
+            FECHA_APLICACION TIMESTAMP DEFAULT SYSTIMESTAMP
+        )
+    """)
+
+def _ejecutar_paso(cursor, paso: Paso):
+    """Ejecuta un paso de migración ignorando los errores de 'ya existe'."""
+    try:
+        if callable(paso):
+            paso(cursor)
+        else:
+            cursor.execute(paso)
+    except oracledb.DatabaseError as e:
+        error, = e.args
+        if getattr(error, "code", None) not in ERRORES_YA_APLICADO:
+            raise
+
+def aplicar_migraciones() -> bool:
+    """
+    Aplica, una sola vez, las migraciones pendientes. Se llama al iniciar la aplicación
+    para que las rutas de cada petición puedan asumir que el esquema está al día.
+    Los pasos son idempotentes, por lo que varios workers arrancando a la vez no fallan.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("❌ No se pudieron aplicar migraciones: sin conexión a la BD")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        _crear_tabla_control(cursor)
+
+        cursor.execute("SELECT VERSION FROM ADMIN.SCHEMA_MIGRACIONES")
+        aplicadas = {row[0] for row in cursor.fetchall()}
+
+        for version, descripcion, pasos in MIGRACIONES:
+            if version in aplicadas:
+                continue
+
+            for paso in pasos:
+                _ejecutar_paso(cursor, paso)
+
+            try:
+                cursor.execute(
+                    "INSERT INTO ADMIN.SCHEMA_MIGRACIONES (VERSION, DESCRIPCION) VALUES (:1, :2)",
+                    [version, descripcion]
+                )
+                conn.commit()
+                print(f"✅ Migración {version} aplicada: {descripcion}")
+            except oracledb.IntegrityError:
+                # Otro worker la registró primero
+                conn.rollback()
+
+        return True
+    except oracledb.Error as e:
+        print(f"❌ Error al aplicar migraciones: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
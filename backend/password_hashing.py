@@ -0,0 +1,94 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Optional
+
+import bcrypt
+
+from config import BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_PENDIENTES, BCRYPT_TIMEOUT
+
+class HashingSaturado(Exception):
+    """Hay demasiadas operaciones de bcrypt en curso; el cliente debe reintentar más tarde."""
+
+# bcrypt es CPU pura: se ejecuta en procesos aparte para que un pico de logins no
+# acapare los hilos del worker que atienden el resto de peticiones. Como con el pool
+# de la BD, se crea de forma perezosa y una vez por proceso (gunicorn hace fork).
+# Los procesos del pool salen de un forkserver y no de fork(): cuando se crea el pool el
+# worker ya tiene hilos (recarga de la base, diario, descubrimiento de Gemini...) y un
+# hijo nacido con fork() podría heredar un lock tomado y quedarse bloqueado.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(max(BCRYPT_MAX_PENDIENTES, 1))
+_METODO_INICIO = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+def _hashear(password: bytes, rondas: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rondas))
+
+def _verificar(password: bytes, hash_guardado: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hash_guardado)
+    except ValueError:
+        # Hash guardado con formato inválido
+        return False
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=BCRYPT_WORKERS,
+                mp_context=multiprocessing.get_context(_METODO_INICIO)
+            )
+            _pool_pid = os.getpid()
+            print(f"✅ Pool de bcrypt creado: {BCRYPT_WORKERS} procesos, {BCRYPT_ROUNDS} rondas")
+    return _pool
+
+def _ejecutar(funcion, *args):
+    """
+    Ejecuta 'funcion' en el pool, o en línea si BCRYPT_WORKERS es 0.
+    Si ya hay BCRYPT_MAX_PENDIENTES operaciones en curso, falla de inmediato con
+    HashingSaturado en lugar de encolar sin límite. En el pool el cupo se libera cuando
+    la tarea termina (o se cancela), no cuando se deja de esperarla: una tarea que superó
+    BCRYPT_TIMEOUT sigue ocupando un proceso y cuenta como pendiente hasta acabar.
+    """
+    if not _cupos.acquire(blocking=False):
+        raise HashingSaturado("Demasiadas verificaciones de contraseña en curso")
+    if BCRYPT_WORKERS <= 0:
+        try:
+            return funcion(*args)
+        finally:
+            _cupos.release()
+
+    try:
+        futuro = _get_pool().submit(funcion, *args)
+    except BaseException:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(lambda _: _cupos.release())
+    try:
+        return futuro.result(timeout=BCRYPT_TIMEOUT)
+    except FuturesTimeout:
+        # Si aún no empezó, se saca de la cola; si ya corre, su cupo se libera al terminar
+        futuro.cancel()
+        raise HashingSaturado("La verificación de contraseña tardó demasiado")
+
+def hashear_password(password: str) -> bytes:
+    """Devuelve el hash bcrypt de la contraseña con BCRYPT_ROUNDS rondas."""
+    return _ejecutar(_hashear, password.encode('utf-8'), BCRYPT_ROUNDS)
+
+def verificar_password(password: str, hash_guardado: str) -> bool:
+    """Compara la contraseña con el hash guardado en ADMIN.USUARIOS."""
+    if not hash_guardado:
+        return False
+    return _ejecutar(_verificar, password.encode('utf-8'), str(hash_guardado).encode('utf-8'))
+
+def cerrar_pool_hashing():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,136 @@
+from itertools import chain
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+class MatrizReglas:
+    """
+    Matriz dispersa síntoma × enfermedad con los pesos de REGLAS_INFERENCIA, en formato CSR
+    (indptr / indices / pesos). Puntuar un conjunto de síntomas equivale a multiplicar su
+    vector indicador por la matriz; aquí se hace sumando las filas seleccionadas con un
+    único np.bincount, tanto para un conjunto como para un lote de conjuntos.
+    """
+
+    __slots__ = (
+        "ids_enfermedad", "fila_por_sintoma", "indptr", "indices", "pesos",
+        "pesos_especificos", "peso_total", "_columna"
+    )
+
+    def __init__(self, reglas_por_sintoma: Mapping[int, Tuple[Tuple[int, float], ...]]):
+        ids_enfermedad = sorted({id_enf for reglas in reglas_por_sintoma.values() for id_enf, _ in reglas})
+        columna = {id_enf: i for i, id_enf in enumerate(ids_enfermedad)}
+        ids_sintoma = sorted(reglas_por_sintoma)
+
+        indptr = np.zeros(len(ids_sintoma) + 1, dtype=np.int64)
+        indices, pesos = [], []
+        for fila, id_sintoma in enumerate(ids_sintoma):
+            for id_enf, peso in reglas_por_sintoma[id_sintoma]:
+                indices.append(columna[id_enf])
+                pesos.append(peso)
+            indptr[fila + 1] = len(indices)
+
+        self.ids_enfermedad = np.asarray(ids_enfermedad, dtype=np.int64)
+        self.fila_por_sintoma: Dict[int, int] = {id_s: fila for fila, id_s in enumerate(ids_sintoma)}
+        self.indptr = indptr
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.pesos = np.asarray(pesos, dtype=np.float64)
+
+        # Precalculados para el ranking:
+        # - peso_total: suma de pesos de cada enfermedad (denominador de la cobertura)
+        # - pesos_especificos: cada peso multiplicado por la especificidad (IDF) de su síntoma,
+        #   para que un síntoma que apunta a pocas enfermedades cuente más que uno genérico
+        n = len(ids_enfermedad)
+        self.peso_total = np.bincount(self.indices, weights=self.pesos, minlength=n)
+        reglas_por_fila = np.diff(indptr)
+        especificidad = np.log((1.0 + n) / (1.0 + reglas_por_fila)) + 1.0
+        self.pesos_especificos = self.pesos * np.repeat(especificidad, reglas_por_fila)
+        self._columna = columna
+
+    @property
+    def num_enfermedades(self) -> int:
+        return len(self.ids_enfermedad)
+
+    def _filas(self, ids_sintoma: Iterable[int]) -> list:
+        # dict.fromkeys: sin duplicados y conservando el orden
+        return [self.fila_por_sintoma[s] for s in dict.fromkeys(ids_sintoma) if s in self.fila_por_sintoma]
+
+    def _acumular(self, conjuntos: Sequence[Iterable[int]], valores: np.ndarray) -> np.ndarray:
+        """Suma, por conjunto y enfermedad, 'valores' (alineado con self.indices) de las filas elegidas."""
+        return self._acumular_varios(conjuntos, (valores,))[0]
+
+    def _acumular_varios(self, conjuntos: Sequence[Iterable[int]], lista_valores: Sequence[np.ndarray]) -> list:
+        """Como _acumular, pero calcula las posiciones una sola vez para varios arreglos de valores."""
+        m, n = len(conjuntos), self.num_enfermedades
+        filas_por_conjunto = [self._filas(c) for c in conjuntos]
+        largos_conjunto = np.fromiter((len(f) for f in filas_por_conjunto), dtype=np.int64, count=m)
+        filas = np.fromiter(chain.from_iterable(filas_por_conjunto), dtype=np.int64, count=int(largos_conjunto.sum()))
+        if m == 0 or n == 0 or filas.size == 0:
+            return [np.zeros((m, n), dtype=np.float64) for _ in lista_valores]
+
+        inicio = self.indptr[filas]
+        largo = self.indptr[filas + 1] - inicio
+        total = int(largo.sum())
+
+        # Posición en indices/pesos de cada elemento no nulo de las filas elegidas
+        desplazamiento = np.arange(total) - np.repeat(np.cumsum(largo) - largo, largo)
+        posiciones = np.repeat(inicio, largo) + desplazamiento
+        conjunto = np.repeat(np.repeat(np.arange(m), largos_conjunto), largo)
+
+        claves = conjunto * n + self.indices[posiciones]
+        return [np.bincount(claves, weights=valores[posiciones], minlength=m * n).reshape(m, n)
+                for valores in lista_valores]
+
+    def puntuar_lote(self, conjuntos: Sequence[Iterable[int]]) -> np.ndarray:
+        """Matriz (len(conjuntos) × num_enfermedades) con la suma de pesos de cada conjunto de ID_SINTOMA."""
+        return self._acumular(conjuntos, self.pesos)
+
+    def contar_coincidencias_lote(self, conjuntos: Sequence[Iterable[int]]) -> np.ndarray:
+        """Como puntuar_lote, pero cuenta cuántas reglas de cada enfermedad se activaron."""
+        return self._acumular(conjuntos, np.ones_like(self.pesos))
+
+    def puntuar(self, ids_sintoma: Iterable[int]) -> Dict[int, float]:
+        """Puntajes {ID_ENFERMEDAD: suma de pesos} de las enfermedades con al menos una regla activada."""
+        puntajes, coincidencias = self._acumular_varios([list(ids_sintoma)], (self.pesos, np.ones_like(self.pesos)))
+        activadas = np.flatnonzero(coincidencias[0])
+        return {int(self.ids_enfermedad[i]): float(puntajes[0][i]) for i in activadas}
+
+    def rankear(self, ids_sintoma: Iterable[int], k: int = 5, excluir: Iterable[int] = ()) -> List[Dict]:
+        """
+        Diagnóstico diferencial: las k enfermedades mejor puntuadas para un conjunto de síntomas.
+
+        puntaje    = suma de pesos ponderados por especificidad × cobertura
+        cobertura  = fracción del peso total de la enfermedad explicada por los síntomas
+        confianza  = puntaje normalizado sobre todas las enfermedades con alguna regla activada
+        Usa una selección parcial (argpartition) en lugar de ordenar todas las enfermedades.
+        """
+        especifico, crudo, coincidencias = (
+            a[0] for a in self._acumular_varios(
+                [list(ids_sintoma)], (self.pesos_especificos, self.pesos, np.ones_like(self.pesos))
+            )
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cobertura = np.where(self.peso_total > 0, crudo / self.peso_total, 0.0)
+        puntaje = especifico * cobertura
+        puntaje[coincidencias == 0] = -np.inf
+        for id_enf in excluir:
+            col = self._columna.get(id_enf)
+            if col is not None:
+                puntaje[col] = -np.inf
+
+        candidatos = np.flatnonzero(np.isfinite(puntaje))
+        if candidatos.size == 0 or k <= 0:
+            return []
+        total = float(np.clip(puntaje[candidatos], 0.0, None).sum())
+
+        k = min(k, candidatos.size)
+        top = candidatos[np.argpartition(-puntaje[candidatos], k - 1)[:k]]
+        top = top[np.argsort(-puntaje[top], kind="stable")]
+
+        return [{
+            "id_enfermedad": int(self.ids_enfermedad[i]),
+            "puntaje": float(puntaje[i]),
+            "confianza": float(max(puntaje[i], 0.0) / total) if total > 0 else 0.0,
+            "cobertura": float(cobertura[i]),
+            "peso": float(crudo[i]),
+            "reglas_activadas": int(coincidencias[i])
+        } for i in top]
@@ -0,0 +1,98 @@
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+from text_utils import normalizar
+
+# Frases locales que siempre se reconocen, además de los sinónimos de la BD
+PATRONES_SINTOMAS_LOCALES: Dict[str, List[str]] = {
+    "dolor de cabeza": ["dolor de cabeza", "me duele la cabeza"],
+    "fiebre": ["fiebre", "temperatura alta", "mucha fiebre"],
+    "gripe": ["gripe", "síntomas de la gripe"],
+    "tos": ["tos", "estoy tosiendo"],
+    "dolor de garganta": ["me duele la garganta", "garganta inflamada"],
+    "congestión nasal": ["nariz tapada", "congestión nasal"],
+    "dolor abdominal": ["dolor abdominal", "me duele el estómago", "dolor de barriga"],
+    "náuseas": ["náuseas", "ganas de vomitar"],
+    "mareos": ["mareos", "me siento mareado"],
+    "fatiga": ["cansancio", "fatiga", "cansancio extremo"],
+    "escalofríos": ["escalofríos", "siento escalofríos"],
+    "dolor lumbar": ["dolor en la espalda baja", "dolor lumbar"],
+    "picor en los ojos": ["me pican los ojos", "picazón en los ojos"]
+}
+
+class AutomataSintomas:
+    """
+    Autómata de Aho-Corasick sobre frases normalizadas (sin acentos, minúsculas).
+    Encuentra todas las menciones de síntomas en una sola pasada lineal sobre el texto,
+    sin importar cuántos sinónimos haya, y solo acepta coincidencias de palabra completa.
+    """
+
+    __slots__ = ("_transiciones", "_fallo", "_salidas", "num_patrones")
+
+    def __init__(self, patrones: Iterable[Tuple[str, str]]):
+        """'patrones' son pares (frase, síntoma canónico); la frase se normaliza aquí."""
+        self._transiciones: List[Dict[str, int]] = [{}]
+        self._salidas: List[List[Tuple[int, str]]] = [[]]
+        self.num_patrones = 0
+
+        for frase, sintoma in patrones:
+            frase = normalizar(frase)
+            if not frase:
+                continue
+            nodo = 0
+            for ch in frase:
+                siguiente = self._transiciones[nodo].get(ch)
+                if siguiente is None:
+                    siguiente = len(self._transiciones)
+                    self._transiciones[nodo][ch] = siguiente
+                    self._transiciones.append({})
+                    self._salidas.append([])
+                nodo = siguiente
+            self._salidas[nodo].append((len(frase), sintoma))
+            self.num_patrones += 1
+
+        self._fallo = [0] * len(self._transiciones)
+        self._construir_enlaces_fallo()
+
+    def _construir_enlaces_fallo(self):
+        cola = deque(self._transiciones[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for ch, hijo in self._transiciones[nodo].items():
+                cola.append(hijo)
+                f = self._fallo[nodo]
+                while f and ch not in self._transiciones[f]:
+                    f = self._fallo[f]
+                destino = self._transiciones[f].get(ch, 0)
+                self._fallo[hijo] = destino if destino != hijo else 0
+                # Heredar las salidas del sufijo más largo que también es patrón
+                self._salidas[hijo] = self._salidas[hijo] + self._salidas[self._fallo[hijo]]
+
+    def buscar(self, texto_norm: str) -> List[str]:
+        """
+        Devuelve los síntomas mencionados en 'texto_norm' (ya normalizado), sin repetir,
+        en el orden en que aparecen en el texto.
+        """
+        encontrados: Dict[str, int] = {}
+        n = len(texto_norm)
+        nodo = 0
+        for i, ch in enumerate(texto_norm):
+            while nodo and ch not in self._transiciones[nodo]:
+                nodo = self._fallo[nodo]
+            nodo = self._transiciones[nodo].get(ch, 0)
+            if not self._salidas[nodo]:
+                continue
+            fin_palabra = i + 1 == n or not texto_norm[i + 1].isalnum()
+            if not fin_palabra:
+                continue
+            for largo, sintoma in self._salidas[nodo]:
+                inicio = i - largo + 1
+                if (inicio == 0 or not texto_norm[inicio - 1].isalnum()) and sintoma not in encontrados:
+                    encontrados[sintoma] = inicio
+        return sorted(encontrados, key=encontrados.get)
+
+def construir_automata(sinonimos: Iterable[Tuple[str, str]]) -> AutomataSintomas:
+    """Compila las frases locales más los sinónimos (sinónimo, síntoma) de la BD en un autómata."""
+    patrones = [(frase, sintoma) for sintoma, frases in PATRONES_SINTOMAS_LOCALES.items() for frase in frases]
+    patrones.extend(sinonimos)
+    return AutomataSintomas(patrones)
@@ -0,0 +1,195 @@
+import sys
+import json
+import types
+
+import pytest
+from flask import Flask, g, jsonify
+
+try:
+    import database  # noqa: F401
+except ImportError:
+    # Sin oracledb no se puede importar database; auth_tokens solo usa estas dos funciones
+    # y cada prueba las sustituye por _BDFalsa
+    _stub = types.ModuleType("database")
+    _stub.revocar_sesion = lambda jti, expira: False
+    _stub.listar_sesiones_revocadas = lambda: None
+    sys.modules["database"] = _stub
+
+import auth_tokens
+from auth_tokens import (
+    emitir_token, verificar_token, revocar_token, requiere_sesion, iniciar_secreto_sesion, _b64, _firmar
+)
+
+class _BDFalsa:
+    """ADMIN.SESIONES_REVOCADAS en memoria, compartida por los 'workers' de la prueba."""
+
+    def __init__(self):
+        self.revocados = {}
+        self.caida = False
+        self.lecturas = 0
+
+    def revocar_sesion(self, jti, expira):
+        if self.caida:
+            return False
+        self.revocados[jti] = expira
+        return True
+
+    def listar_sesiones_revocadas(self):
+        self.lecturas += 1
+        return None if self.caida else dict(self.revocados)
+
+class _Reloj:
+    """Sustituye al módulo time dentro de auth_tokens para controlar el paso del tiempo."""
+
+    def __init__(self):
+        self.epoch = 1_700_000_000.0
+        self.mono = 1000.0
+
+    def time(self):
+        return self.epoch
+
+    def monotonic(self):
+        return self.mono
+
+    def avanzar(self, segundos):
+        self.epoch += segundos
+        self.mono += segundos
+
+@pytest.fixture
+def bd(monkeypatch):
+    bd = _BDFalsa()
+    monkeypatch.setattr(auth_tokens, "revocar_sesion", bd.revocar_sesion)
+    monkeypatch.setattr(auth_tokens, "listar_sesiones_revocadas", bd.listar_sesiones_revocadas)
+    monkeypatch.setattr(auth_tokens, "_secreto", b"s" * 32)
+    monkeypatch.setattr(auth_tokens, "_revocados", {})
+    monkeypatch.setattr(auth_tokens, "_ultima_sincronizacion", float("-inf"))
+    monkeypatch.setattr(auth_tokens, "SESSION_REVOCACION_SYNC", 15.0)
+    monkeypatch.setattr(auth_tokens, "SESSION_TTL_SEGUNDOS", 3600)
+    return bd
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = _Reloj()
+    monkeypatch.setattr(auth_tokens, "time", reloj)
+    return reloj
+
+def _token_con_payload(datos) -> str:
+    payload = _b64(json.dumps(datos).encode("utf-8"))
+    return f"{payload}.{_firmar(payload)}"
+
+def test_token_valido(bd):
+    token, exp = emitir_token(42)
+    datos = verificar_token(token)
+    assert datos["uid"] == 42
+    assert datos["exp"] == exp
+    assert datos["jti"]
+
+def test_firma_alterada(bd, monkeypatch):
+    token, _ = emitir_token(42)
+    payload, firma = token.split(".")
+    assert verificar_token(f"{payload}.{firma[:-1]}{'A' if firma[-1] != 'A' else 'B'}") is None
+
+    # Mismo payload firmado con otro secreto
+    monkeypatch.setattr(auth_tokens, "_secreto", b"otro" * 8)
+    falso, _ = emitir_token(42)
+    monkeypatch.setattr(auth_tokens, "_secreto", b"s" * 32)
+    assert verificar_token(falso) is None
+
+def test_payload_alterado_con_firma_antigua(bd):
+    token, exp = emitir_token(42)
+    _, firma = token.split(".")
+    payload = _b64(json.dumps({"uid": 1, "exp": exp, "jti": "x"}).encode("utf-8"))
+    assert verificar_token(f"{payload}.{firma}") is None
+
+@pytest.mark.parametrize("token", [None, "", "sinpunto", "a.b.c", "ñ.ñ", "abc.fírma", "é" * 10 + ".x"])
+def test_formato_invalido(bd, token):
+    assert verificar_token(token) is None
+
+def test_payload_firmado_pero_invalido(bd):
+    payload = "!!!"
+    assert verificar_token(f"{payload}.{_firmar(payload)}") is None
+    assert verificar_token(_token_con_payload([1, 2])) is None
+    assert verificar_token(_token_con_payload({"uid": "42", "exp": 2 ** 40, "jti": "x"})) is None
+    assert verificar_token(_token_con_payload({"uid": 42, "jti": "x"})) is None
+
+def test_token_expirado(bd, reloj):
+    token, exp = emitir_token(42)
+    reloj.avanzar(3599)
+    assert verificar_token(token) is not None
+    reloj.avanzar(1)
+    assert verificar_token(token) is None
+
+def test_secreto_obligatorio(bd, monkeypatch):
+    monkeypatch.setattr(auth_tokens, "_secreto", None)
+    with pytest.raises(RuntimeError):
+        emitir_token(42)
+    with pytest.raises(RuntimeError):
+        iniciar_secreto_sesion(permitir_aleatorio=False)
+    iniciar_secreto_sesion(permitir_aleatorio=True)
+    token, _ = emitir_token(42)
+    assert verificar_token(token)["uid"] == 42
+
+def test_revocar_token(bd):
+    token, _ = emitir_token(42)
+    datos = verificar_token(token)
+    assert revocar_token(datos) is True
+    assert datos["jti"] in bd.revocados
+    assert verificar_token(token) is None
+
+def test_revocacion_local_si_la_bd_falla(bd, reloj):
+    token, _ = emitir_token(42)
+    bd.caida = True
+    assert revocar_token(verificar_token(token)) is False
+    assert verificar_token(token) is None
+    # La BD vuelve sin conocer la revocación: la copia local no se pierde al sincronizar
+    bd.caida = False
+    reloj.avanzar(16)
+    assert verificar_token(token) is None
+    assert bd.lecturas >= 2
+
+def test_revocacion_de_otro_worker(bd, reloj):
+    token, _ = emitir_token(42)
+    assert verificar_token(token) is not None
+    lecturas = bd.lecturas
+
+    # Otro worker hace logout: se ve aquí tras el intervalo de sincronización, no antes
+    bd.revocados[verificar_token(token)["jti"]] = int(reloj.time()) + 3600
+    assert bd.lecturas == lecturas
+    assert verificar_token(token) is not None
+    reloj.avanzar(15)
+    assert verificar_token(token) is None
+
+def test_sincronizar_descarta_revocaciones_expiradas(bd, reloj):
+    viejo, _ = emitir_token(1)
+    revocar_token(verificar_token(viejo))
+    bd.revocados.clear()
+    reloj.avanzar(3600)
+    nuevo, _ = emitir_token(2)
+    verificar_token(nuevo)
+    assert auth_tokens._revocados == {}
+
+def _app():
+    app = Flask(__name__)
+
+    @app.route("/privado")
+    @requiere_sesion
+    def privado():
+        return jsonify({"uid": g.user_id})
+
+    return app
+
+def test_requiere_sesion(bd):
+    cliente = _app().test_client()
+    assert cliente.get("/privado").status_code == 401
+    assert cliente.get("/privado", headers={"Authorization": "Bearer basura"}).status_code == 401
+    assert cliente.get("/privado", headers={"Authorization": "Basic abc"}).status_code == 401
+
+    token, _ = emitir_token(42)
+    respuesta = cliente.get("/privado", headers={"Authorization": f"Bearer {token}"})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json() == {"uid": 42}
+
+    revocar_token(verificar_token(token))
+    respuesta = cliente.get("/privado", headers={"Authorization": f"Bearer {token}"})
+    assert respuesta.status_code == 401
+    assert "error" in respuesta.get_json()
@@ -0,0 +1,87 @@
+import time
+import threading
+
+from cache import CacheTTL
+
+def _esperar_esperas(cache, n, limite=5.0):
+    """Espera a que n hilos estén bloqueados esperando el cálculo de otro."""
+    fin = time.monotonic() + limite
+    while cache.estadisticas()["esperas"] < n and time.monotonic() < fin:
+        time.sleep(0.01)
+
+def test_obtener_o_calcular_guarda_el_valor():
+    cache = CacheTTL(max_entradas=10, ttl=60)
+    llamadas = []
+    assert cache.obtener_o_calcular("a", lambda: llamadas.append(1) or "valor") == "valor"
+    assert cache.obtener_o_calcular("a", lambda: llamadas.append(1) or "otro") == "valor"
+    assert len(llamadas) == 1
+
+def test_guardar_si_descarta_valores():
+    cache = CacheTTL(max_entradas=10, ttl=60)
+    assert cache.obtener_o_calcular("a", lambda: None, guardar_si=lambda v: v is not None) is None
+    assert cache.obtener("a") == (False, None)
+    assert cache.obtener_o_calcular("a", lambda: "ok", guardar_si=lambda v: v is not None) == "ok"
+    assert cache.obtener("a") == (True, "ok")
+
+def test_un_solo_calculo_para_peticiones_simultaneas():
+    cache = CacheTTL(max_entradas=10, ttl=60)
+    hilos_n = 8
+    entrar = threading.Barrier(hilos_n)
+    calculando = threading.Event()
+    liberar = threading.Event()
+    llamadas = []
+    resultados = []
+
+    def calcular():
+        llamadas.append(1)
+        calculando.set()
+        liberar.wait(5)
+        return "valor"
+
+    def pedir():
+        entrar.wait()
+        resultados.append(cache.obtener_o_calcular("a", calcular, espera=5))
+
+    hilos = [threading.Thread(target=pedir) for _ in range(hilos_n)]
+    for h in hilos:
+        h.start()
+    assert calculando.wait(5)
+    _esperar_esperas(cache, hilos_n - 1)
+    liberar.set()
+    for h in hilos:
+        h.join(5)
+
+    assert len(llamadas) == 1
+    assert resultados == ["valor"] * hilos_n
+    assert cache.estadisticas()["esperas"] == hilos_n - 1
+
+def test_si_el_calculo_falla_los_demas_calculan():
+    cache = CacheTTL(max_entradas=10, ttl=60)
+    calculando = threading.Event()
+    liberar = threading.Event()
+    errores = []
+
+    def fallar():
+        calculando.set()
+        liberar.wait(5)
+        raise RuntimeError("caído")
+
+    def primero():
+        try:
+            cache.obtener_o_calcular("a", fallar)
+        except RuntimeError as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=primero)
+    hilo.start()
+    assert calculando.wait(5)
+    resultado = []
+    segundo = threading.Thread(target=lambda: resultado.append(cache.obtener_o_calcular("a", lambda: "respaldo", espera=5)))
+    segundo.start()
+    _esperar_esperas(cache, 1)
+    liberar.set()
+    hilo.join(5)
+    segundo.join(5)
+
+    assert len(errores) == 1
+    assert resultado == ["respaldo"]
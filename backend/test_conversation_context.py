@@ -0,0 +1,49 @@
+import pytest
+
+from conversation_context import ContextoConversacion, EstadoConversacion
+
+def _campos(ctx):
+    t = ctx.triage
+    return (ctx.estado, ctx.paso_triage, ctx.temperatura, ctx.enfermedad, ctx.enfermedad_propuesta,
+            ctx.sintoma_reportado, t.respondidas, t.afirmativas, t.temperatura, t.intensidad, t.duracion)
+
+def test_ida_y_vuelta_vacio():
+    ctx = ContextoConversacion()
+    assert _campos(ContextoConversacion.desde_bytes(ctx.a_bytes())) == _campos(ctx)
+
+def test_ida_y_vuelta_completo():
+    ctx = ContextoConversacion()
+    ctx.iniciar_triage()
+    ctx.paso_triage = 3
+    ctx.temperatura = 38.5
+    ctx.enfermedad = "Gripe"
+    ctx.enfermedad_propuesta = "Migraña"
+    ctx.sintoma_reportado = "dolor de cabeza"
+    ctx.triage.marcar("fiebre", True)
+    ctx.triage.marcar("tos", False)
+    ctx.triage.temperatura = 39.0
+    ctx.triage.intensidad = 0
+    ctx.triage.duracion = "dos días"
+
+    copia = ContextoConversacion.desde_bytes(ctx.a_bytes())
+    assert _campos(copia) == _campos(ctx)
+    assert copia.estado is EstadoConversacion.TRIAGE
+    assert copia.triage.marcas_afirmativas() == ["fiebre"]
+    assert copia.triage.tiene("fiebre") and not copia.triage.tiene("tos")
+
+def test_temperatura_cero_no_es_ausente():
+    ctx = ContextoConversacion()
+    ctx.temperatura = 0.0
+    assert ContextoConversacion.desde_bytes(ctx.a_bytes()).temperatura == 0.0
+
+def test_texto_largo_se_recorta_sin_partir_caracteres():
+    ctx = ContextoConversacion()
+    ctx.enfermedad = "á" * 40000
+    copia = ContextoConversacion.desde_bytes(ctx.a_bytes())
+    assert len(copia.enfermedad.encode("utf-8")) < 0xFFFF
+    assert set(copia.enfermedad) == {"á"}
+
+@pytest.mark.parametrize("datos", [b"", b"\x02\x00", b"\x01" + bytes(40), ContextoConversacion().a_bytes()[:-1]])
+def test_datos_invalidos_lanzan_value_error(datos):
+    with pytest.raises(ValueError):
+        ContextoConversacion.desde_bytes(datos)
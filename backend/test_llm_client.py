@@ -0,0 +1,119 @@
+import time
+import threading
+
+import pytest
+
+import llm_client
+from llm_client import CircuitoAbierto, ClienteLLM, Disyuntor, PlazoAgotado
+
+class _Reloj:
+    """Sustituye al módulo time dentro de llm_client para controlar el paso del tiempo."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+    def sleep(self, segundos):
+        self.ahora += segundos
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = _Reloj()
+    monkeypatch.setattr(llm_client, "time", reloj)
+    return reloj
+
+def test_disyuntor_abierto_semiabierto_cerrado(reloj):
+    d = Disyuntor(ventana=60, min_llamadas=4, umbral_error=0.5, enfriamiento=30)
+    for exito in (True, False, True):
+        assert d.permitir()
+        d.registrar(exito)
+    assert d.estadisticas()["estado"] == Disyuntor.CERRADO
+
+    # 2 fallos de 4 alcanzan el umbral
+    assert d.permitir()
+    d.registrar(False)
+    assert d.estadisticas()["estado"] == Disyuntor.ABIERTO
+    assert d.esta_abierto()
+    assert not d.permitir()
+
+    reloj.ahora += 30
+    assert not d.esta_abierto()
+    assert d.permitir()                       # la llamada de prueba
+    assert d.estadisticas()["estado"] == Disyuntor.SEMIABIERTO
+    assert not d.permitir()                   # solo una a la vez
+    d.registrar(True)
+    assert d.estadisticas()["estado"] == Disyuntor.CERRADO
+    assert d.permitir()
+
+    stats = d.estadisticas()
+    assert stats["aperturas"] == 1
+    assert stats["rechazadas"] == 2
+
+def test_disyuntor_sonda_fallida_reabre(reloj):
+    d = Disyuntor(ventana=60, min_llamadas=1, umbral_error=0.5, enfriamiento=10)
+    assert d.permitir()
+    d.registrar(False)
+    reloj.ahora += 10
+    assert d.permitir()
+    d.registrar(False)
+    assert d.estadisticas()["estado"] == Disyuntor.ABIERTO
+    assert d.estadisticas()["aperturas"] == 2
+    assert not d.permitir()
+
+def test_disyuntor_olvida_fallos_fuera_de_la_ventana(reloj):
+    d = Disyuntor(ventana=60, min_llamadas=2, umbral_error=0.5, enfriamiento=30)
+    assert d.permitir()
+    d.registrar(False)
+    reloj.ahora += 61
+    assert d.permitir()
+    d.registrar(True)
+    assert d.estadisticas()["estado"] == Disyuntor.CERRADO
+    assert d.estadisticas()["fallos_ventana"] == 0
+
+def _cliente(plazo=2.0, reintentos=2, disyuntor=None, hedge_percentil=0.0):
+    return ClienteLLM(
+        "prueba", plazo=plazo, reintentos=reintentos, backoff_base=0.01, backoff_max=0.02,
+        hedge_percentil=hedge_percentil, hedge_min_muestras=1, hilos=4,
+        disyuntor=disyuntor or Disyuntor(ventana=60, min_llamadas=100, umbral_error=1.0, enfriamiento=30)
+    )
+
+def test_cliente_reintenta_errores():
+    intentos = []
+
+    def funcion(timeout):
+        intentos.append(timeout)
+        if len(intentos) < 3:
+            raise ConnectionError("caído")
+        return "ok"
+
+    cliente = _cliente()
+    assert cliente.llamar(funcion) == "ok"
+    assert len(intentos) == 3
+    assert all(0 < t <= 2.0 for t in intentos)
+    assert cliente.estadisticas()["reintentos"] == 2
+
+def test_cliente_plazo_agotado():
+    liberar = threading.Event()
+    cliente = _cliente(plazo=0.1)
+    inicio = time.monotonic()
+    with pytest.raises(PlazoAgotado):
+        cliente.llamar(lambda timeout: liberar.wait(5))
+    assert time.monotonic() - inicio < 1.0
+    liberar.set()
+    assert cliente.estadisticas()["plazos_agotados"] == 1
+
+def test_cliente_no_llama_con_circuito_abierto():
+    disyuntor = Disyuntor(ventana=60, min_llamadas=1, umbral_error=0.5, enfriamiento=30)
+    cliente = _cliente(reintentos=0, disyuntor=disyuntor)
+
+    def falla(timeout):
+        raise ValueError("mal")
+
+    with pytest.raises(ValueError):
+        cliente.llamar_en_linea(falla)
+    llamadas = []
+    with pytest.raises(CircuitoAbierto):
+        cliente.llamar(lambda timeout: llamadas.append(timeout))
+    assert llamadas == []
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+from message_journal import DiarioMensajes, unir_pendientes, _proceso_vivo
+
+class _EscritorFalso:
+    """Escritor de lotes que guarda las filas en memoria; se puede bloquear o hacer fallar."""
+
+    def __init__(self):
+        self.filas = []
+        self.lotes = 0
+        self.falla = False
+        self.abierto = threading.Event()
+        self.abierto.set()
+
+    def __call__(self, filas):
+        self.abierto.wait(5)
+        if self.falla:
+            return False
+        self.filas.extend(filas)
+        self.lotes += 1
+        return True
+
+def _esperar(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            raise AssertionError("la condición no se cumplió a tiempo")
+        time.sleep(0.01)
+
+def _pid_muerto() -> int:
+    pid = 4_000_000
+    while _proceso_vivo(pid):
+        pid += 1
+    return pid
+
+def _escribir_diario(ruta, registros):
+    ruta.write_text("".join(json.dumps(r) + "\n" for r in registros), encoding="utf-8")
+
+@pytest.fixture
+def escritor():
+    return _EscritorFalso()
+
+@pytest.fixture
+def crear_diario(tmp_path, escritor):
+    diarios = []
+
+    def crear(**opciones):
+        opciones.setdefault("intervalo", 0.02)
+        opciones.setdefault("fsync", False)
+        diario = DiarioMensajes(str(tmp_path), escritor, **opciones)
+        diarios.append(diario)
+        return diario
+
+    yield crear
+    escritor.abierto.set()
+    escritor.falla = False
+    for diario in diarios:
+        diario.detener()
+
+def test_escribe_por_lotes_y_trunca_el_diario(crear_diario, escritor):
+    diario = crear_diario(tam_lote=10)
+    for i in range(5):
+        assert diario.encolar(7, "usuario", f"m{i}")
+    _esperar(lambda: len(escritor.filas) == 5)
+    assert escritor.filas == [(7, "usuario", f"m{i}") for i in range(5)]
+    # Todo confirmado: el diario vuelve a estar vacío
+    _esperar(lambda: diario._ruta.stat().st_size == 0)
+
+def test_anota_antes_de_escribir_y_ack_despues(crear_diario, escritor):
+    escritor.abierto.clear()
+    diario = crear_diario(tam_lote=1)
+    diario.encolar(7, "usuario", "hola")
+    diario.encolar(7, "agente", "adiós")
+    registros = [json.loads(l) for l in diario._ruta.read_text(encoding="utf-8").splitlines()]
+    assert [r["contenido"] for r in registros] == ["hola", "adiós"]
+    assert not any("ack" in r for r in registros)
+
+    # Con ambos lotes confirmados el diario vuelve a empezar de cero
+    escritor.abierto.set()
+    _esperar(lambda: len(escritor.filas) == 2)
+    _esperar(lambda: diario._ruta.stat().st_size == 0)
+
+def test_leer_consistente_agrega_pendientes_tras_la_bd(crear_diario, escritor):
+    escritor.falla = True
+    diario = crear_diario()
+    diario.encolar(7, "usuario", "pendiente 1")
+    diario.encolar(8, "usuario", "otro chat")
+    diario.encolar(7, "agente", "pendiente 2")
+
+    filas, pendientes = diario.leer_consistente(7, lambda: [("usuario", "en bd", 1)])
+    assert filas == [("usuario", "en bd", 1)]
+    assert pendientes == [("usuario", "pendiente 1"), ("agente", "pendiente 2")]
+    assert diario.leer_consistente(9, lambda: ["sin pendientes"]) == (["sin pendientes"], [])
+
+    # Al recuperarse la BD los pendientes se escriben y dejan de agregarse
+    escritor.falla = False
+    _esperar(lambda: len(escritor.filas) == 3)
+    assert diario.leer_consistente(7, lambda: []) == ([], [])
+
+def test_cola_llena(crear_diario, escritor):
+    escritor.abierto.clear()
+    diario = crear_diario(tam_lote=1, max_cola=1)
+    assert diario.encolar(7, "usuario", "uno")
+    _esperar(lambda: diario._cola.empty())   # el hilo tomó el primero y está bloqueado
+    assert diario.encolar(7, "usuario", "dos")
+    assert not diario.encolar(7, "usuario", "tres", espera=0.01)
+    # El rechazado no queda como pendiente: el llamador lo escribe por su cuenta
+    assert [e["contenido"] for e in diario._pendientes[7]] == ["uno", "dos"]
+    escritor.abierto.set()
+    _esperar(lambda: len(escritor.filas) == 2)
+    assert [contenido for _, _, contenido in escritor.filas] == ["uno", "dos"]
+
+def test_recupera_diarios_huerfanos(tmp_path, crear_diario, escritor):
+    muerto = tmp_path / f"mensajes-{_pid_muerto()}.jsonl"
+    _escribir_diario(muerto, [
+        {"seq": 1, "chat": 7, "emisor": "usuario", "contenido": "confirmado"},
+        {"ack": 1},
+        {"seq": 2, "chat": 7, "emisor": "agente", "contenido": "sin ack"},
+    ])
+    with open(muerto, "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "chat": 7, "emi')   # línea cortada por la caída
+
+    vivo = tmp_path / f"mensajes-{os.getppid()}.jsonl"
+    _escribir_diario(vivo, [{"seq": 1, "chat": 9, "emisor": "usuario", "contenido": "de otro worker"}])
+
+    crear_diario()
+    assert escritor.filas == [(7, "agente", "sin ack")]
+    assert not muerto.exists()
+    assert vivo.exists()
+
+def test_recuperacion_fallida_conserva_el_diario(tmp_path, crear_diario, escritor):
+    muerto = tmp_path / f"mensajes-{_pid_muerto()}.jsonl"
+    _escribir_diario(muerto, [{"seq": 1, "chat": 7, "emisor": "usuario", "contenido": "hola"}])
+    escritor.falla = True
+    crear_diario()
+    assert muerto.exists()
+    assert not list(tmp_path.glob("recuperando-*"))
+
+    escritor.falla = False
+    crear_diario()
+    assert escritor.filas == [(7, "usuario", "hola")]
+    assert not muerto.exists()
+
+def test_unir_pendientes():
+    filas = [("usuario", "a", 1), ("agente", "b", 2)]
+    pendientes = [("usuario", "c"), ("agente", "d")]
+    assert unir_pendientes(filas, pendientes) == filas + [("usuario", "c", None), ("agente", "d", None)]
+    assert unir_pendientes(filas, pendientes, 3) == [("agente", "b", 2), ("usuario", "c", None), ("agente", "d", None)]
+    assert unir_pendientes(filas, pendientes, 1) == [("agente", "d", None)]
+    assert unir_pendientes(filas, pendientes, 10) == unir_pendientes(filas, pendientes)
+    assert unir_pendientes(filas, pendientes, 0) == []
+    assert unir_pendientes(filas, []) == filas
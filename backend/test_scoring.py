@@ -0,0 +1,112 @@
+import random
+
+import numpy as np
+
+from scoring import MatrizReglas
+
+# {ID_SINTOMA: ((ID_ENFERMEDAD, peso), ...)}
+REGLAS = {
+    1: ((10, 0.9), (20, 0.4)),
+    2: ((10, 0.5), (30, 0.8)),
+    3: ((30, 0.7),),
+    4: ((20, 0.6), (30, 0.2), (40, 1.0)),
+}
+
+def _reglas_aleatorias(semilla: int, sintomas: int = 60, enfermedades: int = 40):
+    azar = random.Random(semilla)
+    return {
+        s: tuple((e, round(azar.uniform(0.1, 1.0), 2))
+                 for e in azar.sample(range(1, enfermedades + 1), azar.randint(1, 6)))
+        for s in range(1, sintomas + 1)
+    }
+
+def _puntuar_ingenuo(reglas, ids_sintoma):
+    puntajes = {}
+    for s in set(ids_sintoma):
+        for id_enf, peso in reglas.get(s, ()):
+            puntajes[id_enf] = puntajes.get(id_enf, 0.0) + peso
+    return puntajes
+
+def test_puntuar():
+    matriz = MatrizReglas(REGLAS)
+    puntajes = matriz.puntuar([1, 2, 2, 99])
+    assert puntajes.keys() == {10, 20, 30}
+    assert np.isclose(puntajes[10], 1.4)
+    assert np.isclose(puntajes[20], 0.4)
+    assert np.isclose(puntajes[30], 0.8)
+    assert matriz.puntuar([]) == {}
+
+def test_puntuar_coincide_con_suma_ingenua():
+    reglas = _reglas_aleatorias(7)
+    matriz = MatrizReglas(reglas)
+    azar = random.Random(1)
+    for _ in range(50):
+        ids = azar.sample(range(1, 70), azar.randint(0, 8))
+        esperado = _puntuar_ingenuo(reglas, ids)
+        obtenido = matriz.puntuar(ids)
+        assert obtenido.keys() == esperado.keys()
+        for id_enf, valor in esperado.items():
+            assert np.isclose(obtenido[id_enf], valor)
+
+def test_puntuar_lote_coincide_con_puntuar():
+    matriz = MatrizReglas(REGLAS)
+    conjuntos = [[1], [2, 3], [], [4, 1, 4], [99]]
+    lote = matriz.puntuar_lote(conjuntos)
+    assert lote.shape == (len(conjuntos), matriz.num_enfermedades)
+    for fila, ids in zip(lote, conjuntos):
+        esperado = np.zeros(matriz.num_enfermedades)
+        for id_enf, valor in matriz.puntuar(ids).items():
+            esperado[list(matriz.ids_enfermedad).index(id_enf)] = valor
+        assert np.allclose(fila, esperado)
+
+def test_contar_coincidencias_lote():
+    matriz = MatrizReglas(REGLAS)
+    conteo = matriz.contar_coincidencias_lote([[1, 2, 4]])
+    assert conteo[0].tolist() == [2.0, 2.0, 2.0, 1.0]
+
+def _rankear_completo(reglas, ids_sintoma, excluir=()):
+    """Referencia: calcula el puntaje de todas las enfermedades y ordena la lista entera."""
+    enfermedades = sorted({e for rs in reglas.values() for e, _ in rs})
+    n = len(enfermedades)
+    peso_total = {e: 0.0 for e in enfermedades}
+    for rs in reglas.values():
+        for e, peso in rs:
+            peso_total[e] += peso
+    especifico, crudo = {}, {}
+    for s in set(ids_sintoma):
+        rs = reglas.get(s, ())
+        especificidad = np.log((1.0 + n) / (1.0 + len(rs))) + 1.0
+        for e, peso in rs:
+            especifico[e] = especifico.get(e, 0.0) + peso * especificidad
+            crudo[e] = crudo.get(e, 0.0) + peso
+    puntajes = {e: especifico[e] * crudo[e] / peso_total[e] for e in crudo if e not in excluir}
+    return sorted(puntajes.items(), key=lambda par: -par[1])
+
+def test_rankear_top_k_coincide_con_orden_completo():
+    azar = random.Random(3)
+    reglas = {s: tuple((e, azar.uniform(0.1, 1.0)) for e in azar.sample(range(1, 41), azar.randint(1, 6)))
+              for s in range(1, 61)}
+    matriz = MatrizReglas(reglas)
+    for _ in range(50):
+        ids = azar.sample(range(1, 61), azar.randint(1, 10))
+        completo = _rankear_completo(reglas, ids)
+        for k in (1, 3, 5, len(completo), len(completo) + 5):
+            top = matriz.rankear(ids, k=k)
+            assert [r["id_enfermedad"] for r in top] == [e for e, _ in completo[:k]]
+            assert np.allclose([r["puntaje"] for r in top], [p for _, p in completo[:k]])
+
+def test_rankear_excluir_y_confianza():
+    matriz = MatrizReglas(REGLAS)
+    todos = matriz.rankear([1, 2, 4], k=10)
+    assert {r["id_enfermedad"] for r in todos} == {10, 20, 30, 40}
+    assert np.isclose(sum(r["confianza"] for r in todos), 1.0)
+    assert all(0.0 < r["cobertura"] <= 1.0 for r in todos)
+
+    sin_primero = matriz.rankear([1, 2, 4], k=10, excluir=[todos[0]["id_enfermedad"], 999])
+    assert [r["id_enfermedad"] for r in sin_primero] == [r["id_enfermedad"] for r in todos[1:]]
+
+def test_rankear_sin_candidatos():
+    matriz = MatrizReglas(REGLAS)
+    assert matriz.rankear([]) == []
+    assert matriz.rankear([99]) == []
+    assert matriz.rankear([1], k=0) == []
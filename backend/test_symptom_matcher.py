@@ -0,0 +1,24 @@
+from symptom_matcher import AutomataSintomas, construir_automata
+from text_utils import normalizar
+
+def _buscar(automata, texto):
+    return automata.buscar(normalizar(texto))
+
+def test_solo_palabras_completas():
+    automata = AutomataSintomas([("tos", "tos"), ("fiebre", "fiebre")])
+    assert _buscar(automata, "tengo muchos gastos") == []
+    assert _buscar(automata, "tostada con fiebrecita") == []
+    assert _buscar(automata, "tengo tos, y fiebre") == ["tos", "fiebre"]
+
+def test_orden_de_aparicion_y_sin_repetir():
+    automata = AutomataSintomas([("tos", "tos"), ("fiebre", "fiebre"), ("temperatura alta", "fiebre")])
+    assert _buscar(automata, "temperatura alta desde ayer, luego tos y mas fiebre") == ["fiebre", "tos"]
+
+def test_frases_solapadas():
+    # "dolor" es sufijo de la ruta de "dolor de cabeza"; ambas deben reconocerse por separado
+    automata = AutomataSintomas([("dolor", "dolor"), ("dolor de cabeza", "dolor de cabeza")])
+    assert _buscar(automata, "un dolor de cabeza fuerte") == ["dolor", "dolor de cabeza"]
+
+def test_normaliza_acentos_y_mayusculas():
+    automata = construir_automata([("jaqueca", "dolor de cabeza")])
+    assert _buscar(automata, "Tengo NÁUSEAS y jaqueca") == ["náuseas", "dolor de cabeza"]
@@ -0,0 +1,7 @@
+import unicodedata
+
+def normalizar(s: str) -> str:
+    """Normaliza el texto, lo pasa a minúsculas y quita acentos."""
+    s = s.strip().lower()
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")